@@ -0,0 +1,203 @@
+"""Run many headless Space Invaders games across a process pool
+
+Every episode is an independent Game(headless=True) driven by a policy
+instead of the keyboard. --param overrides module constants over a grid,
+and per-episode results are written to a columnar .npz file (one array per
+column) as episodes finish.
+
+Usage:
+    python batch.py --episodes 200                              # default rules, random policy
+    python batch.py --param ENEMY_SHOOT_CHANCE=0.005,0.01,0.02 \\
+                    --param ENEMY_ROWS=4,5,6 --out sweep.npz    # 9 grid points x 100 episodes
+    python batch.py --policy mypolicies:dodge --workers 8       # policy(game, rng) from a module
+"""
+import argparse
+import importlib
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+import space_invaders as si
+
+DEFAULT_EPISODES = 100  # Per grid point
+DEFAULT_MAX_FRAMES = 18000  # Five minutes of play at 60 ticks per second
+DEFAULT_OUT = "batch.npz"
+FLUSH_EVERY = 50  # Finished episodes between rewrites of the output file
+
+# Gameplay constants --param may override: those rules_signature() covers,
+# less the screen size. Games read these when they run, whereas others are
+# baked in at import (SHIELD_Y from SCREEN_HEIGHT) or only size buffers or
+# effects, so overriding them would change nothing or break the game.
+PARAMS = ("PLAYER_SPEED", "PLAYER_WIDTH", "PLAYER_HEIGHT", "BULLET_SPEED", "BULLET_WIDTH", "BULLET_HEIGHT",
+          "ENEMY_SPEED", "ENEMY_WIDTH", "ENEMY_HEIGHT", "ENEMY_ROWS", "ENEMY_COLS", "ENEMY_SPACING", "ENEMY_DROP",
+          "ENEMY_BULLET_SPEED", "ENEMY_SHOOT_CHANCE", "SHIELD_COUNT", "SHIELD_WIDTH", "SHIELD_HEIGHT", "SHIELD_Y",
+          "SHIELD_CRATER_RADIUS")
+
+# Policies take (game, rng) and return the FrameInput for the next tick. rng
+# is seeded per episode, so runs are reproducible however episodes are
+# spread across workers.
+def idle(game, rng):
+    return si.NO_INPUT
+
+def random_policy(game, rng):
+    """Hold a random direction and fire at random"""
+    move = rng.integers(3)
+    return si.FrameInput(left=move == 1, right=move == 2, fire=rng.random() < 0.2)
+
+def sweep_and_fire(game, rng):
+    """Run back and forth across the screen, firing every 8 ticks"""
+    left = (game.frame // 90) % 2 == 0
+    return si.FrameInput(left=left, right=not left, fire=game.frame % 8 == 0)
+
+def track_nearest(game, rng):
+    """Move under the nearest enemy column and fire every 8 ticks"""
+    xs, _, _ = game.enemies.positions()
+    if not len(xs):
+        return si.NO_INPUT
+    player_x = game.player.x + si.PLAYER_WIDTH // 2
+    centres = xs + si.ENEMY_WIDTH // 2
+    target = centres[np.abs(centres - player_x).argmin()]
+    return si.FrameInput(left=target < player_x - si.PLAYER_SPEED, right=target > player_x + si.PLAYER_SPEED,
+                         fire=game.frame % 8 == 0)
+
+POLICIES = {
+    "idle": idle,
+    "random": random_policy,
+    "sweep": sweep_and_fire,
+    "track": track_nearest,
+}
+
+def load_policy(name):
+    """Return a built-in policy by name, or import one given as module:function"""
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"unknown policy {name!r}; use one of {', '.join(POLICIES)} or module:function")
+    return getattr(importlib.import_module(module), attr)
+
+def parse_param(text):
+    """Parse NAME=v1,v2,... into (NAME, values), typed like the constant it overrides"""
+    name, _, values = text.partition("=")
+    if not values:
+        raise ValueError(f"{text!r} is not NAME=v1,v2,...")
+    if name not in PARAMS:
+        raise ValueError(f"{name} cannot be swept; use one of {', '.join(PARAMS)}")
+    convert = int if isinstance(getattr(si, name), int) else float
+    return name, [convert(value) for value in values.split(",")]
+
+class Episode:
+    """One simulation to run: the constants to override, seed, policy and frame limit"""
+    def __init__(self, index, params, seed, policy, max_frames):
+        self.index = index
+        self.params = params
+        self.seed = seed
+        self.policy = policy
+        self.max_frames = max_frames
+
+def run_episode(episode):
+    """Play one episode to game over or max_frames and return its result row"""
+    saved = {name: getattr(si, name) for name in episode.params}
+    for name, value in episode.params.items():
+        setattr(si, name, value)
+    try:
+        start = time.perf_counter()
+        policy = load_policy(episode.policy)
+        # Children 0 and 1 of the episode seed belong to the game itself
+        rng = np.random.default_rng(np.random.SeedSequence(episode.seed).spawn(3)[2])
+        game = si.Game(headless=True, seed=episode.seed)
+        start_lives = game.lives
+        while not game.game_over and game.frame < episode.max_frames:
+            game.step(policy(game, rng))
+        return dict(episode.params, episode=episode.index, seed=episode.seed, score=game.score,
+                    frames=game.frame, lives_lost=start_lives - game.lives, won=game.won,
+                    truncated=not game.game_over, seconds=time.perf_counter() - start)
+    finally:
+        for name, value in saved.items():
+            setattr(si, name, value)
+
+def write_columns(path, rows, param_names):
+    """Atomically rewrite path with one array per result column, ordered by episode"""
+    rows = sorted(rows, key=lambda row: row["episode"])
+    names = ("episode", "seed") + tuple(param_names) + (
+        "score", "frames", "lives_lost", "won", "truncated", "seconds")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **{name: np.array([row[name] for row in rows]) for name in names})
+    os.replace(tmp, path)
+
+def print_summary(rows, param_names):
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[name] for name in param_names), []).append(row)
+    for key, group in sorted(groups.items()):
+        label = "  ".join(f"{name}={value}" for name, value in zip(param_names, key)) or "defaults"
+        score = np.array([row["score"] for row in group])
+        frames = np.array([row["frames"] for row in group])
+        lives_lost = np.array([row["lives_lost"] for row in group])
+        wins = sum(row["won"] for row in group)
+        print(f"{label}: {len(group)} episodes  score {score.mean():.1f} (p50 {np.median(score):.0f})  "
+              f"frames {frames.mean():.0f}  lives lost {lives_lost.mean():.2f}  won {100 * wins / len(group):.0f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless Space Invaders episodes across a process pool")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="gameplay constant to sweep, one of PARAMS (repeatable; the grid is every combination)")
+    parser.add_argument("--episodes", type=int, default=DEFAULT_EPISODES, help="episodes per grid point")
+    parser.add_argument("--policy", default="random",
+                        help=f"one of {', '.join(POLICIES)}, or module:function (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode at each grid point")
+    parser.add_argument("--max-frames", type=int, default=DEFAULT_MAX_FRAMES,
+                        help="stop an episode after this many ticks (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes, 1 to run in this process (default: %(default)s)")
+    parser.add_argument("--out", default=DEFAULT_OUT, help="columnar results file (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.seed < 0:
+        parser.error("--seed must be at least 0")
+    try:
+        grid = dict(parse_param(text) for text in args.param)
+        load_policy(args.policy)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+
+    # Every grid point replays the same seeds, so differences come from the parameters
+    param_names = list(grid)
+    runs = itertools.product(itertools.product(*grid.values()), range(args.episodes))
+    episodes = [Episode(index, dict(zip(param_names, values)), args.seed + i, args.policy, args.max_frames)
+                for index, (values, i) in enumerate(runs)]
+
+    start = time.perf_counter()
+    rows = []
+    if args.workers == 1:
+        results = map(run_episode, episodes)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(args.workers)
+        chunksize = max(1, len(episodes) // (args.workers * 8))
+        results = pool.imap_unordered(run_episode, episodes, chunksize)
+    try:
+        for row in results:
+            rows.append(row)
+            if len(rows) % FLUSH_EVERY == 0:
+                write_columns(args.out, rows, param_names)
+                print(f"{len(rows)}/{len(episodes)} episodes", file=sys.stderr)
+    finally:
+        if pool:
+            pool.terminate()
+    write_columns(args.out, rows, param_names)
+    elapsed = time.perf_counter() - start
+
+    print_summary(rows, param_names)
+    frames = sum(row["frames"] for row in rows)
+    print(f"\n{len(rows)} episodes, {frames} frames in {elapsed:.1f} s "
+          f"({frames / elapsed:.0f} frames/s on {args.workers} workers); results in {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""Benchmark the Game.update and Game.draw hot paths in scripted scenarios
+
+Runs on a headless box through SDL's dummy video and audio drivers.
+
+Usage:
+    python benchmark.py                                # run every scenario
+    python benchmark.py --scenario bullet_storm        # run one scenario
+    python benchmark.py --save results.json            # keep results as a baseline
+    python benchmark.py --baseline results.json        # flag regressions against it
+    python benchmark.py --allocations                  # also trace memory; fail over budget or on growth
+    python benchmark.py --allocation-budget 64         # with one budget for every scenario, in KB per frame
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+import space_invaders as si
+
+BENCH_SEED = 1234
+DEFAULT_FRAMES = 600
+WARMUP_FRAMES = 30
+DEFAULT_THRESHOLD = 0.15  # Flag anything more than 15% slower than the baseline
+GROWTH_BUDGET_BYTES = 256  # Retained memory may grow this much per frame over the second half of a run
+
+# Profiler stages that Game.step charges, reported as separate update phases
+UPDATE_PHASES = ("input", "stars", "player", "particles", "bullets", "shields", "collisions", "enemies", "audio")
+
+class Scenario:
+    """A scripted benchmark run
+
+    `constants` temporarily overrides space_invaders module constants and
+    `policy(game)` returns the FrameInput for each frame. The player's lives
+    are topped up before every frame and waves that end are restarted, so
+    every measured frame is live gameplay. `allocation_budget` is the mean
+    KB the scenario may allocate per frame, set at up to twice what it
+    allocates now so that a real regression goes over it.
+    """
+    def __init__(self, name, description, policy, allocation_budget, constants=None):
+        self.name = name
+        self.description = description
+        self.policy = policy
+        self.allocation_budget = allocation_budget
+        self.constants = constants or {}
+
+def sweep_and_fire(game):
+    """Run back and forth across the screen, firing every frame"""
+    left = (game.frame // 90) % 2 == 0
+    return si.FrameInput(left=left, right=not left, fire=True)
+
+def idle(game):
+    return si.NO_INPUT
+
+def explode_every_frame(game):
+    """Policy that also sets off overlapping explosions around the formation centre"""
+    for _ in range(8):
+        x = game.fx_rng.uniform(300, 500)
+        y = game.fx_rng.uniform(150, 350)
+        game.particles.spawn(x, y, si.PARTICLE_COUNT * 4, game.fx_rng)
+    return si.NO_INPUT
+
+# Budgets are about 1.6-1.8 times each scenario's measured mean allocation per frame
+SCENARIOS = [
+    Scenario("full_wave", "Default 5x10 wave, player idle", idle, 80),
+    Scenario("bullet_storm", "Constant player fire against heavy enemy fire",
+             sweep_and_fire, 160, {"ENEMY_SHOOT_CHANCE": 0.05}),
+    # Every live particle adds light, and the light's working arrays grow with them
+    Scenario("explosions", "Hundreds of overlapping explosions per second", explode_every_frame, 1600),
+    Scenario("large_grid", "16x30 formation of small enemies under constant fire",
+             sweep_and_fire, 224,
+             {"ENEMY_ROWS": 16, "ENEMY_COLS": 30, "ENEMY_SPACING": 24,
+              "ENEMY_WIDTH": 16, "ENEMY_HEIGHT": 12, "ENEMY_DROP": 0}),
+    Scenario("swarm", "25x48 swarm of 1,200 tiny enemies under constant fire",
+             sweep_and_fire, 352,
+             {"ENEMY_ROWS": 25, "ENEMY_COLS": 48, "ENEMY_SPACING": 15,
+              "ENEMY_WIDTH": 12, "ENEMY_HEIGHT": 9, "ENEMY_DROP": 0}),
+]
+
+def summarize(samples, scale=1000.0):
+    """Mean and percentiles of samples in the report's units; the default scale turns seconds into ms"""
+    values = np.asarray(samples) * scale
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+def retained_memory():
+    """Return the traced memory still in use after a full collection, which also empties Python's free lists"""
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def run_scenario(scenario, frames, allocations=False):
+    saved = {name: getattr(si, name) for name in scenario.constants}
+    for name, value in scenario.constants.items():
+        setattr(si, name, value)
+    profiler = None
+    try:
+        game = si.Game(seed=BENCH_SEED)
+        profiler = si.AllocationProfiler(capacity=frames) if allocations else si.FrameProfiler(capacity=frames)
+        game.profiler = profiler
+        # Growth is measured over the second half, once pools and caches have warmed up
+        halfway = WARMUP_FRAMES + frames // 2
+        retained = []
+
+        for i in range(WARMUP_FRAMES + frames):
+            if allocations and i == halfway:
+                retained.append(retained_memory())
+            if game.game_over:
+                game.reset_game()
+            game.lives = 3
+            frame_input = scenario.policy(game)
+
+            profiler.begin_frame()
+            game.step(frame_input)
+            game.draw()
+            profiler.lap("draw")
+            # The ring buffer only holds the measured frames, so warmup frames are overwritten
+            profiler.end_frame(game)
+        if allocations:
+            retained.append(retained_memory())
+
+        times, _ = profiler.samples()
+        stage = {name: times[:, i] for i, name in enumerate(si.PROFILER_STAGES)}
+        phases = {phase: stage[phase] for phase in UPDATE_PHASES}
+        phases["update"] = sum(stage[phase] for phase in UPDATE_PHASES)
+        phases["render"] = stage["draw"]
+
+        result = {
+            "description": scenario.description,
+            "frames": frames,
+            "frame": summarize(profiler.frame_times()),
+            "phases": {phase: summarize(samples) for phase, samples in phases.items()},
+            "entities": {
+                "enemies": len(game.enemies),
+                "bullets": len(game.bullets),
+                "enemy_bullets": len(game.enemy_bullets),
+                "particles": len(game.particles),
+            },
+        }
+        if allocations:
+            growth = (retained[1] - retained[0]) / (frames - frames // 2)
+            result["allocations"] = summarize_allocations(profiler, scenario, growth)
+        return result
+    finally:
+        if allocations and profiler is not None:
+            profiler.close()
+        for name, value in saved.items():
+            setattr(si, name, value)
+
+def summarize_allocations(profiler, scenario, growth):
+    """Per-frame and per-phase KB allocated, and how fast retained memory grew"""
+    allocated, _ = profiler.allocation_samples()
+    stage = {name: allocated[:, i] for i, name in enumerate(si.PROFILER_STAGES)}
+    phases = {phase: stage[phase] for phase in UPDATE_PHASES}
+    phases["render"] = stage["draw"]
+    frame = allocated[:, :profiler.stage_index["tick"]].sum(axis=1)
+    return {
+        "budget_kb": scenario.allocation_budget,
+        "frame": summarize(frame, 1 / 1024),
+        "phases": {phase: summarize(samples, 1 / 1024) for phase, samples in phases.items()},
+        "growth_bytes_per_frame": growth,
+    }
+
+def find_regressions(results, baseline, threshold):
+    """Compare frame and phase timings against a baseline run"""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        checks = [("frame p50", result["frame"]["p50"], base["frame"]["p50"]),
+                  ("frame p99", result["frame"]["p99"], base["frame"]["p99"])]
+        for phase, stats in result["phases"].items():
+            if phase in base["phases"]:
+                checks.append((f"{phase} mean", stats["mean"], base["phases"][phase]["mean"]))
+        for label, value, reference in checks:
+            # Ignore sub-0.05 ms phases; timer noise dominates them
+            if value > reference * (1 + threshold) and value - reference > 0.05:
+                regressions.append(f"{name}: {label} {reference:.3f} ms -> {value:.3f} ms "
+                                   f"(+{100 * (value / reference - 1):.0f}%)")
+    return regressions
+
+def find_allocation_overruns(results):
+    """List the scenarios that allocate more per frame than their budget, or keep growing"""
+    overruns = []
+    for name, result in results["scenarios"].items():
+        allocations = result.get("allocations")
+        if not allocations:
+            continue
+        if allocations["frame"]["mean"] > allocations["budget_kb"]:
+            overruns.append(f"{name}: {allocations['frame']['mean']:.1f} KB/frame allocated, "
+                            f"budget {allocations['budget_kb']:g} KB")
+        if allocations["growth_bytes_per_frame"] > GROWTH_BUDGET_BYTES:
+            overruns.append(f"{name}: retained memory grew {allocations['growth_bytes_per_frame']:.0f} B/frame, "
+                            f"budget {GROWTH_BUDGET_BYTES} B")
+    return overruns
+
+def print_report(results):
+    for name, result in results["scenarios"].items():
+        frame = result["frame"]
+        print(f"\n{name}: {result['description']}")
+        print(f"  frame   p50 {frame['p50']:7.3f} ms  p99 {frame['p99']:7.3f} ms  max {frame['max']:7.3f} ms")
+        for phase, stats in result["phases"].items():
+            print(f"  {phase:<11} mean {stats['mean']:7.3f} ms  p50 {stats['p50']:7.3f} ms  "
+                  f"p99 {stats['p99']:7.3f} ms")
+        counts = ", ".join(f"{k} {v}" for k, v in result["entities"].items())
+        print(f"  final entities: {counts}")
+        allocations = result.get("allocations")
+        if allocations:
+            frame = allocations["frame"]
+            print(f"  allocated   mean {frame['mean']:7.1f} KB  p99 {frame['p99']:7.1f} KB  "
+                  f"budget {allocations['budget_kb']:g} KB  retained growth "
+                  f"{allocations['growth_bytes_per_frame']:.0f} B/frame")
+            for phase, stats in allocations["phases"].items():
+                print(f"    {phase:<11} mean {stats['mean']:7.1f} KB  p99 {stats['p99']:7.1f} KB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Space Invaders update/draw hot paths")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help="measured frames per scenario")
+    parser.add_argument("--scenario", action="append", choices=[s.name for s in SCENARIOS],
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--save", metavar="PATH", help="write results to PATH as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved JSON run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown that counts as a regression (default: %(default)s)")
+    parser.add_argument("--allocations", action="store_true",
+                        help="trace memory allocated per frame and phase with tracemalloc, and exit 1 "
+                             "if a scenario allocates more than its budget or its retained memory keeps "
+                             "growing (slows every phase down)")
+    parser.add_argument("--allocation-budget", type=float, metavar="KB",
+                        help="mean KB per frame any scenario may allocate; implies --allocations "
+                             "(default: each scenario's own budget)")
+    args = parser.parse_args(argv)
+    if args.allocation_budget is not None:
+        args.allocations = True
+    if args.allocations and args.baseline:
+        parser.error("--allocations slows the timings down too much to compare with --baseline")
+
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "scenarios": {},
+    }
+    for scenario in SCENARIOS:
+        if args.scenario and scenario.name not in args.scenario:
+            continue
+        if args.allocation_budget is not None:
+            scenario.allocation_budget = args.allocation_budget
+        results["scenarios"][scenario.name] = run_scenario(scenario, args.frames, args.allocations)
+    print_report(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+
+    if args.allocations:
+        overruns = find_allocation_overruns(results)
+        if overruns:
+            print(f"\n{len(overruns)} allocation budget(s) exceeded:")
+            for line in overruns:
+                print(f"  {line}")
+            return 1
+        print("\nEvery scenario is within its allocation and growth budgets")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Export frames streamed by space_invaders.py --capture
+
+Usage:
+    python capture.py session.sicap                       # print frame count and size
+    python capture.py session.sicap --rgb - | ffmpeg -f rawvideo -pix_fmt rgb24 \\
+        -s 800x600 -r 60 -i - session.mp4                 # encode with ffmpeg
+    python capture.py session.sicap --png frames/         # one PNG per frame
+"""
+import argparse
+import os
+import sys
+
+import pygame
+
+from space_invaders import CaptureReader
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a Space Invaders frame capture")
+    parser.add_argument("capture", help="file written by space_invaders.py --capture")
+    parser.add_argument("--rgb", metavar="PATH", help="write raw rgb24 frames to PATH ('-' for stdout)")
+    parser.add_argument("--png", metavar="DIR", help="write each frame to DIR as a numbered PNG")
+    args = parser.parse_args(argv)
+
+    try:
+        reader = CaptureReader(args.capture)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    out = None
+    if args.rgb:
+        out = sys.stdout.buffer if args.rgb == "-" else open(args.rgb, "wb")
+    if args.png:
+        os.makedirs(args.png, exist_ok=True)
+    frames = 0
+    for frame in reader:
+        if out:
+            out.write(frame.tobytes())
+        if args.png:
+            surface = pygame.image.frombuffer(frame.tobytes(), (reader.width, reader.height), "RGB")
+            pygame.image.save(surface, os.path.join(args.png, f"frame{frames:06d}.png"))
+        frames += 1
+    if out and out is not sys.stdout.buffer:
+        out.close()
+
+    # Keep stdout clean for piped rgb24 frames
+    report = sys.stderr if args.rgb == "-" else sys.stdout
+    print(f"{frames} frames, {reader.width}x{reader.height} at {reader.fps} fps "
+          f"({'zlib delta' if reader.compressed else 'raw'})", file=report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
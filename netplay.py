@@ -0,0 +1,481 @@
+"""Two-player co-op Space Invaders over UDP with rollback netcode
+
+Only inputs cross the network. Both sides simulate the whole co-op game.
+When the partner's input for a frame has not arrived yet, it is predicted.
+If the real input turns out different, the game rolls back to its snapshot
+from before that frame and re-simulates. Added latency therefore costs
+re-simulated frames rather than a slower game, as long as it stays within
+MAX_ROLLBACK frames. Checksums of confirmed states are exchanged to
+detect desyncs.
+
+Usage:
+    python netplay.py --host                             # player one, waits for a partner
+    python netplay.py --join 192.168.1.20                # player two
+    python netplay.py --host --bot random --frames 1800 &
+    python netplay.py --join 127.0.0.1 --bot sweep --frames 1800 \\
+                      --latency 60 --loss 0.05           # two headless bots over loopback
+"""
+import argparse
+import collections
+import socket
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+import pygame
+
+import space_invaders as si
+from batch import load_policy, POLICIES
+
+DEFAULT_PORT = 7777
+DEFAULT_FRAMES = 1800  # Length of a --bot session: 30 seconds at 60 ticks per second
+INPUT_DELAY = 2  # Frames between sampling a local input and applying it
+MAX_ROLLBACK = 8  # Furthest the simulation may run past the partner's confirmed inputs
+SYNC_THRESHOLD = 2  # Frames ahead of the partner before ticks are skipped to let it catch up
+CHECKSUM_INTERVAL = 30  # Frames between desync checks
+CHECKSUM_HISTORY = 32  # Confirmed checksums kept for comparison
+MAX_PACKET_INPUTS = 128
+CONNECT_TIMEOUT = 60.0
+RESEND_SECONDS = 0.1
+TIMEOUT_SECONDS = 5.0  # Give up after this long without hearing from the partner
+
+# Packets: magic and kind, then a kind-specific body
+PACKET = struct.Struct("<4sB")
+MAGIC = b"SINP"
+HELLO, WELCOME, INPUTS, BYE = range(4)
+# HELLO: rules CRC
+HELLO_BODY = struct.Struct("<I")
+# WELCOME: seed (low and high 64 bits), rules CRC
+WELCOME_BODY = struct.Struct("<QQI")
+# INPUTS: sender's frame, its frame advantage, partner inputs it has, first input frame,
+# checksum frame and checksum; followed by one input byte per frame
+INPUTS_BODY = struct.Struct("<IhIIII")
+NO_CHECKSUM = 0xffffffff
+MAX_PACKET = 2048
+
+# Music is toggled locally, so only these input bits are sent
+NETWORK_INPUTS = si.INPUT_LEFT | si.INPUT_RIGHT | si.INPUT_FIRE | si.INPUT_RESTART
+PREDICTED_INPUTS = si.INPUT_LEFT | si.INPUT_RIGHT  # Held keys; presses are not repeated
+
+class DesyncError(RuntimeError):
+    """The partner's game state checksum differs from ours for the same frame"""
+    def __init__(self, frame):
+        super().__init__(f"game states diverged at frame {frame}")
+        self.frame = frame
+
+def packet(kind, body=b""):
+    return PACKET.pack(MAGIC, kind) + body
+
+def parse(data):
+    """Return (kind, body) for a netplay packet, or None for anything else"""
+    if len(data) < PACKET.size:
+        return None
+    magic, kind = PACKET.unpack_from(data)
+    if magic != MAGIC:
+        return None
+    return kind, data[PACKET.size:]
+
+class Connection:
+    """A non-blocking UDP socket talking to one partner
+
+    `latency` (seconds) and `loss` (a fraction) delay and drop outgoing
+    packets, to try rollback over loopback under real network conditions.
+    """
+    def __init__(self, sock, peer, latency=0.0, loss=0.0):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.peer = peer
+        self.latency = latency
+        self.loss = loss
+        self.rng = np.random.default_rng()
+        self.outgoing = collections.deque()  # (due time, packet) held back by the simulated latency
+        self.welcome = None  # The host's answer to hellos repeated because a welcome was lost
+        self.last_heard = time.perf_counter()
+
+    @classmethod
+    def host(cls, port, seed, timeout=CONNECT_TIMEOUT, **kwargs):
+        """Wait for a partner to join on `port` and send it the seed"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("", port))
+        sock.settimeout(timeout)
+        while True:
+            try:
+                data, peer = sock.recvfrom(MAX_PACKET)
+            except socket.timeout:
+                sock.close()
+                raise ConnectionError(f"no partner joined within {timeout:.0f} s")
+            parsed = parse(data)
+            if parsed and parsed[0] == HELLO:
+                break
+        rules, = HELLO_BODY.unpack_from(parsed[1])
+        connection = cls(sock, peer, **kwargs)
+        connection.welcome = packet(WELCOME, WELCOME_BODY.pack(seed & 0xffffffffffffffff, seed >> 64,
+                                                               si.rules_signature()))
+        sock.sendto(connection.welcome, peer)
+        if rules != si.rules_signature():
+            raise ValueError("partner is running with different game constants")
+        return connection
+
+    @classmethod
+    def join(cls, address, port, timeout=CONNECT_TIMEOUT, **kwargs):
+        """Join the game hosted at address:port; return the connection and the game seed"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(RESEND_SECONDS)
+        hello = packet(HELLO, HELLO_BODY.pack(si.rules_signature()))
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            sock.sendto(hello, (address, port))
+            try:
+                data, peer = sock.recvfrom(MAX_PACKET)
+            except (socket.timeout, ConnectionRefusedError):
+                continue
+            parsed = parse(data)
+            if parsed and parsed[0] == WELCOME:
+                seed_lo, seed_hi, rules = WELCOME_BODY.unpack_from(parsed[1])
+                if rules != si.rules_signature():
+                    raise ValueError("host is running with different game constants")
+                return cls(sock, peer, **kwargs), seed_lo | (seed_hi << 64)
+        sock.close()
+        raise ConnectionError(f"no answer from {address}:{port} within {timeout:.0f} s")
+
+    def send(self, kind, body=b""):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        data = packet(kind, body)
+        if self.latency:
+            self.outgoing.append((time.perf_counter() + self.latency, data))
+            self.flush()
+        else:
+            self.sock.sendto(data, self.peer)
+
+    def flush(self):
+        """Send the delayed packets that are due"""
+        now = time.perf_counter()
+        while self.outgoing and self.outgoing[0][0] <= now:
+            self.sock.sendto(self.outgoing.popleft()[1], self.peer)
+
+    def receive(self):
+        """Return (kind, body) for every packet from the partner waiting on the socket"""
+        self.flush()
+        packets = []
+        while True:
+            try:
+                data, sender = self.sock.recvfrom(MAX_PACKET)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+            parsed = parse(data)
+            if sender != self.peer or parsed is None:
+                continue
+            self.last_heard = time.perf_counter()
+            if parsed[0] == HELLO:
+                if self.welcome:
+                    self.sock.sendto(self.welcome, sender)
+                continue
+            packets.append(parsed)
+        return packets
+
+    def close(self):
+        # Goodbyes skip the simulated network; a few copies make it through real packet loss
+        for _ in range(3):
+            self.sock.sendto(packet(BYE), self.peer)
+        self.sock.close()
+
+class RollbackSession:
+    """Keeps a co-op Game in step with a partner's copy by exchanging inputs only
+
+    `local_player` is 0 for player one (the host) and 1 for player two.
+    tick() reads the packets that have arrived, rolling back and
+    re-simulating if a predicted input was wrong. It then schedules the
+    local input `input_delay` frames ahead and simulates one new frame.
+    That frame is skipped if the game is already `max_rollback` frames past
+    the partner's confirmed inputs, or is running ahead of the partner.
+    """
+    def __init__(self, game, local_player, connection, input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK):
+        if not game.coop:
+            raise ValueError("netplay needs a co-op game")
+        self.game = game
+        self.local_player = local_player
+        self.connection = connection
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        # Input bits by frame. Nothing is pressed during the first input_delay frames
+        self.local_inputs = bytearray(input_delay)
+        self.remote_inputs = bytearray()  # Confirmed by the partner
+        self.simulated_inputs = bytearray()  # Partner input each simulated frame used, confirmed or predicted
+        self.snapshots = [None] * max_rollback  # State before frame f at f % max_rollback
+        self.remote_frame = 0
+        self.remote_advantage = 0
+        self.remote_ack = 0  # Local inputs the partner has confirmed
+        self.pending_checksums = {}
+        self.checksums = {}
+        self.remote_checksums = {}
+        self.partner_left = False
+        self.rollbacks = 0
+        self.rollback_frames = 0
+        self.stalls = 0
+        self.verified_frame = -1  # Latest frame whose checksum matched the partner's
+
+    @property
+    def confirmed(self):
+        """Frames whose inputs from both players are known"""
+        return min(len(self.local_inputs), len(self.remote_inputs))
+
+    def tick(self, frame_input):
+        """Run one tick; return True if frame_input was scheduled and a new frame simulated"""
+        self.poll()
+        game = self.game
+        ahead = (game.frame - self.remote_frame - self.remote_advantage) // 2
+        if game.frame - len(self.remote_inputs) >= self.max_rollback or ahead >= SYNC_THRESHOLD:
+            self.stalls += 1
+            self.send()
+            return False
+        self.local_inputs.append(frame_input.to_bits() & NETWORK_INPUTS)
+        self.simulate()
+        self.send()
+        return True
+
+    def poll(self):
+        """Apply the partner's packets, rolling back to the first mispredicted frame"""
+        game = self.game
+        rollback_frame = None
+        for kind, body in self.connection.receive():
+            if kind == BYE:
+                self.partner_left = True
+            elif kind == INPUTS:
+                frame = self.receive_inputs(body)
+                if frame is not None and (rollback_frame is None or frame < rollback_frame):
+                    rollback_frame = frame
+        if time.perf_counter() - self.connection.last_heard > TIMEOUT_SECONDS and not self.partner_left:
+            raise ConnectionError(f"partner stopped responding at frame {game.frame}")
+        if rollback_frame is not None:
+            self.rollback(rollback_frame)
+        self.confirm_checksums()
+
+    def receive_inputs(self, body):
+        """Store newly confirmed partner inputs; return the first simulated frame they contradict"""
+        frame, advantage, ack, start, checksum_frame, checksum = INPUTS_BODY.unpack_from(body)
+        inputs = body[INPUTS_BODY.size:]
+        # Packets can arrive out of order; only the newest one says where the partner is
+        if frame >= self.remote_frame:
+            self.remote_frame = frame
+            self.remote_advantage = advantage
+        self.remote_ack = max(self.remote_ack, ack)
+        if checksum_frame != NO_CHECKSUM:
+            self.remote_checksums[checksum_frame] = checksum
+        known = len(self.remote_inputs)
+        if not start <= known < start + len(inputs):
+            return None
+        self.remote_inputs += inputs[known - start:]
+        for f in range(known, min(len(self.remote_inputs), self.game.frame)):
+            if self.simulated_inputs[f] != self.remote_inputs[f]:
+                return f
+        return None
+
+    def predict(self):
+        """Guess the partner's next input: keep holding the same direction"""
+        return self.remote_inputs[-1] & PREDICTED_INPUTS if self.remote_inputs else 0
+
+    def simulate(self):
+        game = self.game
+        frame = game.frame
+        snapshot = game.snapshot()
+        self.snapshots[frame % self.max_rollback] = snapshot
+        if frame % CHECKSUM_INTERVAL == 0:
+            self.pending_checksums[frame] = zlib.crc32(snapshot)
+        remote = self.remote_inputs[frame] if frame < len(self.remote_inputs) else self.predict()
+        if frame < len(self.simulated_inputs):
+            self.simulated_inputs[frame] = remote
+        else:
+            self.simulated_inputs.append(remote)
+        inputs = [self.local_inputs[frame], remote]
+        if self.local_player == 1:
+            inputs.reverse()
+        game.step(si.FrameInput.from_bits(inputs[0]), si.FrameInput.from_bits(inputs[1]))
+
+    def rollback(self, frame):
+        """Restore the state before `frame` and re-simulate up to the current frame, silently"""
+        game = self.game
+        end = game.frame
+        audio, game.audio = game.audio, si.NULL_AUDIO
+        try:
+            game.restore(self.snapshots[frame % self.max_rollback])
+            while game.frame < end:
+                self.simulate()
+        finally:
+            game.audio = audio
+        self.rollbacks += 1
+        self.rollback_frames += end - frame
+
+    def confirm_checksums(self):
+        """Keep the checksums of states that no input can change any more and compare them"""
+        confirmed = self.confirmed
+        for frame in [f for f in self.pending_checksums if f <= confirmed]:
+            self.checksums[frame] = self.pending_checksums.pop(frame)
+        for frame in [f for f in self.remote_checksums if f in self.checksums]:
+            if self.remote_checksums.pop(frame) != self.checksums[frame]:
+                raise DesyncError(frame)
+            self.verified_frame = max(self.verified_frame, frame)
+        for frame in sorted(self.checksums)[:-CHECKSUM_HISTORY]:
+            del self.checksums[frame]
+        for frame in sorted(self.remote_checksums)[:-CHECKSUM_HISTORY]:
+            del self.remote_checksums[frame]
+
+    def send(self):
+        """Send every local input the partner hasn't confirmed, with the latest confirmed checksum"""
+        game = self.game
+        start = min(self.remote_ack, len(self.local_inputs))
+        inputs = self.local_inputs[start:start + MAX_PACKET_INPUTS]
+        checksum_frame = max(self.checksums, default=NO_CHECKSUM)
+        checksum = self.checksums.get(checksum_frame, 0)
+        advantage = max(-32768, min(32767, game.frame - self.remote_frame))
+        self.connection.send(INPUTS, INPUTS_BODY.pack(game.frame, advantage, len(self.remote_inputs), start,
+                                                      checksum_frame, checksum) + inputs)
+
+    def confirmed_recording(self):
+        """The game's recording, trimmed to the frames both players' inputs are known for
+
+        The score is the one reached at the end of those frames. When the
+        game has run past them, it comes from the snapshot taken there.
+        """
+        game = self.game
+        recording = game.recording
+        frames = min(self.confirmed, game.frame)
+        score = game.score
+        if frames < game.frame:
+            score = si.SNAPSHOT_HEADER.unpack_from(self.snapshots[frames % self.max_rollback])[4]
+        return si.Recording(recording.seed, recording.data(frames), recording.rules, score, recording.players)
+
+    def stats(self):
+        return (f"{self.rollbacks} rollbacks ({self.rollback_frames} frames re-simulated), "
+                f"{self.stalls} stalled ticks, states verified up to frame {self.verified_frame}")
+
+def play(session):
+    """Play in a window: arrow keys move, space fires, R restarts, M toggles music"""
+    game = session.game
+    tick_seconds = 1.0 / si.TICK_RATE
+    accumulator = 0.0
+    last_time = time.perf_counter()
+    # Presses are latched until a scheduled input includes them
+    fire = restart = False
+    while not session.partner_left:
+        frame_input = game.handle_events()
+        if frame_input is None:
+            break
+        if frame_input.toggle_music:
+            game.audio.toggle_music()
+        fire |= frame_input.fire
+        restart |= frame_input.restart
+
+        now = time.perf_counter()
+        accumulator = min(accumulator + now - last_time, si.MAX_CATCH_UP_TICKS * tick_seconds)
+        last_time = now
+        while accumulator >= tick_seconds:
+            if session.tick(si.FrameInput(frame_input.left, frame_input.right, fire, restart)):
+                fire = restart = False
+            accumulator -= tick_seconds
+        game.draw(accumulator / tick_seconds)
+        if game.audio_loader and game.audio_loader.audio is not None:
+            game.attach_audio()
+        game.clock.tick(game.fps)
+
+def play_bot(session, policy, frames, rng):
+    """Drive the local player with policy(game, rng) for `frames` frames, in real time"""
+    game = session.game
+    tick_seconds = 1.0 / si.TICK_RATE
+    next_tick = time.perf_counter()
+    while (game.frame < frames or session.confirmed < frames) and not session.partner_left:
+        if game.frame < frames:
+            session.tick(policy(game, rng))
+        else:
+            session.poll()
+            session.send()
+        next_tick += tick_seconds
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+    # Keep answering until the partner has all our inputs too
+    while session.remote_ack < frames and not session.partner_left:
+        session.poll()
+        session.send()
+        time.sleep(tick_seconds)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Two-player co-op Space Invaders over the network")
+    role = parser.add_mutually_exclusive_group(required=True)
+    role.add_argument("--host", action="store_true", help="start a game and wait for a partner (player one)")
+    role.add_argument("--join", metavar="ADDRESS", help="join the game hosted at ADDRESS (player two)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="UDP port (default: %(default)s)")
+    parser.add_argument("--seed", type=int, help="seed for all game randomness (host only)")
+    parser.add_argument("--input-delay", type=int, default=INPUT_DELAY,
+                        help="frames before local inputs take effect; more means fewer rollbacks "
+                             "(default: %(default)s)")
+    parser.add_argument("--max-rollback", type=int, default=MAX_ROLLBACK,
+                        help="frames the game may run ahead of the partner's inputs (default: %(default)s)")
+    parser.add_argument("--bot", metavar="POLICY",
+                        help=f"play headless with a batch.py policy ({', '.join(POLICIES)} or module:function)")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES,
+                        help="with --bot, frames to play (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="MS",
+                        help="delay outgoing packets by MS milliseconds, to test over loopback")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of outgoing packets to drop")
+    parser.add_argument("--record", metavar="PATH", help="save the session's inputs to PATH on exit")
+    args = parser.parse_args(argv)
+
+    if args.input_delay < 0 or args.max_rollback < 1:
+        parser.error("--input-delay must be at least 0 and --max-rollback at least 1")
+    if args.seed is not None and not 0 <= args.seed < si.SEED_LIMIT:
+        parser.error("--seed must be between 0 and 2**128 - 1")
+    try:
+        policy = load_policy(args.bot) if args.bot else None
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+
+    network = {"latency": args.latency / 1000.0, "loss": args.loss}
+    try:
+        if args.host:
+            seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+            print(f"Waiting for a partner on UDP port {args.port}...")
+            connection = Connection.host(args.port, seed, **network)
+        else:
+            connection, seed = Connection.join(args.join, args.port, **network)
+    except (OSError, ValueError) as e:
+        print(f"Could not connect: {e}", file=sys.stderr)
+        return 1
+    local_player = 0 if args.host else 1
+    print(f"Connected to {connection.peer[0]}:{connection.peer[1]} as player {local_player + 1}")
+
+    game = si.Game(headless=bool(policy), seed=seed, coop=True)
+    if not game.headless:
+        pygame.display.set_caption(f"Space Invaders co-op (player {local_player + 1})")
+    session = RollbackSession(game, local_player, connection, args.input_delay, args.max_rollback)
+    status = 0
+    try:
+        if policy:
+            # Children 0 and 1 of the seed belong to the game itself
+            rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(4)[2 + local_player])
+            play_bot(session, policy, args.frames, rng)
+        else:
+            play(session)
+    except DesyncError as e:
+        print(f"Desync: {e}", file=sys.stderr)
+        status = 1
+    except ConnectionError as e:
+        print(f"Disconnected: {e}", file=sys.stderr)
+        status = 1
+    finally:
+        connection.close()
+
+    if session.partner_left:
+        print("Partner left the game")
+    print(f"Frame {game.frame}: score {game.score}, lives {game.lives}; {session.stats()}")
+    if policy and status == 0:
+        print(f"State checksum at frame {game.frame}: {zlib.crc32(game.snapshot()):08x}")
+    if args.record:
+        session.confirmed_recording().save(args.record)
+    if not game.headless:
+        game.audio.close()
+        pygame.quit()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Re-simulate recorded Space Invaders sessions headless, as fast as possible
+
+Usage:
+    python replay.py session.sirec              # print the final state
+    python replay.py session.sirec --seek 1200  # print the state at frame 1200
+    python replay.py session.sirec --verify     # check the recorded final score
+"""
+import argparse
+import sys
+import time
+
+from space_invaders import Game, Recording, rules_signature
+
+SNAPSHOT_INTERVAL = 600  # Frames between seek snapshots (10 seconds of play)
+
+class Replay:
+    """Headless playback of a Recording with random access by frame
+
+    A snapshot is kept every `snapshot_interval` frames as playback passes
+    it, so seeking only has to re-simulate from the nearest earlier snapshot.
+    """
+    def __init__(self, recording, snapshot_interval=SNAPSHOT_INTERVAL):
+        if recording.rules != rules_signature():
+            raise ValueError("recording was made with different game constants")
+        self.recording = recording
+        self.snapshot_interval = snapshot_interval
+        self.game = Game(headless=True, seed=recording.seed, coop=recording.players == 2)
+        self.snapshots = {0: self.game.snapshot()}
+
+    @property
+    def frame(self):
+        return self.game.frame
+
+    def advance(self, frames):
+        """Simulate up to `frames` more recorded frames"""
+        game = self.game
+        recording = self.recording
+        end = min(len(recording), game.frame + frames)
+        while game.frame < end:
+            game.step(recording.frame_input(game.frame), recording.partner_input(game.frame))
+            if game.frame % self.snapshot_interval == 0 and game.frame not in self.snapshots:
+                self.snapshots[game.frame] = game.snapshot()
+
+    def seek(self, frame):
+        """Move playback to `frame` and return the game state there"""
+        if not 0 <= frame <= len(self.recording):
+            raise ValueError(f"frame {frame} is outside the recording (0-{len(self.recording)})")
+        base = max(f for f in self.snapshots if f <= frame)
+        if frame < self.game.frame or base > self.game.frame:
+            self.game.restore(self.snapshots[base])
+        self.advance(frame - self.game.frame)
+        return self.game.get_state()
+
+    def run(self):
+        """Play to the end of the recording and return the final state"""
+        return self.seek(len(self.recording))
+
+    def verify(self):
+        """Return True if re-simulating the inputs reproduces the recorded score"""
+        return self.run()["score"] == self.recording.score
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-simulate a recorded Space Invaders session")
+    parser.add_argument("recording", help="file written by space_invaders.py --record")
+    parser.add_argument("--seek", type=int, metavar="FRAME", help="stop at FRAME instead of the end")
+    parser.add_argument("--verify", action="store_true", help="check the recorded final score")
+    args = parser.parse_args(argv)
+
+    try:
+        replay = Replay(Recording.load(args.recording))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    try:
+        state = replay.seek(args.seek) if args.seek is not None else replay.run()
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+
+    print(f"Frame {state['frame']} of {len(replay.recording)} "
+          f"({state['frame'] / max(elapsed, 1e-9):.0f} frames/s)")
+    print(f"Score: {state['score']}  Lives: {state['lives']}  Enemies: {len(state['enemies'])}  "
+          f"Game over: {state['game_over']}")
+    if args.verify:
+        ok = replay.verify()
+        print(f"Recorded score {replay.recording.score}: {'verified' if ok else 'MISMATCH'}")
+        return 0 if ok else 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
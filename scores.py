@@ -0,0 +1,49 @@
+"""Show the high scores and game telemetry saved by space_invaders.py
+
+Usage:
+    python scores.py                      # the top 10 finished games
+    python scores.py --player alice       # alice's most recent games
+    python scores.py --limit 50 --db scores.db
+"""
+import argparse
+import sqlite3
+import sys
+import time
+
+from space_invaders import SCORE_DB_PATH, SCORE_TOP_COUNT, TICK_RATE, ScoreStore
+
+def format_row(rank, game):
+    minutes, seconds = divmod(game["frames"] // TICK_RATE, 60)
+    hit_ratio = "-" if game["hit_ratio"] is None else f"{100 * game['hit_ratio']:.0f}%"
+    frame_ms = "-" if game["frame_p50_ms"] is None else f"{game['frame_p50_ms']:.1f}/{game['frame_p99_ms']:.1f}"
+    result = "won" if game["won"] else "lost" if game["finished"] else "quit"
+    return (f"{rank:>4}  {game['player'][:16]:<16} {game['score']:>7}  {result:<4}  "
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(game['started']))}  {minutes:>3}:{seconds:02d}  "
+            f"{hit_ratio:>5}  {game['lives_lost']:>5}  {frame_ms:>11}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show Space Invaders high scores and game history")
+    parser.add_argument("--player", help="list this player's most recent games instead of the high scores")
+    parser.add_argument("--limit", type=int, default=SCORE_TOP_COUNT, help="games to list (default: %(default)s)")
+    parser.add_argument("--db", default=SCORE_DB_PATH, help="score database (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if not args.db:
+        parser.error("no score database; SPACE_INVADERS_SCORES is empty")
+
+    store = ScoreStore(args.db)
+    try:
+        games = store.history(args.player, args.limit) if args.player else store.top_scores(args.limit)
+    except (OSError, sqlite3.Error) as e:
+        parser.error(f"{args.db}: {e}")
+
+    if not games:
+        print("No games yet" if not args.player else f"No games by {args.player}")
+        return 0
+    print(f"{'#':>4}  {'player':<16} {'score':>7}  {'':<4}  {'started':<16}  {'time':>6}  "
+          f"{'hits':>5}  {'lives':>5}  {'frame ms':>11}")
+    for rank, game in enumerate(games, 1):
+        print(format_row(rank, game))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
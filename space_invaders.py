@@ -1,17 +1,35 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import pygame
-import random
 import sys
+import os
+import pathlib
 import math
+import json
+import hashlib
+import struct
+import zlib
+import argparse
+import getpass
+import queue
+import sqlite3
+import threading
+import tracemalloc
 import numpy as np
 
-# Initialize Pygame
-pygame.init()
-pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
+# Pygame subsystems are initialized on demand: the display and fonts when a
+# windowed Game is created, the mixer on a background thread (AudioLoader).
+# Importing this module opens no window or audio device.
 
 # Constants
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
-FPS = 60
+FPS = 60  # Display frame cap; 0 draws as fast as the display allows
+
+# Simulation timing. Every speed below is per tick, so TICK_RATE sets the pace of play
+TICK_RATE = 60
+MAX_CATCH_UP_TICKS = 5  # Past this many ticks per drawn frame the game slows down instead
 
 # Colors
 BLACK = (0, 0, 0)
@@ -26,16 +44,25 @@ PURPLE = (128, 0, 128)
 DARK_GREEN = (0, 150, 0)
 LIGHT_BLUE = (173, 216, 230)
 DARK_RED = (150, 0, 0)
+# Hull and outline colours of player one's and player two's ships
+PLAYER_COLORS = ((GREEN, DARK_GREEN), (ORANGE, DARK_RED))
 
 # Player settings
 PLAYER_SPEED = 5
 PLAYER_WIDTH = 50
 PLAYER_HEIGHT = 40
 
+# Star field settings
+STAR_LAYERS = 3  # Parallax layers, farthest first
+STAR_DENSITY = 40  # Stars per layer
+STAR_SPEED = 0.5  # Nearest layer's scroll speed; farther layers move proportionally slower
+STAR_DIRTY_LIMIT = 600  # Past this many stars the field reports the whole screen dirty rather than each star
+
 # Bullet settings
 BULLET_SPEED = 7
 BULLET_WIDTH = 4
 BULLET_HEIGHT = 10
+BULLET_CAPACITY = 1024  # Initial slots per bullet pool
 
 # Enemy settings
 ENEMY_SPEED = 1
@@ -44,6 +71,15 @@ ENEMY_HEIGHT = 30
 ENEMY_ROWS = 5
 ENEMY_COLS = 10
 ENEMY_SPACING = 60
+ENEMY_DROP = 20  # Distance the formation moves down at each screen edge
+
+# Shield settings
+SHIELD_COUNT = 4
+SHIELD_WIDTH = 66
+SHIELD_HEIGHT = 48
+SHIELD_Y = SCREEN_HEIGHT - 150  # Top edge of the shields
+SHIELD_CRATER_RADIUS = 4  # Pixels cleared around each bullet impact
+SHIELD_COLOR = GREEN
 
 # Enemy bullet settings
 ENEMY_BULLET_SPEED = 3
@@ -52,552 +88,2655 @@ ENEMY_SHOOT_CHANCE = 0.0005  # Probability per frame
 # Particle settings
 PARTICLE_COUNT = 15
 PARTICLE_LIFETIME = 30
+PARTICLE_COLORS = [YELLOW, ORANGE, RED, WHITE]
+PARTICLE_MAX_SIZE = 5
+PARTICLE_GRAVITY = 0.1
+PARTICLE_CAPACITY = 50000  # New particles are dropped once the pool is full
+
+# Profiler settings
+PROFILER_FRAMES = 600  # Ring buffer size (10 seconds at 60 FPS)
+PROFILER_STAGES = ("events", "input", "stars", "player", "particles", "bullets", "shields", "collisions", "enemies",
+                   "audio", "draw", "capture", "tick")
+PROFILER_COUNTERS = ("enemies", "bullets", "enemy_bullets", "particles")
+PROFILER_GRAPH_MS = 33.3  # Frame time at the top of the overlay graph
+
+# Renderer settings
+DIRTY_MERGE_THRESHOLD = 32  # Layers with more rects than this may be merged into one
+DIRTY_MERGE_SLACK = 2.0  # ...if their bounding box is at most this many times their total area
+DIRTY_FULL_UPDATE_RATIO = 0.8  # Flip the whole display once the dirty rects add up to this fraction of the screen
+
+# Light settings
+LIGHT_SCALE = 4  # Screen pixels per light buffer cell
+LIGHT_DECAY = 0.6  # Fraction of the light left after a tick; what lingers draws motion trails
+LIGHT_THRESHOLD = 2.0  # Cells dimmer than this (out of 255) count as dark
+LIGHT_TILE = 4  # The light reports the dirty screen area in tiles this many cells across
+PARTICLE_LIGHT = 1500  # Light a fresh, full-size particle adds per tick
+BULLET_LIGHT = 1200
+ENGINE_LIGHT = 600
+
+# Frame capture settings
+CAPTURE_BUFFERS = 8  # Frames that can wait for the writer thread before capture() blocks
+CAPTURE_ZLIB_LEVEL = 1  # Fastest level; frame deltas are mostly zeros anyway
+
+# Score store settings
+SCORE_BATCH_SECONDS = 0.5  # Games that finish within this long of each other are written in one transaction
+SCORE_TOP_COUNT = 10
+FRAME_HISTOGRAM_BIN_MS = 0.1  # Resolution of the frame-time percentiles saved with each game
+FRAME_HISTOGRAM_MAX_MS = 250  # Frames longer than this are counted in the last bin
+# Set SPACE_INVADERS_SCORES to an empty string to keep no scores or telemetry
+SCORE_DB_PATH = os.environ.get(
+    "SPACE_INVADERS_SCORES",
+    os.path.join(os.path.expanduser("~"), ".local", "share", "space_invaders", "scores.db"))
+
+# Sound settings
+SAMPLE_RATE = 22050
+MAX_SAMPLE = 2**(16 - 1) - 1
+EXPLOSION_SEED = 1977  # Fixed so the rendered explosion can be cached
+SOUND_CACHE_VERSION = 1
+AUDIO_CHANNELS = 16  # Mixer channels; channel 0 is reserved for music
+SOUND_VOICE_LIMITS = {"shoot": 4, "explosion": 6}  # Channels each sound category may use at once
+MUSIC_CHUNK_SECONDS = 0.5  # Length of each streamed music chunk
+MUSIC_BUFFER_CHUNKS = 4  # Chunks the music thread renders ahead
+# Set SPACE_INVADERS_CACHE to an empty string to disable the waveform cache
+SOUND_CACHE_DIR = os.environ.get(
+    "SPACE_INVADERS_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "space_invaders"))
+
+# Sound synthesis functions (return stereo int16 arrays)
+def synthesize_tone(freq, duration, amplitude):
+    """Synthesize a constant sine tone"""
+    frames = int(duration * SAMPLE_RATE)
+    t = np.arange(frames) / SAMPLE_RATE
+    wave = (MAX_SAMPLE * amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+    return np.column_stack((wave, wave))
+
+def synthesize_explosion(duration, base_freq, amplitude, seed):
+    """Synthesize a decaying, jittered tone with added noise"""
+    frames = int(duration * SAMPLE_RATE)
+    rng = np.random.default_rng(seed)
+    i = np.arange(frames)
+    decay = 1.0 - i / frames
+    freq = base_freq + rng.integers(-50, 51, frames)
+    wave = np.trunc(MAX_SAMPLE * amplitude * decay * np.sin(2 * np.pi * freq * i / SAMPLE_RATE))
+    # Add some noise
+    noise = rng.integers(-1000, 1001, frames) * decay
+    mono = np.trunc(wave + noise).astype(np.int16)
+    return np.column_stack((mono, mono))
+
+def synthesize_melody(notes, duration, amplitude, start=0, frames=None):
+    """Synthesize equal-length sine notes played back to back, looping every `duration` seconds
+    
+    Renders `frames` frames from frame `start` of the endless loop; by
+    default exactly one pass.
+    """
+    loop = int(duration * SAMPLE_RATE)
+    note_duration = loop // len(notes)
+    i = np.arange(start, start + (loop if frames is None else frames)) % loop
+    # Frames left over after the last full note stay silent
+    note_idx = np.minimum(i // note_duration, len(notes) - 1)
+    freq = np.asarray(notes, dtype=np.float64)[note_idx]
+    wave = np.trunc(MAX_SAMPLE * amplitude * np.sin(2 * np.pi * freq * i / SAMPLE_RATE))
+    wave[i >= len(notes) * note_duration] = 0
+    mono = wave.astype(np.int16)
+    return np.column_stack((mono, mono))
+
+def cached_waveform(name, synthesize, **params):
+    """Return synthesize(**params), memory-mapped from the on-disk cache when possible"""
+    if not SOUND_CACHE_DIR:
+        return synthesize(**params)
+    key = json.dumps([name, SOUND_CACHE_VERSION, SAMPLE_RATE, params], sort_keys=True)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(SOUND_CACHE_DIR, f"{name}-{digest}.npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    
+    arr = synthesize(**params)
+    try:
+        os.makedirs(SOUND_CACHE_DIR, exist_ok=True)
+        # Write to a temporary file first so a concurrent launch never maps a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, arr, allow_pickle=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return arr
 
 # Sound generation functions
 def generate_shoot_sound():
     """Generate a shooting sound effect"""
-    duration = 0.1
-    sample_rate = 22050
-    frames = int(duration * sample_rate)
-    arr = np.zeros((frames, 2), dtype=np.int16)
-    max_sample = 2**(16 - 1) - 1
-    
-    for i in range(frames):
-        # High frequency beep
-        wave = int(max_sample * 0.3 * math.sin(2 * math.pi * 800 * i / sample_rate))
-        arr[i][0] = wave
-        arr[i][1] = wave
-    
+    # High frequency beep
+    arr = cached_waveform("shoot", synthesize_tone, freq=800, duration=0.1, amplitude=0.3)
     sound = pygame.sndarray.make_sound(arr)
     sound.set_volume(0.3)
     return sound
 
 def generate_explosion_sound():
     """Generate an explosion sound effect"""
-    duration = 0.3
-    sample_rate = 22050
-    frames = int(duration * sample_rate)
-    arr = np.zeros((frames, 2), dtype=np.int16)
-    max_sample = 2**(16 - 1) - 1
-    
-    for i in range(frames):
-        # Noise-like explosion sound
-        decay = 1.0 - (i / frames)
-        freq = 200 + random.randint(-50, 50)
-        wave = int(max_sample * 0.4 * decay * math.sin(2 * math.pi * freq * i / sample_rate))
-        # Add some noise
-        noise = random.randint(-1000, 1000) * decay
-        arr[i][0] = int(wave + noise)
-        arr[i][1] = int(wave + noise)
-    
+    arr = cached_waveform("explosion", synthesize_explosion, duration=0.3, base_freq=200,
+                          amplitude=0.4, seed=EXPLOSION_SEED)
     sound = pygame.sndarray.make_sound(arr)
     sound.set_volume(0.4)
     return sound
 
-def generate_background_music():
-    """Generate background music"""
-    duration = 2.0
-    sample_rate = 22050
-    frames = int(duration * sample_rate)
-    arr = np.zeros((frames, 2), dtype=np.int16)
-    max_sample = 2**(16 - 1) - 1
-    
-    # Create a simple bass line
+def background_music(start, frames):
+    """Render frames [start, start + frames) of the background music"""
+    # A simple looping bass line
     notes = [220, 247, 262, 294, 330]  # A, B, C, D, E
-    note_duration = frames // len(notes)
+    return synthesize_melody(notes, duration=2.0, amplitude=0.1, start=start, frames=frames)
+
+class MusicStream:
+    """Render music chunk by chunk on a worker thread
     
-    for note_idx, freq in enumerate(notes):
-        start_frame = note_idx * note_duration
-        end_frame = min(start_frame + note_duration, frames)
-        for i in range(start_frame, end_frame):
-            wave = int(max_sample * 0.1 * math.sin(2 * math.pi * freq * i / sample_rate))
-            arr[i][0] = wave
-            arr[i][1] = wave
+    render(start, frames) returns the stereo samples for that span, so music
+    can be arbitrarily long or generated on the fly and is never held in
+    memory whole. The thread stays MUSIC_BUFFER_CHUNKS chunks ahead of
+    playback; next_chunk() never blocks.
+    """
+    def __init__(self, render, chunk_seconds=MUSIC_CHUNK_SECONDS, buffered=MUSIC_BUFFER_CHUNKS):
+        self.render = render
+        self.chunk_frames = int(chunk_seconds * SAMPLE_RATE)
+        self.chunks = queue.Queue(maxsize=buffered)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.fill, name="music-stream", daemon=True)
+        self.thread.start()
     
-    sound = pygame.sndarray.make_sound(arr)
-    sound.set_volume(0.2)
-    return sound
+    def fill(self):
+        start = 0
+        while not self.stopped.is_set():
+            chunk = self.render(start, self.chunk_frames)
+            start += self.chunk_frames
+            while not self.stopped.is_set():
+                try:
+                    self.chunks.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    
+    def next_chunk(self):
+        """Return the next rendered chunk, or None if the thread has fallen behind"""
+        try:
+            return self.chunks.get_nowait()
+        except queue.Empty:
+            return None
+    
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
 
-class Particle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.vx = random.uniform(-3, 3)
-        self.vy = random.uniform(-3, 3)
-        self.lifetime = PARTICLE_LIFETIME
-        self.max_lifetime = PARTICLE_LIFETIME
-        self.color = random.choice([YELLOW, ORANGE, RED, WHITE])
-        self.size = random.randint(2, 5)
+class NullAudio:
+    """Stand-in for headless games; every hook is a no-op"""
+    def play(self, category):
+        pass
+    
+    def flush(self):
+        pass
+    
+    def start_music(self):
+        pass
+    
+    def stop_music(self):
+        pass
+    
+    def toggle_music(self):
+        pass
+    
+    def close(self):
+        pass
+
+NULL_AUDIO = NullAudio()
+
+class AudioLoader:
+    """Open the mixer and synthesize the sounds on a background thread
+    
+    `audio` stays None while loading, then becomes the AudioManager, or
+    NULL_AUDIO if no audio device could be opened. `seconds` is how long
+    loading took.
+    """
+    def __init__(self):
+        self.audio = None
+        self.error = None
+        self.seconds = None
+        self.thread = threading.Thread(target=self.load, name="audio-loader", daemon=True)
+        self.thread.start()
+    
+    def load(self):
+        start = time.perf_counter()
+        try:
+            pygame.mixer.init(frequency=SAMPLE_RATE, size=-16, channels=2, buffer=512)
+            audio = AudioManager({"shoot": generate_shoot_sound(), "explosion": generate_explosion_sound()},
+                                 MusicStream(background_music))
+        except pygame.error as e:
+            self.error = e
+            audio = NULL_AUDIO
+        self.seconds = time.perf_counter() - start
+        self.audio = audio
+
+class AudioManager:
+    """Sound effects with per-category voice limits, plus a streamed music channel
+    
+    play() only marks a category as requested; flush(), once per tick,
+    starts one voice per requested category, so several hits in one tick
+    make one explosion. Each category owns SOUND_VOICE_LIMITS[category]
+    channels. When all are busy the longest-playing voice is cut off, so
+    rapid fire can never starve other sounds. Channel 0 is reserved for
+    music, which flush() keeps queued from a MusicStream.
+    """
+    def __init__(self, sounds, music=None, music_volume=0.2):
+        pygame.mixer.set_num_channels(AUDIO_CHANNELS)
+        total = 1 + sum(SOUND_VOICE_LIMITS.values())
+        if total > AUDIO_CHANNELS:
+            raise ValueError(f"voice limits need {total} channels but only {AUDIO_CHANNELS} exist")
+        # Reserved channels are never picked by Sound.play(), so nothing else can steal them
+        pygame.mixer.set_reserved(total)
+        self.sounds = sounds
+        self.music_channel = pygame.mixer.Channel(0)
+        self.music = music
+        self.music_volume = music_volume
+        self.music_playing = False
+        self.voices = {}
+        first = 1
+        for category, limit in SOUND_VOICE_LIMITS.items():
+            self.voices[category] = [pygame.mixer.Channel(i) for i in range(first, first + limit)]
+            first += limit
+        self.next_voice = dict.fromkeys(self.voices, 0)
+        self.requested = set()
+    
+    def play(self, category):
+        self.requested.add(category)
+    
+    def flush(self):
+        """Start this tick's coalesced sounds and top up the music channel"""
+        for category in self.requested:
+            voices = self.voices[category]
+            channel = next((voice for voice in voices if not voice.get_busy()), None)
+            if channel is None:
+                # Voices are handed out round-robin, so the next one is the oldest
+                channel = voices[self.next_voice[category]]
+            self.next_voice[category] = (voices.index(channel) + 1) % len(voices)
+            channel.play(self.sounds[category])
+        self.requested.clear()
+        self.pump_music()
+    
+    def pump_music(self):
+        if self.music_playing and self.music and self.music_channel.get_queue() is None:
+            chunk = self.music.next_chunk()
+            if chunk is not None:
+                sound = pygame.sndarray.make_sound(chunk)
+                sound.set_volume(self.music_volume)
+                # queue() starts at once on an idle channel, otherwise after the current chunk
+                self.music_channel.queue(sound)
+    
+    def start_music(self):
+        self.music_playing = True
+        self.pump_music()
+    
+    def stop_music(self):
+        self.music_playing = False
+        self.music_channel.stop()
+    
+    def toggle_music(self):
+        if self.music_playing:
+            self.stop_music()
+        else:
+            self.start_music()
+    
+    def close(self):
+        self.stop_music()
+        if self.music:
+            self.music.close()
+
+class FrameInput:
+    """Player input for a single simulation frame"""
+    __slots__ = ("left", "right", "fire", "restart", "toggle_music")
+    
+    def __init__(self, left=False, right=False, fire=False, restart=False, toggle_music=False):
+        self.left = left
+        self.right = right
+        self.fire = fire
+        self.restart = restart
+        self.toggle_music = toggle_music
+    
+    def to_bits(self):
+        """Pack the input into one byte for recordings"""
+        return ((INPUT_LEFT if self.left else 0) | (INPUT_RIGHT if self.right else 0) |
+                (INPUT_FIRE if self.fire else 0) | (INPUT_RESTART if self.restart else 0) |
+                (INPUT_TOGGLE_MUSIC if self.toggle_music else 0))
+    
+    @staticmethod
+    def from_bits(bits):
+        return PACKED_INPUTS[bits & 0x1f]
+
+# Input bits in recordings
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_FIRE = 4
+INPUT_RESTART = 8
+INPUT_TOGGLE_MUSIC = 16
+# In co-op recordings player two's moves and fire share the byte; restart is shared
+INPUT_PARTNER_SHIFT = 5
+PARTNER_INPUTS = INPUT_LEFT | INPUT_RIGHT | INPUT_FIRE
+
+NO_INPUT = FrameInput()
+PACKED_INPUTS = [FrameInput(bool(bits & INPUT_LEFT), bool(bits & INPUT_RIGHT), bool(bits & INPUT_FIRE),
+                            bool(bits & INPUT_RESTART), bool(bits & INPUT_TOGGLE_MUSIC))
+                 for bits in range(32)]
+
+def rules_signature():
+    """CRC of the constants that affect the simulation; recordings only replay under the same rules"""
+    rules = (SCREEN_WIDTH, SCREEN_HEIGHT, PLAYER_SPEED, PLAYER_WIDTH, PLAYER_HEIGHT,
+             BULLET_SPEED, BULLET_WIDTH, BULLET_HEIGHT, ENEMY_SPEED, ENEMY_WIDTH, ENEMY_HEIGHT,
+             ENEMY_ROWS, ENEMY_COLS, ENEMY_SPACING, ENEMY_DROP, ENEMY_BULLET_SPEED, ENEMY_SHOOT_CHANCE,
+             SHIELD_COUNT, SHIELD_WIDTH, SHIELD_HEIGHT, SHIELD_Y, SHIELD_CRATER_RADIUS)
+    return zlib.crc32(repr(rules).encode("ascii"))
+
+# Snapshot serialization. Each entity packs its state as a small struct
+# followed by the raw bytes of its live array slices.
+def pack_arrays(*arrays):
+    return b"".join(np.ascontiguousarray(arr).tobytes() for arr in arrays)
+
+def unpack_array(data, offset, dtype, count):
+    """Return a read-only view of `count` items at offset, and the offset just past them"""
+    arr = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    return arr, offset + arr.nbytes
+
+# PCG64 state and increment (low and high 64 bits each), has_uint32, uinteger
+RNG_STATE = struct.Struct("<QQQQBI")
+MASK64 = (1 << 64) - 1
+SEED_LIMIT = 1 << 128  # Recordings and netplay store seeds in 128 bits
+
+def pack_rng(rng):
+    state = rng.bit_generator.state
+    pcg = state["state"]
+    return RNG_STATE.pack(pcg["state"] & MASK64, pcg["state"] >> 64, pcg["inc"] & MASK64, pcg["inc"] >> 64,
+                          state["has_uint32"], state["uinteger"])
+
+def unpack_rng(rng, data, offset):
+    """Set rng's state from a pack_rng record and return the offset after it"""
+    state_lo, state_hi, inc_lo, inc_hi, has_uint32, uinteger = RNG_STATE.unpack_from(data, offset)
+    rng.bit_generator.state = {
+        "bit_generator": "PCG64",
+        "state": {"state": state_lo | (state_hi << 64), "inc": inc_lo | (inc_hi << 64)},
+        "has_uint32": has_uint32,
+        "uinteger": uinteger,
+    }
+    return offset + RNG_STATE.size
+
+class Recording:
+    """A game's seed plus one packed input byte per frame
+    
+    On disk this is a small fixed header followed by the zlib-compressed
+    input bytes. Held keys produce long runs of identical bytes, so an hour
+    of play compresses to a few kilobytes.
+    """
+    MAGIC = b"SIREC"
+    VERSION = 2
+    # magic, version, seed (low and high 64 bits), rules CRC, final score, frame count, players
+    HEADER = struct.Struct("<5sBQQIIIB")
+    # Version 1 recordings are all single-player and have no players byte
+    HEADER_V1 = struct.Struct("<5sBQQIII")
+    
+    def __init__(self, seed, inputs=b"", rules=None, score=0, players=1, shared=()):
+        self.seed = seed
+        # The first frames can be immutable chunks shared with the games forked from this one
+        self.shared = shared
+        self.shared_frames = sum(map(len, shared))
+        self.inputs = bytearray(inputs)  # This recording's own frames, after the shared ones
+        self.rules = rules_signature() if rules is None else rules
+        self.score = score
+        self.players = players
+    
+    def __len__(self):
+        return self.shared_frames + len(self.inputs)
+    
+    def append(self, frame_input, partner_input=NO_INPUT):
+        partner_bits = partner_input.to_bits()
+        self.inputs.append(frame_input.to_bits() | (partner_bits & INPUT_RESTART) |
+                           (partner_bits & PARTNER_INPUTS) << INPUT_PARTNER_SHIFT)
+    
+    def bits(self, frame):
+        """Return the packed input byte of `frame`"""
+        if frame >= self.shared_frames:
+            return self.inputs[frame - self.shared_frames]
+        for chunk in self.shared:
+            if frame < len(chunk):
+                return chunk[frame]
+            frame -= len(chunk)
+    
+    def frame_input(self, frame):
+        return FrameInput.from_bits(self.bits(frame))
+    
+    def partner_input(self, frame):
+        """Player two's input on `frame` of a co-op recording"""
+        return FrameInput.from_bits(self.bits(frame) >> INPUT_PARTNER_SHIFT)
+    
+    def data(self, frames=None):
+        """Return the packed input bytes of the first `frames` frames, or of all of them"""
+        return b"".join((*self.shared, self.inputs))[:frames]
+    
+    def share(self):
+        """Return the frames so far as immutable chunks for a forked game's recording to start from
+        
+        Only the frames recorded since the last share are copied, so many
+        forks of a long game do not each copy its whole history.
+        """
+        if self.inputs:
+            self.shared += (bytes(self.inputs),)
+            self.shared_frames += len(self.inputs)
+            self.inputs = bytearray()
+        return self.shared
+    
+    def truncate(self, frames):
+        """Drop every frame from `frames` on, as when rolling back to that frame"""
+        if frames >= self.shared_frames:
+            del self.inputs[frames - self.shared_frames:]
+            return
+        kept = []
+        remaining = frames
+        for chunk in self.shared:
+            if remaining <= 0:
+                break
+            kept.append(chunk[:remaining])
+            remaining -= len(chunk)
+        self.shared = tuple(kept)
+        self.shared_frames = frames
+        self.inputs = bytearray()
+    
+    def to_bytes(self):
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.seed & 0xffffffffffffffff,
+                                  self.seed >> 64, self.rules, self.score, len(self), self.players)
+        return header + zlib.compress(self.data(), 9)
+    
+    @classmethod
+    def from_bytes(cls, data):
+        header = cls.HEADER_V1 if data[5:6] == b"\x01" else cls.HEADER
+        if len(data) < header.size:
+            raise ValueError("not a Space Invaders recording (too short for the header)")
+        magic, version, seed_lo, seed_hi, rules, score, frames, *players = header.unpack_from(data)
+        if magic != cls.MAGIC or version not in (1, cls.VERSION):
+            raise ValueError("not a Space Invaders recording (or an unsupported version)")
+        try:
+            inputs = zlib.decompress(data[header.size:])
+        except zlib.error as e:
+            raise ValueError(f"recording is truncated or corrupt: {e}") from None
+        if len(inputs) != frames:
+            raise ValueError(f"recording is truncated: expected {frames} frames, found {len(inputs)}")
+        return cls(seed_lo | (seed_hi << 64), inputs, rules, score, players[0] if players else 1)
+    
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+class ParticleSystem:
+    """Capped particle pool stored as parallel NumPy arrays
+    
+    Live particles are packed into the first `count` slots, so integration,
+    gravity and culling each run as a single array operation. They are drawn
+    as light by LightCompositor. The arrays start small and grow by doubling
+    up to `capacity`; particles spawned beyond it are dropped.
+    """
+    def __init__(self, capacity=PARTICLE_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        self.allocate(0)
+    
+    STATE = struct.Struct("<I")
+    ARRAYS = (("x", np.float64), ("y", np.float64), ("vx", np.float64), ("vy", np.float64),
+              ("lifetime", np.int32), ("size", np.int32), ("color", np.int32))  # color indexes PARTICLE_COLORS
+    
+    def allocate(self, slots):
+        n = self.count
+        for name, dtype in self.ARRAYS:
+            arr = np.zeros(slots, dtype=dtype)
+            if n:
+                arr[:n] = getattr(self, name)[:n]
+            setattr(self, name, arr)
+        self.slots = slots
+    
+    def reserve(self, n):
+        """Grow the arrays, by doubling but never past capacity, until they hold n particles"""
+        if n > self.slots:
+            self.allocate(min(max(2 * self.slots, n), self.capacity))
+    
+    def __len__(self):
+        return self.count
+    
+    def clear(self):
+        self.count = 0
+    
+    def pack(self):
+        n = self.count
+        return self.STATE.pack(n) + pack_arrays(*(getattr(self, name)[:n] for name, _ in self.ARRAYS))
+    
+    def unpack(self, data, offset):
+        """Restore the live particles from pack() output at offset; return the offset after it"""
+        n, = self.STATE.unpack_from(data, offset)
+        if n > self.capacity:
+            raise ValueError(f"snapshot holds {n} particles but capacity is {self.capacity}")
+        offset += self.STATE.size
+        self.count = 0
+        self.reserve(n)
+        for name, dtype in self.ARRAYS:
+            values, offset = unpack_array(data, offset, dtype, n)
+            getattr(self, name)[:n] = values
+        self.count = n
+        return offset
+    
+    def spawn(self, x, y, n, rng):
+        """Emit n particles from (x, y) with random velocity, colour and size"""
+        n = min(n, self.capacity - self.count)
+        if n <= 0:
+            return
+        self.reserve(self.count + n)
+        s = slice(self.count, self.count + n)
+        self.x[s] = x
+        self.y[s] = y
+        self.vx[s] = rng.uniform(-3, 3, n)
+        self.vy[s] = rng.uniform(-3, 3, n)
+        self.lifetime[s] = PARTICLE_LIFETIME
+        self.color[s] = rng.integers(len(PARTICLE_COLORS), size=n)
+        self.size[s] = rng.integers(2, PARTICLE_MAX_SIZE + 1, n)
+        self.count += n
     
     def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.lifetime -= 1
-        self.vy += 0.1  # Gravity effect
+        n = self.count
+        # Integrate, then apply gravity
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.vy[:n] += PARTICLE_GRAVITY
+        self.lifetime[:n] -= 1
+        
+        # Cull dead particles by compacting the survivors to the front
+        alive = self.lifetime[:n] > 0
+        k = np.count_nonzero(alive)
+        if k < n:
+            arrays = (self.x, self.y, self.vx, self.vy, self.lifetime, self.size, self.color)
+            # Particles share a lifetime and are spawned in order, so the dead
+            # are usually the oldest ones at the front and a shift is enough
+            if alive[n - k:].all():
+                for arr in arrays:
+                    arr[:k] = arr[n - k:n]
+            else:
+                alive = np.flatnonzero(alive)
+                for arr in arrays:
+                    arr[:k] = arr[alive]
+            self.count = k
+
+class StarField:
+    """Parallax star layers scrolling down the screen
     
-    def draw(self, screen):
-        if self.lifetime > 0:
-            alpha = int(255 * (self.lifetime / self.max_lifetime))
-            color = tuple(min(255, max(0, c)) for c in self.color[:3])
-            size = max(1, int(self.size * (self.lifetime / self.max_lifetime)))
-            pygame.draw.circle(screen, color, (int(self.x), int(self.y)), size)
+    Farther layers have smaller, dimmer and slower stars. Each layer is
+    drawn once into a surface two screens tall with its pattern repeated, so
+    any screen-sized window onto it wraps seamlessly. Drawing the layer is a
+    single blit at its scroll offset, however many stars it holds. Surfaces
+    are built on first draw, so headless games only track scroll offsets.
+    
+    The dirty-rect renderer is told about each star's own rect, worked out
+    from the star positions, so a sparse field clears and pushes only the
+    pixels under its stars. Past STAR_DIRTY_LIMIT stars the rects would cost
+    more than they save, and the field reports the whole screen instead.
+    """
+    def __init__(self, rng):
+        layers = self.layers = STAR_LAYERS
+        self.xs = rng.integers(0, SCREEN_WIDTH + 1, size=(layers, STAR_DENSITY))
+        self.ys = rng.integers(0, SCREEN_HEIGHT + 1, size=(layers, STAR_DENSITY))
+        self.speeds = STAR_SPEED * np.arange(1, layers + 1) / layers
+        self.scroll = np.zeros(layers)
+        self.surfaces = None
+    
+    STATE = struct.Struct("<HH")
+    
+    def pack(self):
+        layers, density = self.xs.shape
+        return self.STATE.pack(layers, density) + pack_arrays(self.scroll, self.xs.astype(np.int32),
+                                                              self.ys.astype(np.int32))
+    
+    def unpack(self, data, offset):
+        """Restore from pack() output at offset and return the offset after it"""
+        layers, density = self.STATE.unpack_from(data, offset)
+        offset += self.STATE.size
+        scroll, offset = unpack_array(data, offset, np.float64, layers)
+        xs, offset = unpack_array(data, offset, np.int32, layers * density)
+        ys, offset = unpack_array(data, offset, np.int32, layers * density)
+        xs = xs.reshape(layers, density)
+        ys = ys.reshape(layers, density)
+        # Keep the rendered layers when the pattern is unchanged, as when rolling back within a game
+        if xs.shape != self.xs.shape or not (np.array_equal(xs, self.xs) and np.array_equal(ys, self.ys)):
+            self.layers = layers
+            self.xs = xs.astype(np.int64)
+            self.ys = ys.astype(np.int64)
+            self.speeds = STAR_SPEED * np.arange(1, layers + 1) / layers
+            self.surfaces = None
+        self.scroll = scroll.copy()
+        return offset
+    
+    def update(self):
+        self.scroll += self.speeds
+        self.scroll %= SCREEN_HEIGHT
+    
+    def radius(self, layer):
+        return 1 + round(2 * layer / max(1, self.layers - 1))
+    
+    def build_surfaces(self):
+        surfaces = []
+        for layer in range(self.layers):
+            depth = (layer + 1) / self.layers
+            radius = self.radius(layer)
+            color = (round(255 * depth),) * 3
+            surf = pygame.Surface((SCREEN_WIDTH, 2 * SCREEN_HEIGHT))
+            surf.set_colorkey(BLACK, pygame.RLEACCEL)
+            for x, y in zip(self.xs[layer].tolist(), self.ys[layer].tolist()):
+                # Copies a tile above and below let stars straddling the seam wrap
+                for tile in range(-1, 3):
+                    pygame.draw.circle(surf, color, (x, y + tile * SCREEN_HEIGHT), radius)
+            surfaces.append(surf)
+        return surfaces
+    
+    def star_rects(self, offsets):
+        """Return the screen rects of every star at the given layer offsets, wrapped copies included"""
+        rects = []
+        for layer, offset in enumerate(offsets):
+            radius = self.radius(layer)
+            size = 2 * radius + 1
+            for x, y in zip(self.xs[layer].tolist(), self.ys[layer].tolist()):
+                y = (y + offset) % SCREEN_HEIGHT
+                rects.append(pygame.Rect(x - radius, y - radius, size, size))
+                # A star straddling the top or bottom edge also shows on the other side
+                if y < radius:
+                    rects.append(pygame.Rect(x - radius, y + SCREEN_HEIGHT - radius, size, size))
+                elif y >= SCREEN_HEIGHT - radius:
+                    rects.append(pygame.Rect(x - radius, y - SCREEN_HEIGHT - radius, size, size))
+        return rects
+    
+    def draw(self, screen, lag=0.0):
+        """Blit every layer `lag` of a tick behind its scroll position and return the rects drawn"""
+        if self.surfaces is None:
+            self.surfaces = self.build_surfaces()
+        offsets = ((self.scroll - self.speeds * lag) % SCREEN_HEIGHT).astype(np.int32).tolist()
+        drawn = [screen.blit(surf, (0, 0), (0, SCREEN_HEIGHT - offset, SCREEN_WIDTH, SCREEN_HEIGHT))
+                 for surf, offset in zip(self.surfaces, offsets)]
+        if self.xs.size > STAR_DIRTY_LIMIT:
+            return drawn
+        return self.star_rects(offsets)
+
+def shield_shape(width, height):
+    """Return the solid pixels of an intact shield: a block with bevelled top corners and an arch underneath"""
+    ys, xs = np.mgrid[:height, :width]
+    bevel = height // 4
+    solid = (xs + ys >= bevel) & (width - 1 - xs + ys >= bevel)
+    arch = ((xs - (width - 1) / 2) / (width / 4)) ** 2 + ((ys - height) / (height / 3)) ** 2 < 1
+    return solid & ~arch
+
+def crater_shape(radius):
+    ys, xs = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    return xs * xs + ys * ys <= radius * radius
+
+class Shields:
+    """Destructible bunkers between the players and the enemy formation
+    
+    Each shield is a bool pixel mask that erodes in place: a hit clears a
+    small crater around the impact. Bullets are first tested against the
+    band the shields occupy, and only those inside it are tested against the
+    mask pixels they swept through this tick, so the cost per frame follows
+    the bullets near the shields rather than the shields' area. The drawn
+    surfaces are built on first draw, after which only eroded patches are
+    repainted.
+    """
+    def __init__(self):
+        count = SHIELD_COUNT
+        self.width = SHIELD_WIDTH
+        self.height = SHIELD_HEIGHT
+        self.y = SHIELD_Y
+        gap = (SCREEN_WIDTH - count * SHIELD_WIDTH) // (count + 1)
+        self.xs = [gap + i * (gap + SHIELD_WIDTH) for i in range(count)]
+        self.solid = np.repeat(shield_shape(SHIELD_WIDTH, SHIELD_HEIGHT)[np.newaxis], count, axis=0)
+        self.crater = crater_shape(SHIELD_CRATER_RADIUS)
+        self.surfaces = None
+        self.dirty = []  # (shield, x0, y0, x1, y1) patches to repaint on the next draw
+    
+    STATE = struct.Struct("<HHH")
     
-    def is_alive(self):
-        return self.lifetime > 0
+    def pack(self):
+        return self.STATE.pack(*self.solid.shape) + np.packbits(self.solid).tobytes()
+    
+    def unpack(self, data, offset):
+        """Restore from pack() output at offset and return the offset after it"""
+        shape = self.STATE.unpack_from(data, offset)
+        offset += self.STATE.size
+        size = shape[0] * shape[1] * shape[2]
+        bits, offset = unpack_array(data, offset, np.uint8, (size + 7) // 8)
+        solid = np.unpackbits(bits, count=size).view(bool).reshape(shape)
+        # Only shields that differ from the snapshot need repainting
+        for shield in np.flatnonzero((solid != self.solid).any(axis=(1, 2))).tolist():
+            self.solid[shield] = solid[shield]
+            self.mark_dirty(shield, 0, 0, self.width, self.height)
+        return offset
+    
+    def overlapping(self, x, y, width, height):
+        """Yield (shield, x0, y0, x1, y1) for each shield the rect overlaps, clipped to shield pixels"""
+        y0 = max(y - self.y, 0)
+        y1 = min(y + height - self.y, self.height)
+        if y0 >= y1:
+            return
+        for shield, sx in enumerate(self.xs):
+            x0 = max(x - sx, 0)
+            x1 = min(x + width - sx, self.width)
+            if x0 < x1:
+                yield shield, x0, y0, x1, y1
+    
+    def mark_dirty(self, shield, x0, y0, x1, y1):
+        # Headless games never draw, so there is nothing to repaint
+        if self.surfaces is not None:
+            self.dirty.append((shield, x0, y0, x1, y1))
+    
+    def erode(self, shield, x, y):
+        """Clear a crater centred on shield pixel (x, y)"""
+        r = SHIELD_CRATER_RADIUS
+        x0, y0 = max(x - r, 0), max(y - r, 0)
+        x1, y1 = min(x + r + 1, self.width), min(y + r + 1, self.height)
+        crater = self.crater[y0 - y + r:y1 - y + r, x0 - x + r:x1 - x + r]
+        self.solid[shield, y0:y1, x0:x1] &= ~crater
+        self.mark_dirty(shield, x0, y0, x1, y1)
+    
+    def hit(self, pool):
+        """Erode the shields wherever bullets from `pool` struck them this tick, and remove those bullets"""
+        n = pool.count
+        if not n or not self.xs:
+            return
+        # The rows each bullet swept through this tick, from its previous position to its current one
+        ys = pool.y[:n]
+        tops = np.minimum(ys, ys + pool.speed)
+        bottoms = np.maximum(ys, ys + pool.speed) + BULLET_HEIGHT
+        near = (tops < self.y + self.height) & (bottoms > self.y)
+        if not near.any():
+            return
+        hits = np.zeros(n, dtype=bool)
+        # Earlier bullets erode first, which decides whether later ones get through
+        for i in pool.in_spawn_order(np.flatnonzero(near)).tolist():
+            top = int(tops[i])
+            for shield, x0, y0, x1, y1 in self.overlapping(int(pool.x[i]), top, BULLET_WIDTH, int(bottoms[i]) - top):
+                rows = np.flatnonzero(self.solid[shield, y0:y1, x0:x1].any(axis=1))
+                if len(rows):
+                    # Player bullets travel up and strike the lowest solid row first; enemy bullets the highest
+                    row = y0 + int(rows[-1] if pool.speed > 0 else rows[0])
+                    self.erode(shield, (x0 + x1) // 2, row)
+                    hits[i] = True
+                    break
+        if hits.any():
+            pool.remove(hits)
+    
+    def crush(self, xs, ys, width, height):
+        """Clear every shield pixel under the given rects, as enemies do when they reach the shields"""
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            for shield, x0, y0, x1, y1 in self.overlapping(x, y, width, height):
+                self.solid[shield, y0:y1, x0:x1] = False
+                self.mark_dirty(shield, x0, y0, x1, y1)
+    
+    def paint(self, surf, solid, x0=0, y0=0):
+        """Write a patch of the mask into a shield surface, solid pixels in SHIELD_COLOR"""
+        pixels = pygame.surfarray.pixels2d(surf)
+        pixels[x0:x0 + solid.shape[1], y0:y0 + solid.shape[0]] = np.where(
+            solid.T, surf.map_rgb(SHIELD_COLOR), surf.map_rgb(BLACK))
+        del pixels  # Unlocks the surface
+    
+    def draw(self, screen):
+        """Repaint the patches eroded since the last draw, blit the shields and return the rects drawn"""
+        if self.surfaces is None:
+            self.surfaces = []
+            for solid in self.solid:
+                surf = pygame.Surface((self.width, self.height), 0, 32)
+                surf.set_colorkey(BLACK)
+                self.paint(surf, solid)
+                self.surfaces.append(surf)
+            self.dirty = []
+        for shield, x0, y0, x1, y1 in self.dirty:
+            self.paint(self.surfaces[shield], self.solid[shield, y0:y1, x0:x1], x0, y0)
+        self.dirty = []
+        return [screen.blit(surf, (x, self.y)) for surf, x in zip(self.surfaces, self.xs)]
 
 class Player:
+    __slots__ = ("x", "y", "width", "height", "speed", "engine_glow", "previous_x")
+    
     def __init__(self, x, y):
         self.x = x
         self.y = y
         self.width = PLAYER_WIDTH
         self.height = PLAYER_HEIGHT
         self.speed = PLAYER_SPEED
-        self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
         self.engine_glow = 0
+        self.previous_x = x  # Position before the last tick, for interpolated drawing
+    
+    # x, y, engine glow, previous x
+    STATE = struct.Struct("<iiii")
+    
+    def pack(self):
+        return self.STATE.pack(self.x, self.y, self.engine_glow, self.previous_x)
+    
+    def unpack(self, data, offset):
+        """Restore from pack() output at offset and return the offset after it"""
+        self.x, self.y, self.engine_glow, self.previous_x = self.STATE.unpack_from(data, offset)
+        return offset + self.STATE.size
     
-    def update(self, keys):
-        if keys[pygame.K_LEFT] and self.x > 0:
+    def update(self, left, right):
+        self.previous_x = self.x
+        if left and self.x > 0:
             self.x -= self.speed
-        if keys[pygame.K_RIGHT] and self.x < SCREEN_WIDTH - self.width:
+        if right and self.x < SCREEN_WIDTH - self.width:
             self.x += self.speed
-        self.rect.x = self.x
-        self.rect.y = self.y
         self.engine_glow = (self.engine_glow + 5) % 360
+
+class BulletPool:
+    """Preallocated bullets of one kind stored as parallel NumPy arrays
     
-    def draw(self, screen):
-        center_x = self.x + self.width // 2
-        center_y = self.y + self.height // 2
-        
-        # Draw engine glow (animated)
-        glow_size = 8 + int(3 * math.sin(math.radians(self.engine_glow)))
-        pygame.draw.circle(screen, CYAN, (center_x, self.y + self.height + 5), glow_size)
-        pygame.draw.circle(screen, YELLOW, (center_x, self.y + self.height + 5), glow_size // 2)
-        
-        # Draw main body (detailed ship)
-        # Main hull
-        hull_points = [
-            (center_x, self.y),
-            (self.x + self.width * 0.2, self.y + self.height * 0.3),
-            (self.x, self.y + self.height * 0.7),
-            (self.x + self.width * 0.3, self.y + self.height),
-            (self.x + self.width * 0.7, self.y + self.height),
-            (self.x + self.width, self.y + self.height * 0.7),
-            (self.x + self.width * 0.8, self.y + self.height * 0.3)
-        ]
-        pygame.draw.polygon(screen, GREEN, hull_points)
-        pygame.draw.polygon(screen, DARK_GREEN, hull_points, 2)
-        
-        # Cockpit window
-        pygame.draw.ellipse(screen, CYAN, (self.x + self.width * 0.35, self.y + self.height * 0.2, 
-                                          self.width * 0.3, self.height * 0.25))
-        pygame.draw.ellipse(screen, LIGHT_BLUE, (self.x + self.width * 0.4, self.y + self.height * 0.25, 
-                                                 self.width * 0.2, self.height * 0.15))
-        
-        # Wing details
-        pygame.draw.line(screen, YELLOW, (self.x + self.width * 0.2, self.y + self.height * 0.5),
-                        (self.x + self.width * 0.2, self.y + self.height * 0.8), 2)
-        pygame.draw.line(screen, YELLOW, (self.x + self.width * 0.8, self.y + self.height * 0.5),
-                        (self.x + self.width * 0.8, self.y + self.height * 0.8), 2)
-        
-        # Gun turrets
-        pygame.draw.rect(screen, DARK_GREEN, (self.x + self.width * 0.15, self.y + self.height * 0.6, 
-                                             self.width * 0.1, self.height * 0.2))
-        pygame.draw.rect(screen, DARK_GREEN, (self.x + self.width * 0.75, self.y + self.height * 0.6, 
-                                             self.width * 0.1, self.height * 0.2))
-        
-        # Engine details
-        pygame.draw.rect(screen, ORANGE, (self.x + self.width * 0.4, self.y + self.height * 0.85, 
-                                         self.width * 0.2, self.height * 0.15))
-
-class Bullet:
-    def __init__(self, x, y, is_player=True):
-        self.x = x
-        self.y = y
-        self.width = BULLET_WIDTH
-        self.height = BULLET_HEIGHT
-        self.speed = BULLET_SPEED if is_player else -ENEMY_BULLET_SPEED
+    Live bullets occupy the first `count` slots. Moving and culling are
+    batched, and dead bullets are swap-removed, so steady-state
+    play allocates no per-bullet objects. The pool only grows, by doubling,
+    if it ever fills up.
+    
+    Swap-removal scrambles slot order, so each bullet also carries a spawn
+    serial; anything whose outcome depends on bullet order goes through
+    `in_spawn_order` to stay identical to the old list-based behaviour.
+    """
+    def __init__(self, speed, is_player, capacity=BULLET_CAPACITY):
+        self.speed = speed
         self.is_player = is_player
-        self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
-        self.trail = []
+        self.count = 0
+        self.next_serial = 0
+        self.allocate(capacity)
+    
+    def allocate(self, capacity):
+        n = self.count
+        old = getattr(self, "x", None)
+        arrays = {
+            "x": np.zeros(capacity, dtype=np.int32),
+            "y": np.zeros(capacity, dtype=np.int32),
+            "serial": np.zeros(capacity, dtype=np.int64),
+        }
+        for name, arr in arrays.items():
+            if old is not None:
+                arr[:n] = getattr(self, name)[:n]
+            setattr(self, name, arr)
+        self.capacity = capacity
+    
+    def __len__(self):
+        return self.count
+    
+    def clear(self):
+        self.count = 0
+    
+    def spawn(self, x, y):
+        """Add bullets at x, y (scalars or equal-length arrays)"""
+        xs = np.atleast_1d(x)
+        n = len(xs)
+        if self.count + n > self.capacity:
+            self.allocate(max(2 * self.capacity, self.count + n))
+        s = slice(self.count, self.count + n)
+        self.x[s] = xs
+        self.y[s] = y
+        self.serial[s] = np.arange(self.next_serial, self.next_serial + n)
+        self.next_serial += n
+        self.count += n
     
     def update(self):
-        self.y -= self.speed
-        self.rect.y = self.y
-        # Add trail effect
-        self.trail.append((self.x + self.width // 2, self.y + self.height))
-        if len(self.trail) > 5:
-            self.trail.pop(0)
+        """Move every bullet and cull those that left the screen"""
+        n = self.count
+        y = self.y[:n]
+        y -= self.speed
+        off_screen = (y < 0) | (y > SCREEN_HEIGHT)
+        if off_screen.any():
+            self.remove(off_screen)
     
-    def draw(self, screen):
-        if self.is_player:
-            # Player bullet - energy beam style
-            # Trail
-            for i, (tx, ty) in enumerate(self.trail):
-                alpha = i / len(self.trail) if len(self.trail) > 0 else 0
-                size = int(self.width * alpha)
-                if size > 0:
-                    pygame.draw.circle(screen, CYAN, (int(tx), int(ty)), size)
-            
-            # Main bullet
-            pygame.draw.rect(screen, YELLOW, self.rect)
-            pygame.draw.rect(screen, WHITE, (self.x + 1, self.y, self.width - 2, self.height // 2))
-            # Glow effect
-            glow_rect = pygame.Rect(self.x - 1, self.y - 1, self.width + 2, self.height + 2)
-            pygame.draw.rect(screen, CYAN, glow_rect, 1)
+    def remove(self, dead):
+        """Swap-remove the bullets flagged in `dead`, a bool array over the live slots"""
+        n = self.count
+        keep = n - int(np.count_nonzero(dead))
+        # Survivors past the new end move into the holes left inside it
+        holes = np.flatnonzero(dead[:keep])
+        fillers = np.flatnonzero(~dead[keep:n]) + keep
+        for arr in (self.x, self.y, self.serial):
+            arr[holes] = arr[fillers]
+        self.count = keep
+    
+    def overlapping(self, x, y, width, height):
+        """Return a bool mask of the live bullets that overlap the given rect"""
+        n = self.count
+        bx = self.x[:n]
+        by = self.y[:n]
+        return (bx < x + width) & (x < bx + BULLET_WIDTH) & (by < y + height) & (y < by + BULLET_HEIGHT)
+    
+    # count, next serial
+    STATE = struct.Struct("<Iq")
+    
+    def pack(self):
+        n = self.count
+        return self.STATE.pack(n, self.next_serial) + pack_arrays(self.x[:n], self.y[:n], self.serial[:n])
+    
+    def unpack(self, data, offset):
+        """Restore the live bullets from pack() output at offset; return the offset after it"""
+        n, self.next_serial = self.STATE.unpack_from(data, offset)
+        offset += self.STATE.size
+        self.count = 0
+        if n > self.capacity:
+            self.allocate(max(2 * self.capacity, n))
+        self.x[:n], offset = unpack_array(data, offset, np.int32, n)
+        self.y[:n], offset = unpack_array(data, offset, np.int32, n)
+        self.serial[:n], offset = unpack_array(data, offset, np.int64, n)
+        self.count = n
+        return offset
+    
+    def in_spawn_order(self, slots):
+        """Return the given slot indices sorted oldest bullet first"""
+        return slots[np.argsort(self.serial[slots], kind="stable")]
+    
+    def positions(self):
+        order = self.in_spawn_order(np.arange(self.count))
+        return list(zip(self.x[order].tolist(), self.y[order].tolist()))
+
+class EnemyFormation:
+    """The whole enemy wave as one array-backed entity
+    
+    Enemies move in lockstep, so an enemy's position is the formation origin
+    plus its cell offset. That leaves only the alive mask and animation
+    phases as per-enemy state. Edge detection, stepping, choosing shooters
+    and the bottom-row check are each a single array operation. The cells
+    also act as the broad phase for bullet collisions.
+    """
+    def __init__(self, origin_x, origin_y, rows, cols, rng):
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.previous_origin = (origin_x, origin_y)  # Origin before the last tick, for interpolated drawing
+        self.rows = rows
+        self.cols = cols
+        self.alive = np.ones((rows, cols), dtype=bool)
+        self.phase = rng.integers(0, 361, size=(rows, cols))  # Animation offset in degrees
+        self.count = rows * cols
+    
+    def __len__(self):
+        return self.count
+    
+    # origin, previous origin, rows, cols, living enemies
+    STATE = struct.Struct("<iiiiHHI")
+    
+    def pack(self):
+        return (self.STATE.pack(self.origin_x, self.origin_y, *self.previous_origin, self.rows, self.cols, self.count) +
+                pack_arrays(self.alive, self.phase.astype(np.int16)))
+    
+    def unpack(self, data, offset):
+        """Restore from pack() output at offset and return the offset after it"""
+        (self.origin_x, self.origin_y, previous_x, previous_y,
+         rows, cols, self.count) = self.STATE.unpack_from(data, offset)
+        self.previous_origin = (previous_x, previous_y)
+        offset += self.STATE.size
+        alive, offset = unpack_array(data, offset, np.bool_, rows * cols)
+        phase, offset = unpack_array(data, offset, np.int16, rows * cols)
+        if (rows, cols) != (self.rows, self.cols):
+            self.rows, self.cols = rows, cols
+            self.alive = np.empty((rows, cols), dtype=bool)
+            self.phase = np.empty((rows, cols), dtype=np.int64)
+        self.alive.flat[:] = alive
+        self.phase.flat[:] = phase
+        return offset
+    
+    def positions(self, lag=0.0):
+        """Return (xs, ys, phases) of the living enemies in row-major order
+        
+        A nonzero lag places the formation that fraction of a tick back
+        towards where it was before the last tick.
+        """
+        origin_x, origin_y = self.origin_x, self.origin_y
+        if lag:
+            previous_x, previous_y = self.previous_origin
+            origin_x = round(origin_x + (previous_x - origin_x) * lag)
+            origin_y = round(origin_y + (previous_y - origin_y) * lag)
+        rows, cols = np.nonzero(self.alive)
+        return (origin_x + cols * ENEMY_SPACING, origin_y + rows * ENEMY_SPACING, self.phase[rows, cols])
+    
+    def cell_position(self, row, col):
+        return self.origin_x + col * ENEMY_SPACING, self.origin_y + row * ENEMY_SPACING
+    
+    def at_edge(self, direction):
+        """Return True if a living enemy has reached the screen edge it is moving towards"""
+        if not self.count:
+            return False
+        occupied = np.flatnonzero(self.alive.any(axis=0))
+        if direction < 0:
+            return self.origin_x + occupied[0] * ENEMY_SPACING <= 0
+        return self.origin_x + occupied[-1] * ENEMY_SPACING >= SCREEN_WIDTH - ENEMY_WIDTH
+    
+    def bottom(self):
+        """Return the y of the lowest living enemy's bottom edge"""
+        occupied = np.flatnonzero(self.alive.any(axis=1))
+        return self.origin_y + occupied[-1] * ENEMY_SPACING + ENEMY_HEIGHT
+    
+    def move(self, dx, dy):
+        self.origin_x += dx
+        self.origin_y += dy
+    
+    def animate(self):
+        self.phase += 2
+        self.phase %= 360
+    
+    def kill(self, row, col):
+        self.alive[row, col] = False
+        self.count -= 1
+    
+    def choose_shooters(self, rng, chance):
+        """Roll once per living enemy (row-major) and return the (xs, ys) of those that fire"""
+        rows, cols = np.nonzero(self.alive)
+        fire = rng.random(len(rows)) < chance
+        return self.origin_x + cols[fire] * ENEMY_SPACING, self.origin_y + rows[fire] * ENEMY_SPACING
+    
+    def cell_span(self, start, length, size, count):
+        """Return the range of cells whose enemies can overlap [start, start + length)"""
+        first = max(0, (start - size) // ENEMY_SPACING + 1)
+        last = min(count - 1, -(-(start + length) // ENEMY_SPACING) - 1)
+        return range(first, last + 1)
+    
+    def bounding_rect(self):
+        """Return (x, y, width, height) covering every cell, dead or alive"""
+        return (self.origin_x, self.origin_y,
+                (self.cols - 1) * ENEMY_SPACING + ENEMY_WIDTH, (self.rows - 1) * ENEMY_SPACING + ENEMY_HEIGHT)
+    
+    def find_hit(self, x, y, width, height):
+        """Return the (row, col) of the first living enemy, in row-major order, that overlaps the rect"""
+        cols = self.cell_span(x - self.origin_x, width, ENEMY_WIDTH, self.cols)
+        if not cols:
+            return None
+        alive = self.alive
+        for row in self.cell_span(y - self.origin_y, height, ENEMY_HEIGHT, self.rows):
+            ey = self.origin_y + row * ENEMY_SPACING
+            if not (y < ey + ENEMY_HEIGHT and ey < y + height):
+                continue
+            for col in cols:
+                ex = self.origin_x + col * ENEMY_SPACING
+                if alive[row, col] and x < ex + ENEMY_WIDTH and ex < x + width:
+                    return row, col
+        return None
+
+# Entity rendering. These draw directly with pygame primitives and are used
+# to pre-render the sprite atlas.
+def enemy_eye_size(animation_offset):
+    return 4 + int(2 * math.sin(math.radians(animation_offset)))
+
+def engine_glow_size(engine_glow):
+    return 8 + int(3 * math.sin(math.radians(engine_glow)))
+
+def draw_player(screen, x, y, width, height, engine_glow, hull=GREEN, outline=DARK_GREEN):
+    """Draw the player ship with its top-left corner at (x, y)"""
+    center_x = x + width // 2
+    center_y = y + height // 2
+    
+    # Draw engine glow (animated)
+    glow_size = engine_glow_size(engine_glow)
+    pygame.draw.circle(screen, CYAN, (center_x, y + height + 5), glow_size)
+    pygame.draw.circle(screen, YELLOW, (center_x, y + height + 5), glow_size // 2)
+    
+    # Draw main body (detailed ship)
+    # Main hull
+    hull_points = [
+        (center_x, y),
+        (x + width * 0.2, y + height * 0.3),
+        (x, y + height * 0.7),
+        (x + width * 0.3, y + height),
+        (x + width * 0.7, y + height),
+        (x + width, y + height * 0.7),
+        (x + width * 0.8, y + height * 0.3)
+    ]
+    pygame.draw.polygon(screen, hull, hull_points)
+    pygame.draw.polygon(screen, outline, hull_points, 2)
+    
+    # Cockpit window
+    pygame.draw.ellipse(screen, CYAN, (x + width * 0.35, y + height * 0.2, 
+                                       width * 0.3, height * 0.25))
+    pygame.draw.ellipse(screen, LIGHT_BLUE, (x + width * 0.4, y + height * 0.25, 
+                                             width * 0.2, height * 0.15))
+    
+    # Wing details
+    pygame.draw.line(screen, YELLOW, (x + width * 0.2, y + height * 0.5),
+                     (x + width * 0.2, y + height * 0.8), 2)
+    pygame.draw.line(screen, YELLOW, (x + width * 0.8, y + height * 0.5),
+                     (x + width * 0.8, y + height * 0.8), 2)
+    
+    # Gun turrets
+    pygame.draw.rect(screen, DARK_GREEN, (x + width * 0.15, y + height * 0.6, 
+                                          width * 0.1, height * 0.2))
+    pygame.draw.rect(screen, DARK_GREEN, (x + width * 0.75, y + height * 0.6, 
+                                          width * 0.1, height * 0.2))
+    
+    # Engine details
+    pygame.draw.rect(screen, ORANGE, (x + width * 0.4, y + height * 0.85, 
+                                      width * 0.2, height * 0.15))
+
+def draw_bullet(screen, x, y, width, height, is_player):
+    """Draw a bullet at (x, y); its trail is drawn as light"""
+    if is_player:
+        # Player bullet - energy beam style
+        # Main bullet
+        pygame.draw.rect(screen, YELLOW, pygame.Rect(x, y, width, height))
+        pygame.draw.rect(screen, WHITE, (x + 1, y, width - 2, height // 2))
+        # Glow effect
+        glow_rect = pygame.Rect(x - 1, y - 1, width + 2, height + 2)
+        pygame.draw.rect(screen, CYAN, glow_rect, 1)
+    else:
+        # Enemy bullet - plasma style
+        # Main bullet
+        pygame.draw.ellipse(screen, RED, pygame.Rect(x, y, width, height))
+        pygame.draw.ellipse(screen, ORANGE, (x + 1, y + 1, width - 2, height - 2))
+        # Glow effect
+        glow_rect = pygame.Rect(x - 1, y - 1, width + 2, height + 2)
+        pygame.draw.ellipse(screen, RED, glow_rect, 1)
+
+def draw_enemy(screen, x, y, width, height, animation_offset):
+    """Draw an alien with its top-left corner at (x, y)"""
+    center_x = x + width // 2
+    center_y = y + height // 2
+    
+    # Animated glow effect
+    glow_intensity = 0.5 + 0.3 * math.sin(math.radians(animation_offset))
+    
+    # Main body - alien ship shape
+    # Top part (head)
+    head_points = [
+        (center_x, y),
+        (x + width * 0.2, y + height * 0.3),
+        (x + width * 0.4, y + height * 0.2),
+        (x + width * 0.6, y + height * 0.2),
+        (x + width * 0.8, y + height * 0.3)
+    ]
+    pygame.draw.polygon(screen, RED, head_points)
+    
+    # Body (main rectangle with details)
+    body_rect = pygame.Rect(x + width * 0.15, y + height * 0.3, 
+                            width * 0.7, height * 0.5)
+    pygame.draw.rect(screen, DARK_RED, body_rect)
+    pygame.draw.rect(screen, RED, body_rect, 2)
+    
+    # Glowing eyes (animated)
+    eye_size = enemy_eye_size(animation_offset)
+    left_eye_x = x + width * 0.3
+    right_eye_x = x + width * 0.7
+    eye_y = y + height * 0.4
+    
+    pygame.draw.circle(screen, YELLOW, (int(left_eye_x), int(eye_y)), eye_size)
+    pygame.draw.circle(screen, WHITE, (int(left_eye_x), int(eye_y)), eye_size // 2)
+    pygame.draw.circle(screen, YELLOW, (int(right_eye_x), int(eye_y)), eye_size)
+    pygame.draw.circle(screen, WHITE, (int(right_eye_x), int(eye_y)), eye_size // 2)
+    
+    # Mouth/teeth
+    mouth_y = y + height * 0.6
+    for i in range(3):
+        tooth_x = x + width * 0.3 + i * width * 0.15
+        pygame.draw.polygon(screen, WHITE, [
+            (tooth_x, mouth_y),
+            (tooth_x + width * 0.05, mouth_y + height * 0.1),
+            (tooth_x - width * 0.05, mouth_y + height * 0.1)
+        ])
+    
+    # Tentacles/legs
+    for i in range(4):
+        tentacle_x = x + width * 0.2 + i * width * 0.2
+        tentacle_start_y = y + height * 0.8
+        tentacle_end_y = y + height
+        pygame.draw.line(screen, PURPLE, (tentacle_x, tentacle_start_y), 
+                         (tentacle_x, tentacle_end_y), 2)
+        pygame.draw.circle(screen, PURPLE, (int(tentacle_x), int(tentacle_end_y)), 3)
+    
+    # Decorative details
+    pygame.draw.line(screen, BLUE, (x + width * 0.25, y + height * 0.5),
+                     (x + width * 0.75, y + height * 0.5), 1)
+
+def render_sprite(draw, width, height, pad):
+    """Draw an entity into a padded surface and crop it to its visible pixels
+    
+    Returns the sprite and the (dx, dy) offset to blit it at relative to the
+    entity's top-left corner.
+    """
+    surf = pygame.Surface((width + 2 * pad, height + 2 * pad))
+    surf.set_colorkey(BLACK)
+    draw(surf, pad, pad)
+    bounds = surf.get_bounding_rect()
+    sprite = pygame.Surface(bounds.size)
+    sprite.blit(surf, (0, 0), bounds)
+    sprite.set_colorkey(BLACK, pygame.RLEACCEL)
+    return sprite, (bounds.x - pad, bounds.y - pad)
+
+class SpriteAtlas:
+    """Pre-rendered entity sprites, one per distinct animation phase
+    
+    Enemy frames only differ in eye size and player frames in engine glow
+    size, so each distinct size is rendered once and the animation counters
+    index a lookup table. Bullets have one frame per type. The atlas is
+    rebuilt whenever one of the size constants it was rendered with changes.
+    """
+    def __init__(self):
+        self.key = None
+    
+    def current_key(self):
+        return (PLAYER_WIDTH, PLAYER_HEIGHT, ENEMY_WIDTH, ENEMY_HEIGHT, BULLET_WIDTH, BULLET_HEIGHT)
+    
+    def sync(self):
+        """Rebuild the sprites if the size constants have changed"""
+        key = self.current_key()
+        if key != self.key:
+            self.build()
+            self.key = key
+    
+    def build(self):
+        # Enemies: one frame per eye size, looked up by animation offset (0-360)
+        pad = max(ENEMY_WIDTH, ENEMY_HEIGHT)
+        frames = {}
+        self.enemy_frames = []
+        for offset in range(361):
+            eye_size = enemy_eye_size(offset)
+            if eye_size not in frames:
+                frames[eye_size] = render_sprite(
+                    lambda surf, x, y: draw_enemy(surf, x, y, ENEMY_WIDTH, ENEMY_HEIGHT, offset),
+                    ENEMY_WIDTH, ENEMY_HEIGHT, pad)
+            self.enemy_frames.append(frames[eye_size])
+        
+        # Players: one frame per engine glow size, for each ship colour
+        pad = max(PLAYER_WIDTH, PLAYER_HEIGHT)
+        self.player_frames = []
+        for hull, outline in PLAYER_COLORS:
+            frames = {}
+            glow_frames = []
+            for glow in range(360):
+                glow_size = engine_glow_size(glow)
+                if glow_size not in frames:
+                    frames[glow_size] = render_sprite(
+                        lambda surf, x, y: draw_player(surf, x, y, PLAYER_WIDTH, PLAYER_HEIGHT, glow, hull, outline),
+                        PLAYER_WIDTH, PLAYER_HEIGHT, pad)
+                glow_frames.append(frames[glow_size])
+            self.player_frames.append(glow_frames)
+        
+        # Bullets: one frame for each bullet type
+        self.bullet_frames = {}
+        for is_player in (True, False):
+            self.bullet_frames[is_player] = render_sprite(
+                lambda surf, x, y: draw_bullet(surf, x, y, BULLET_WIDTH, BULLET_HEIGHT, is_player),
+                BULLET_WIDTH, BULLET_HEIGHT, BULLET_WIDTH)
+    
+    # The draw methods return the screen rects they touched. `lag` is how far
+    # of a tick behind the simulation to draw, for interpolated rendering
+    def draw_enemies(self, screen, formation, lag=0.0):
+        frames = self.enemy_frames
+        xs, ys, phases = formation.positions(lag)
+        blits = []
+        for x, y, phase in zip(xs.tolist(), ys.tolist(), phases.tolist()):
+            sprite, (dx, dy) = frames[phase]
+            blits.append((sprite, (x + dx, y + dy)))
+        return screen.blits(blits)
+    
+    def draw_bullets(self, screen, pool, lag=0.0):
+        sprite, (dx, dy) = self.bullet_frames[pool.is_player]
+        # Consecutive shots overlap, so newer bullets must be drawn over older ones
+        order = pool.in_spawn_order(np.arange(pool.count))
+        # Bullets move at a constant speed, so the previous position is one step back
+        ys = pool.y[order] + round(pool.speed * lag)
+        return screen.blits([(sprite, (x + dx, y + dy)) for x, y in zip(pool.x[order].tolist(), ys.tolist())])
+    
+    def draw_player(self, screen, player, lag=0.0, number=0):
+        sprite, (dx, dy) = self.player_frames[number][player.engine_glow]
+        x = round(player.x + (player.previous_x - player.x) * lag)
+        return screen.blit(sprite, (x + dx, player.y + dy))
+
+def blur(light, scratch):
+    """Blur a (channels, width, height) array in place by a 1-2-1 kernel along x and y
+    
+    `scratch` is a same-shaped array to work in. The kernel is not
+    normalized, so the result is 16 times brighter. Cells past the edges
+    count as dark, so light spreading off the array is lost.
+    """
+    np.multiply(light, 2, out=scratch)
+    scratch[:, 1:] += light[:, :-1]
+    scratch[:, :-1] += light[:, 1:]
+    # Slicing the inner axis makes NumPy copy both operands, so the second pass
+    # shifts the flattened arrays and then redoes the cells at the ends of
+    # each column, which picked up light from the neighbouring column
+    np.multiply(scratch, 2, out=light)
+    flat, spread = light.reshape(-1), scratch.reshape(-1)
+    flat[1:] += spread[:-1]
+    flat[:-1] += spread[1:]
+    for edge, inner in ((0, 1), (-1, -2)):
+        np.multiply(scratch[:, :, edge], 2, out=light[:, :, edge])
+        light[:, :, edge] += scratch[:, :, inner]
+
+def scratch_view(buffer, shape):
+    """Return a contiguous array of `shape` over the start of a flat buffer"""
+    return buffer[:math.prod(shape)].reshape(shape)
+
+class LightCompositor:
+    """Additive light for glows, bullet trails and particles
+    
+    Emitters add light to a float buffer at 1/LIGHT_SCALE of the screen
+    resolution. On each drawn frame the buffer fades by LIGHT_DECAY per
+    elapsed tick, so moving lights leave trails, the new light is added and
+    a 1-2-1 blur spreads it into a glow. The buffer is then written to a
+    surface with one surfarray blit, scaled up and added to the screen
+    with a saturating BLEND_ADD. Only the lit part of the screen is stored,
+    so every pass costs what the glowing area does, however many things
+    emit light. The passes work in views over the start of preallocated
+    flat buffers, which keeps each pass's array contiguous without
+    allocating a new one every frame.
+    """
+    def __init__(self):
+        self.width = -(-SCREEN_WIDTH // LIGHT_SCALE)
+        self.height = -(-SCREEN_HEIGHT // LIGHT_SCALE)
+        self.lit = None  # (x0, y0, x1, y1) cell bounds of the light above LIGHT_THRESHOLD
+        self.light = None  # Light within `lit`, one x-major plane per channel in 0-255 units
+        size = 3 * self.width * self.height
+        # `light` lives in the first buffer; a frame is built in the second and blurred using the third
+        self.buffers = [np.zeros(size, dtype=np.float32) for _ in range(3)]
+        # Rounded up to whole tiles for visible_tiles
+        self.brightest = np.zeros(-(-self.width // LIGHT_TILE) * -(-self.height // LIGHT_TILE) * LIGHT_TILE ** 2,
+                                  dtype=np.float32)
+        self.pixels = np.zeros(size, dtype=np.uint8)
+        self.cells = pygame.Surface((self.width, self.height), 0, 32)
+        self.smoothed = pygame.Surface((self.width * 2, self.height * 2), 0, 32)
+        self.scaled = pygame.Surface((self.width * LIGHT_SCALE, self.height * LIGHT_SCALE), 0, 32)
+        self.time = None
+        self.emitted = []  # (xs, ys, rgb) added since the last composite
+    
+    def emit(self, xs, ys, rgb):
+        """Add light at screen positions xs, ys; rgb is one colour or one per position"""
+        if len(xs):
+            self.emitted.append((xs, ys, np.broadcast_to(rgb, (len(xs), 3))))
+    
+    # Emitters take the same `lag` as the atlas draw methods
+    def add_particles(self, particles, lag=0.0):
+        """Particles glow in their colour and fade as they shrink"""
+        n = particles.count
+        xs, ys = particles.x[:n], particles.y[:n]
+        if lag:
+            xs = xs - particles.vx[:n] * lag
+            ys = ys - particles.vy[:n] * lag
+        palette = np.array(PARTICLE_COLORS, dtype=np.float32) * (
+            PARTICLE_LIGHT / (255 * PARTICLE_MAX_SIZE * PARTICLE_LIFETIME))
+        rgb = palette[particles.color[:n]]
+        rgb *= (particles.size[:n] * particles.lifetime[:n])[:, np.newaxis]
+        self.emit(xs, ys, rgb)
+    
+    def add_bullets(self, pool, lag=0.0):
+        n = pool.count
+        color = np.array(CYAN if pool.is_player else RED) * (BULLET_LIGHT / 255)
+        self.emit(pool.x[:n] + BULLET_WIDTH / 2, pool.y[:n] + (BULLET_HEIGHT / 2 + pool.speed * lag), color)
+    
+    def add_engine(self, player, lag=0.0):
+        x = player.x + (player.previous_x - player.x) * lag + player.width / 2
+        strength = ENGINE_LIGHT * engine_glow_size(player.engine_glow) / engine_glow_size(0)
+        self.emit(np.array([x]), np.array([player.y + player.height]), np.array(ORANGE) * (strength / 255))
+    
+    def advance(self, ticks):
+        """Fade the light by `ticks` ticks, add what was emitted for that long and blur it"""
+        region = self.lit
+        xs = ()
+        if self.emitted:
+            xs, ys, rgb = (np.concatenate(parts) for parts in zip(*self.emitted))
+            xs = np.floor_divide(xs, LIGHT_SCALE, out=xs).astype(np.intp)
+            ys = np.floor_divide(ys, LIGHT_SCALE, out=ys).astype(np.intp)
+            # Light off the screen is rare, so only filter when there is some
+            if xs.min() < 0 or xs.max() >= self.width or ys.min() < 0 or ys.max() >= self.height:
+                inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+                xs, ys, rgb = xs[inside], ys[inside], rgb[inside]
+            if len(xs):
+                bounds = (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+                region = bounds if region is None else (
+                    min(region[0], bounds[0]), min(region[1], bounds[1]),
+                    max(region[2], bounds[2]), max(region[3], bounds[3]))
+        if region is None:
+            return
+        
+        # The blur spreads light one cell past the region
+        x0, y0 = max(region[0] - 1, 0), max(region[1] - 1, 0)
+        x1, y1 = min(region[2] + 1, self.width), min(region[3] + 1, self.height)
+        width, height = x1 - x0, y1 - y0
+        stored, frame, scratch = self.buffers
+        light = scratch_view(frame, (3, width, height))
+        light[...] = 0
+        # Everything is scaled by 1/16 ahead of the blur, which brightens by 16.
+        # Arithmetic into a box of `light` would copy it, so the old light is
+        # copied in as it is and faded with the whole region
+        if self.lit:
+            lx0, ly0, lx1, ly1 = self.lit
+            light[:, lx0 - x0:lx1 - x0, ly0 - y0:ly1 - y0] = self.light
+            light *= LIGHT_DECAY ** ticks / 16
+        if len(xs):
+            # The cell index is built in xs's own memory
+            cell = xs
+            cell -= x0
+            cell *= height
+            cell += ys
+            cell -= y0
+            rgb *= ticks / 16
+            planes = light.reshape(3, width * height)
+            # np.add.at costs about as much per deposit as bincount does per
+            # 64 cells, but bincount allocates a region-sized plane each time
+            if len(cell) * 64 < width * height:
+                for channel in range(3):
+                    np.add.at(planes[channel], cell, rgb[:, channel])
+            else:
+                for channel in range(3):
+                    planes[channel] += np.bincount(cell, rgb[:, channel], width * height)
+        blur(light, scratch_view(scratch, light.shape))
+        
+        # Crop to the cells still bright enough to see
+        brightest = scratch_view(self.brightest, (width, height))
+        np.max(light, axis=0, out=brightest)
+        cols = np.flatnonzero((brightest > LIGHT_THRESHOLD).any(axis=1))
+        if not len(cols):
+            self.lit = self.light = None
+            return
+        rows = np.flatnonzero((brightest[cols[0]:cols[-1] + 1] > LIGHT_THRESHOLD).any(axis=0))
+        c0, c1, r0, r1 = int(cols[0]), int(cols[-1]) + 1, int(rows[0]), int(rows[-1]) + 1
+        self.lit = (x0 + c0, y0 + r0, x0 + c1, y0 + r1)
+        self.light = scratch_view(stored, (3, c1 - c0, r1 - r0))
+        self.light[...] = light[:, c0:c1, r0:r1]
+    
+    def composite(self, screen, time):
+        """Advance the light to `time`, in ticks, add it to the screen and return the rects it changed"""
+        ticks = 0.0 if self.time is None else min(max(time - self.time, 0.0), MAX_CATCH_UP_TICKS)
+        self.time = time
+        # Two draws at the same time show the same light
+        if ticks:
+            self.advance(ticks)
+        self.emitted = []
+        if self.lit is None:
+            return None
+        x0, y0, x1, y1 = self.lit
+        cells = self.cells.subsurface((x0, y0, x1 - x0, y1 - y0))
+        # Clipping and casting in one strided pass would copy the light, so the
+        # clipped planes are cast while they are interleaved. blit_array also
+        # leaks a little on every call given a strided array
+        clipped = scratch_view(self.buffers[2], self.light.shape)
+        np.minimum(self.light, 255, out=clipped)
+        rgb = scratch_view(self.pixels, (x1 - x0, y1 - y0, 3))
+        rgb[...] = np.moveaxis(clipped, 0, 2)
+        pygame.surfarray.blit_array(cells, rgb)
+        # Smooth scaling is the slowest pass, so it only doubles the resolution and plain scaling does the rest
+        smoothed = self.smoothed.subsurface((0, 0), ((x1 - x0) * 2, (y1 - y0) * 2))
+        pygame.transform.smoothscale(cells, smoothed.get_size(), smoothed)
+        size = ((x1 - x0) * LIGHT_SCALE, (y1 - y0) * LIGHT_SCALE)
+        pygame.transform.scale(smoothed, size, self.scaled.subsurface((0, 0), size))
+        drawn = screen.blit(self.scaled, (x0 * LIGHT_SCALE, y0 * LIGHT_SCALE), ((0, 0), size), pygame.BLEND_ADD)
+        return [rect.clip(drawn) for rect in self.visible_tiles(clipped)]
+    
+    def visible_tiles(self, clipped):
+        """Return screen rects around the tiles holding light bright enough to change a pixel
+        
+        Adding black changes nothing, so the scattered glows of bullets
+        across the screen dirty only the tiles around them rather than the
+        whole lit box.
+        """
+        x0, y0 = self.lit[:2]
+        width, height = clipped.shape[1:]
+        across, down = -(-width // LIGHT_TILE), -(-height // LIGHT_TILE)
+        brightest = scratch_view(self.brightest, (across * LIGHT_TILE, down * LIGHT_TILE))
+        brightest[width:] = 0
+        brightest[:, height:] = 0
+        visible = brightest[:width, :height]
+        np.maximum(clipped[0], clipped[1], out=visible)
+        np.maximum(visible, clipped[2], out=visible)
+        # Taking the maximum of strided slices is much faster than reduceat
+        rows = brightest[0::LIGHT_TILE].copy()
+        for offset in range(1, LIGHT_TILE):
+            np.maximum(rows, brightest[offset::LIGHT_TILE], out=rows)
+        tiles = rows[:, 0::LIGHT_TILE].copy()
+        for offset in range(1, LIGHT_TILE):
+            np.maximum(tiles, rows[:, offset::LIGHT_TILE], out=tiles)
+        # Join the tiles down each column into runs, which follow the bullets'
+        # trails. A dark tile closes every column, so no run spans two
+        column = np.zeros((across, down + 1), dtype=np.int8)
+        column[:, :down] = tiles >= 1
+        edges = np.diff(column.ravel(), prepend=0)
+        starts = np.flatnonzero(edges == 1)
+        lengths = np.flatnonzero(edges == -1) - starts
+        # Smoothing spreads light up to a cell past its tile
+        side = LIGHT_TILE * LIGHT_SCALE
+        left = x0 * LIGHT_SCALE - LIGHT_SCALE
+        top = y0 * LIGHT_SCALE - LIGHT_SCALE
+        return [pygame.Rect(left + tx * side, top + ty * side, side + 2 * LIGHT_SCALE, length * side + 2 * LIGHT_SCALE)
+                for tx, ty, length in zip(*(arr.tolist() for arr in np.divmod(starts, down + 1)), lengths.tolist())]
+
+class CachedText:
+    """A rendered text surface that is only re-rendered when its text or colour changes"""
+    def __init__(self, font, color):
+        self.font = font
+        self.color = color
+        self.key = None
+        self.surface = None
+    
+    def render(self, text, color=None):
+        key = (text, color or self.color)
+        if key != self.key:
+            self.surface = self.font.render(text, True, key[1])
+            self.key = key
+        return self.surface
+
+class DirtyRectRenderer:
+    """Redraw and present only the parts of the screen that changed
+    
+    Each draw call records the rects it touched under a layer name. At the
+    start of the next frame those rects are cleared to the background, and
+    only the previous and current rects are pushed to the display.
+    """
+    def __init__(self, screen, background=BLACK):
+        self.screen = screen
+        self.background = background
+        self.screen_rect = screen.get_rect()
+        self.layers = {}
+        # The screen contents are undefined until the first full repaint
+        self.previous = [self.screen_rect]
+    
+    def begin(self):
+        """Erase everything drawn last frame"""
+        for rect in self.previous:
+            self.screen.fill(self.background, rect)
+        self.layers = {}
+    
+    def add(self, layer, rects):
+        """Record a rect, a list of rects, or None as touched on this frame"""
+        if rects is None:
+            return
+        if isinstance(rects, pygame.Rect):
+            rects = [rects]
+        self.layers.setdefault(layer, []).extend(rects)
+    
+    def invalidate(self):
+        """Force the next frame to repaint the whole screen"""
+        self.previous = [self.screen_rect]
+    
+    def present(self):
+        current = []
+        for rects in self.layers.values():
+            # Many small rects cost more to push than their bounding box, unless
+            # they are scattered and the box would clear and push far more pixels
+            if len(rects) > DIRTY_MERGE_THRESHOLD:
+                box = rects[0].unionall(rects)
+                if box.width * box.height <= DIRTY_MERGE_SLACK * sum(rect.width * rect.height for rect in rects):
+                    current.append(box)
+                    continue
+            current.extend(rects)
+        dirty = self.previous + current
+        # Each rect is pushed on its own, so overlaps count twice, and only a
+        # total near the screen's area makes a flip cheaper
+        area = sum(rect.width * rect.height for rect in dirty)
+        if area >= DIRTY_FULL_UPDATE_RATIO * self.screen_rect.width * self.screen_rect.height:
+            pygame.display.flip()
         else:
-            # Enemy bullet - plasma style
-            # Trail
-            for i, (tx, ty) in enumerate(self.trail):
-                alpha = i / len(self.trail) if len(self.trail) > 0 else 0
-                size = int(self.width * alpha)
-                if size > 0:
-                    pygame.draw.circle(screen, RED, (int(tx), int(ty)), size)
-            
-            # Main bullet
-            pygame.draw.ellipse(screen, RED, self.rect)
-            pygame.draw.ellipse(screen, ORANGE, (self.x + 1, self.y + 1, self.width - 2, self.height - 2))
-            # Glow effect
-            glow_rect = pygame.Rect(self.x - 1, self.y - 1, self.width + 2, self.height + 2)
-            pygame.draw.ellipse(screen, RED, glow_rect, 1)
+            pygame.display.update(dirty)
+        self.previous = current
+
+class FrameCapture:
+    """Stream drawn frames to a file from a background writer thread
+    
+    capture() reads the surface through its buffer view and copies it into
+    one of CAPTURE_BUFFERS preallocated frames, the only copy made on the
+    game's thread. The writer thread XORs each frame against the previous
+    one, zlib-compresses the mostly-zero delta and appends it to the file.
+    With compress=False, frames are written raw instead. If the writer falls
+    behind, capture() waits for a free buffer rather than dropping frames;
+    that wait is counted in stall_seconds.
+    
+    On disk: a header, then per frame a 4-byte length and its payload.
+    """
+    MAGIC = b"SICAP"
+    VERSION = 1
+    # magic, version, compressed, width, height, pitch, frame rate, red/green/blue shifts
+    HEADER = struct.Struct("<5sBBHHIHBBB")
+    FRAME = struct.Struct("<I")
+    
+    def __init__(self, path, surface, fps=FPS, compress=True, buffers=CAPTURE_BUFFERS):
+        if surface.get_bytesize() != 4:
+            raise ValueError("frame capture needs a 32-bit surface")
+        self.surface = surface
+        self.compress = compress
+        self.frames = 0
+        self.stall_seconds = 0.0
+        self.error = None
+        width, height = surface.get_size()
+        self.frame_size = height * surface.get_pitch()
+        red, green, blue, _ = surface.get_shifts()
+        self.file = open(path, "wb")
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, compress, width, height,
+                                         surface.get_pitch(), fps, red, green, blue))
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(np.empty(self.frame_size, dtype=np.uint8))
+        self.pending = queue.Queue(maxsize=buffers)
+        self.thread = threading.Thread(target=self.write_frames, name="frame-capture", daemon=True)
+        self.thread.start()
+    
+    def capture(self):
+        """Queue the surface's current contents as the next frame"""
+        try:
+            frame = self.free.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            frame = self.free.get()
+            self.stall_seconds += time.perf_counter() - start
+        view = self.surface.get_buffer()
+        np.copyto(frame, np.frombuffer(view, dtype=np.uint8))
+        del view  # The surface stays locked while the view exists
+        self.pending.put(frame)
+        self.frames += 1
+    
+    def write_frames(self):
+        previous = np.zeros(self.frame_size, dtype=np.uint8)
+        delta = np.empty_like(previous)
+        while True:
+            frame = self.pending.get()
+            if frame is None:
+                return
+            if self.error is None:
+                try:
+                    if self.compress:
+                        np.bitwise_xor(frame, previous, out=delta)
+                        previous[:] = frame
+                        data = zlib.compress(delta, CAPTURE_ZLIB_LEVEL)
+                    else:
+                        data = frame
+                    self.file.write(self.FRAME.pack(len(data)))
+                    self.file.write(data)
+                except OSError as e:
+                    # Keep recycling buffers so the game never blocks on a dead writer
+                    self.error = e
+            self.free.put(frame)
     
-    def is_off_screen(self):
-        return self.y < 0 or self.y > SCREEN_HEIGHT
+    def close(self):
+        """Wait for queued frames to be written, then close the file"""
+        self.pending.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error:
+            raise self.error
 
-class Enemy:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.width = ENEMY_WIDTH
-        self.height = ENEMY_HEIGHT
-        self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
-        self.animation_offset = random.randint(0, 360)
+class CaptureReader:
+    """Read back a FrameCapture file; iterating yields (height, width, 3) RGB frames"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(FrameCapture.HEADER.size)
+        if len(header) != FrameCapture.HEADER.size:
+            raise ValueError("not a Space Invaders capture")
+        (magic, version, self.compressed, self.width, self.height, self.pitch, self.fps,
+         *self.shifts) = FrameCapture.HEADER.unpack(header)
+        if magic != FrameCapture.MAGIC or version != FrameCapture.VERSION:
+            raise ValueError("not a Space Invaders capture (or an unsupported version)")
     
-    def update(self, direction):
-        self.x += direction
-        self.rect.x = self.x
-        self.animation_offset = (self.animation_offset + 2) % 360
+    def __iter__(self):
+        frame = np.zeros(self.height * self.pitch, dtype=np.uint8)
+        with open(self.path, "rb") as f:
+            f.seek(FrameCapture.HEADER.size)
+            while True:
+                length = f.read(FrameCapture.FRAME.size)
+                if len(length) < FrameCapture.FRAME.size:
+                    return
+                size = FrameCapture.FRAME.unpack(length)[0]
+                data = f.read(size)
+                if len(data) < size:
+                    return  # The game stopped mid-frame
+                if self.compressed:
+                    frame ^= np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+                else:
+                    frame = np.frombuffer(data, dtype=np.uint8)
+                pixels = frame.view(np.uint32).reshape(self.height, self.pitch // 4)[:, :self.width]
+                yield np.dstack([(pixels >> shift).astype(np.uint8) for shift in self.shifts])
+
+class FrameTimeHistogram:
+    """Counts of drawn frame times in fixed-width bins
     
-    def move_down(self):
-        self.y += 20
-        self.rect.y = self.y
+    A game's frame-time percentiles come from here rather than from a list
+    of every frame, so memory stays the same however long the game runs.
+    Percentiles are the middle of the bin they fall in, good to within
+    FRAME_HISTOGRAM_BIN_MS.
+    """
+    def __init__(self):
+        self.counts = [0] * (int(FRAME_HISTOGRAM_MAX_MS / FRAME_HISTOGRAM_BIN_MS) + 1)
+        self.total = 0
     
-    def draw(self, screen):
-        center_x = self.x + self.width // 2
-        center_y = self.y + self.height // 2
-        
-        # Animated glow effect
-        glow_intensity = 0.5 + 0.3 * math.sin(math.radians(self.animation_offset))
-        
-        # Main body - alien ship shape
-        # Top part (head)
-        head_points = [
-            (center_x, self.y),
-            (self.x + self.width * 0.2, self.y + self.height * 0.3),
-            (self.x + self.width * 0.4, self.y + self.height * 0.2),
-            (self.x + self.width * 0.6, self.y + self.height * 0.2),
-            (self.x + self.width * 0.8, self.y + self.height * 0.3)
-        ]
-        pygame.draw.polygon(screen, RED, head_points)
-        
-        # Body (main rectangle with details)
-        body_rect = pygame.Rect(self.x + self.width * 0.15, self.y + self.height * 0.3, 
-                               self.width * 0.7, self.height * 0.5)
-        pygame.draw.rect(screen, DARK_RED, body_rect)
-        pygame.draw.rect(screen, RED, body_rect, 2)
-        
-        # Glowing eyes (animated)
-        eye_size = 4 + int(2 * math.sin(math.radians(self.animation_offset)))
-        left_eye_x = self.x + self.width * 0.3
-        right_eye_x = self.x + self.width * 0.7
-        eye_y = self.y + self.height * 0.4
-        
-        pygame.draw.circle(screen, YELLOW, (int(left_eye_x), int(eye_y)), eye_size)
-        pygame.draw.circle(screen, WHITE, (int(left_eye_x), int(eye_y)), eye_size // 2)
-        pygame.draw.circle(screen, YELLOW, (int(right_eye_x), int(eye_y)), eye_size)
-        pygame.draw.circle(screen, WHITE, (int(right_eye_x), int(eye_y)), eye_size // 2)
-        
-        # Mouth/teeth
-        mouth_y = self.y + self.height * 0.6
-        for i in range(3):
-            tooth_x = self.x + self.width * 0.3 + i * self.width * 0.15
-            pygame.draw.polygon(screen, WHITE, [
-                (tooth_x, mouth_y),
-                (tooth_x + self.width * 0.05, mouth_y + self.height * 0.1),
-                (tooth_x - self.width * 0.05, mouth_y + self.height * 0.1)
-            ])
-        
-        # Tentacles/legs
-        for i in range(4):
-            tentacle_x = self.x + self.width * 0.2 + i * self.width * 0.2
-            tentacle_start_y = self.y + self.height * 0.8
-            tentacle_end_y = self.y + self.height
-            pygame.draw.line(screen, PURPLE, (tentacle_x, tentacle_start_y), 
-                           (tentacle_x, tentacle_end_y), 2)
-            pygame.draw.circle(screen, PURPLE, (int(tentacle_x), int(tentacle_end_y)), 3)
-        
-        # Decorative details
-        pygame.draw.line(screen, BLUE, (self.x + self.width * 0.25, self.y + self.height * 0.5),
-                        (self.x + self.width * 0.75, self.y + self.height * 0.5), 1)
+    def __len__(self):
+        return self.total
+    
+    def add(self, seconds):
+        self.counts[min(int(seconds * 1000.0 / FRAME_HISTOGRAM_BIN_MS), len(self.counts) - 1)] += 1
+        self.total += 1
+    
+    def clear(self):
+        self.counts = [0] * len(self.counts)
+        self.total = 0
+    
+    def percentiles(self, qs):
+        """Return the frame time in milliseconds at each percentile in qs"""
+        ranks = np.ceil(np.asarray(qs) / 100.0 * self.total).clip(1)
+        bins = np.searchsorted(np.cumsum(self.counts), ranks)
+        return (bins + 0.5) * FRAME_HISTOGRAM_BIN_MS
+
+class ScoreStore:
+    """High scores and per-game telemetry in a local SQLite database
+    
+    record() only queues a finished game's row, so the game loop never
+    waits on the disk. A writer thread, started by the first record(), owns
+    the writing connection and commits every row that queues up within SCORE_BATCH_SECONDS of the
+    first in one transaction. Queries open their own read-only connection;
+    the database is in WAL mode, so reading never blocks the writer. If the
+    database cannot be opened or written, rows are dropped and the error
+    is kept in `error`.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY,
+            player TEXT NOT NULL,
+            started REAL NOT NULL,      -- Unix time
+            seed TEXT NOT NULL,         -- Seeds can exceed 64 bits
+            coop INTEGER NOT NULL,
+            finished INTEGER NOT NULL,  -- 0 if the window was closed mid-game
+            won INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            frames INTEGER NOT NULL,
+            shots INTEGER NOT NULL,
+            hits INTEGER NOT NULL,
+            lives_lost INTEGER NOT NULL,
+            frame_p50_ms REAL,
+            frame_p99_ms REAL
+        );
+        -- Only finished games rank, so the index holds nothing else
+        CREATE INDEX IF NOT EXISTS games_by_score ON games (score DESC, started) WHERE finished;
+        CREATE INDEX IF NOT EXISTS games_by_player ON games (player, started DESC);
+    """
+    COLUMNS = ("player", "started", "seed", "coop", "finished", "won", "score", "frames", "shots", "hits",
+               "lives_lost", "frame_p50_ms", "frame_p99_ms")
+    INSERT = f"INSERT INTO games ({', '.join(COLUMNS)}) VALUES ({', '.join(':' + name for name in COLUMNS)})"
+    SELECT = f"SELECT {', '.join(COLUMNS)}, CAST(hits AS REAL) / NULLIF(shots, 0) AS hit_ratio FROM games"
+    
+    def __init__(self, path=SCORE_DB_PATH):
+        self.path = path
+        self.error = None
+        self.pending = queue.Queue()
+        self.thread = None
+    
+    def connect(self):
+        """Open the database, creating it and its schema if needed"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(self.SCHEMA)
+        return db
+    
+    def record(self, row):
+        """Queue a game's row (a dict with every name in COLUMNS) to be written"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.write_games, name="score-store", daemon=True)
+            self.thread.start()
+        self.pending.put(row)
+    
+    def write_games(self):
+        try:
+            db = self.connect()
+        except (OSError, sqlite3.Error) as e:
+            self.error = e
+            db = None
+        while True:
+            rows = [self.pending.get()]
+            deadline = time.monotonic() + SCORE_BATCH_SECONDS
+            while rows[-1] is not None:
+                try:
+                    rows.append(self.pending.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            done = rows[-1] is None
+            if done:
+                rows.pop()
+            if rows and db is not None and self.error is None:
+                try:
+                    with db:
+                        db.executemany(self.INSERT, rows)
+                except sqlite3.Error as e:
+                    # Later rows are dropped rather than retried
+                    self.error = e
+            if done:
+                if db is not None:
+                    db.close()
+                return
+    
+    def close(self):
+        """Wait for queued rows to be written, then close the database"""
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+    
+    def query(self, sql, params):
+        """Run a SELECT over the games and return the rows as dicts; a database not yet created has none
+        
+        The database is opened read-only, so looking at scores never creates
+        it or changes its journal mode.
+        """
+        if not os.path.exists(self.path):
+            return []
+        db = sqlite3.connect(pathlib.Path(self.path).resolve().as_uri() + "?mode=ro", uri=True)
+        db.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in db.execute(f"{self.SELECT} {sql}", params)]
+        finally:
+            db.close()
+    
+    def top_scores(self, limit=SCORE_TOP_COUNT):
+        """Return the highest-scoring finished games as dicts, best first"""
+        return self.query("WHERE finished ORDER BY score DESC, started LIMIT ?", (limit,))
+    
+    def history(self, player, limit=SCORE_TOP_COUNT):
+        """Return a player's games as dicts, most recent first"""
+        return self.query("WHERE player = ? ORDER BY started DESC LIMIT ?", (player, limit))
+
+class NullProfiler:
+    """Stand-in used while profiling is off; every hook is a no-op"""
+    enabled = False
+    
+    def begin_frame(self):
+        pass
+    
+    def lap(self, stage):
+        pass
+    
+    def end_frame(self, game):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+class FrameProfiler:
+    """Per-stage frame timings and entity counts kept in a ring buffer
+    
+    lap(stage) charges the time since the previous lap to `stage`, so the
+    stages of a frame add up to the whole frame.
+    """
+    enabled = True
+    
+    def __init__(self, capacity=PROFILER_FRAMES):
+        self.capacity = capacity
+        self.times = np.zeros((capacity, len(PROFILER_STAGES)))
+        self.counts = np.zeros((capacity, len(PROFILER_COUNTERS)), dtype=np.int32)
+        self.frames = 0  # Total frames recorded, including overwritten ones
+        self.stage_index = {stage: i for i, stage in enumerate(PROFILER_STAGES)}
+        self.row = [0.0] * len(PROFILER_STAGES)
+        self.last = time.perf_counter()
+    
+    def begin_frame(self):
+        self.row = [0.0] * len(PROFILER_STAGES)
+        self.last = time.perf_counter()
+    
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.row[self.stage_index[stage]] += now - self.last
+        self.last = now
+    
+    def end_frame(self, game):
+        i = self.frames % self.capacity
+        self.times[i] = self.row
+        self.counts[i] = (len(game.enemies), len(game.bullets), len(game.enemy_bullets), len(game.particles))
+        self.frames += 1
+    
+    def samples(self):
+        """Return (times, counts) for the buffered frames, oldest first; times are in seconds"""
+        n = min(self.frames, self.capacity)
+        order = (np.arange(n) + self.frames - n) % self.capacity
+        return self.times[order], self.counts[order]
+    
+    def frame_times(self, include_wait=False):
+        """Return total frame times in seconds, optionally including the clock.tick wait"""
+        times, _ = self.samples()
+        if not include_wait:
+            times = times[:, :self.stage_index["tick"]]
+        return times.sum(axis=1)
+    
+    def dump(self, path):
+        """Write the buffered samples to a CSV file (times in milliseconds)"""
+        times, counts = self.samples()
+        first = self.frames - len(times)
+        frames = np.arange(first, self.frames)[:, None]
+        header = ",".join(("frame",) + tuple(f"{stage}_ms" for stage in PROFILER_STAGES) + PROFILER_COUNTERS)
+        np.savetxt(path, np.hstack((frames, times * 1000.0, counts)), delimiter=",", header=header,
+                   comments="", fmt=["%d"] + ["%.4f"] * len(PROFILER_STAGES) + ["%d"] * len(PROFILER_COUNTERS))
+
+class AllocationProfiler(FrameProfiler):
+    """FrameProfiler that also records the memory each stage allocates, using tracemalloc
+    
+    A stage is charged the peak of traced memory during it above where it
+    started, so temporaries count even when they are freed before the stage
+    ends. The memory still traced at the end of each frame is kept too, to
+    show growth. Tracing slows everything down several times over, so the
+    stage times recorded alongside are only good for relative comparisons.
+    """
+    def __init__(self, capacity=PROFILER_FRAMES):
+        super().__init__(capacity)
+        self.allocated = np.zeros((capacity, len(PROFILER_STAGES)), dtype=np.int64)
+        self.retained = np.zeros(capacity, dtype=np.int64)
+        self.allocated_row = [0] * len(PROFILER_STAGES)
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        self.memory = tracemalloc.get_traced_memory()[0]
+    
+    def begin_frame(self):
+        super().begin_frame()
+        self.allocated_row = [0] * len(PROFILER_STAGES)
+        tracemalloc.reset_peak()
+        self.memory = tracemalloc.get_traced_memory()[0]
+    
+    def lap(self, stage):
+        memory, peak = tracemalloc.get_traced_memory()
+        self.allocated_row[self.stage_index[stage]] += peak - self.memory
+        tracemalloc.reset_peak()
+        self.memory = memory
+        super().lap(stage)
+    
+    def end_frame(self, game):
+        i = self.frames % self.capacity
+        self.allocated[i] = self.allocated_row
+        self.retained[i] = tracemalloc.get_traced_memory()[0]
+        super().end_frame(game)
+    
+    def allocation_samples(self):
+        """Return (allocated, retained) bytes for the buffered frames, oldest first"""
+        n = min(self.frames, self.capacity)
+        order = (np.arange(n) + self.frames - n) % self.capacity
+        return self.allocated[order], self.retained[order]
+    
+    def close(self):
+        """Stop tracing if this profiler started it"""
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+# Game snapshots: magic, version, rules CRC, frame, score, lives, frames played, shots fired,
+# enemies hit, lives lost, enemy direction, game over, won, players. The RNGs and entities follow
+# in a fixed order.
+SNAPSHOT_MAGIC = b"SISNP"
+SNAPSHOT_VERSION = 5
+SNAPSHOT_HEADER = struct.Struct("<5sBIQiiIIIIibbB")
 
 class Game:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Space Invaders")
-        self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 36)
-        self.small_font = pygame.font.Font(None, 24)
+    def __init__(self, headless=False, seed=None, profile=False, coop=False, snapshot=None, recording=None):
+        """Create a game; a headless game has no window, fonts or sounds and is driven by step()
+        
+        A coop game has a second player sharing the wave, score and lives.
+        A game given a snapshot starts from it rather than from a new wave,
+        with its bullet pools sized to the snapshot's bullets.
+        """
+        init_started = time.perf_counter()
+        self.headless = headless
+        self.coop = coop
+        self.profiler = FrameProfiler() if profile else NULL_PROFILER
+        self.show_overlay = False
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        # Gameplay and cosmetic randomness use separate streams, so effects
+        # can change without breaking recorded games
+        gameplay_seed, fx_seed = np.random.SeedSequence(seed).spawn(2)
+        self.rng = np.random.default_rng(gameplay_seed)
+        self.fx_rng = np.random.default_rng(fx_seed)
+        self.frame = 0
+        self.recording = Recording(seed, players=2 if coop else 1) if recording is None else recording
+        self.particles = ParticleSystem()
+        capacity = BULLET_CAPACITY if snapshot is None else 0
+        self.bullets = BulletPool(BULLET_SPEED, True, capacity)
+        self.enemy_bullets = BulletPool(-ENEMY_BULLET_SPEED, False, capacity)
+        
+        self.audio = NULL_AUDIO
+        self.audio_loader = None
+        # Seconds spent in each startup phase, for --startup-report
+        self.startup_times = {"import": IMPORT_SECONDS}
         
-        # Load sounds
-        self.shoot_sound = generate_shoot_sound()
-        self.explosion_sound = generate_explosion_sound()
-        self.background_music = generate_background_music()
-        self.music_channel = None
+        if headless:
+            self.screen = None
+        else:
+            pygame.display.init()
+            pygame.font.init()
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pygame.display.set_caption("Space Invaders")
+            # Sounds load in the background; the game stays silent until they are ready.
+            # SDL is not thread-safe while initializing, so the mixer opens only once the window is up
+            self.audio_loader = AudioLoader()
+            self.clock = pygame.time.Clock()
+            self.fps = FPS
+            self.font = pygame.font.Font(None, 36)
+            self.small_font = pygame.font.Font(None, 24)
+            self.atlas = SpriteAtlas()
+            self.lights = LightCompositor()
+            self.renderer = DirtyRectRenderer(self.screen)
+            
+            # HUD surfaces are built once; text is only re-rendered when it changes
+            self.score_bg = pygame.Surface((200, 80))
+            self.score_bg.set_alpha(128)
+            self.score_bg.fill(BLACK)
+            self.overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+            self.overlay.set_alpha(200)
+            self.overlay.fill(BLACK)
+            self.overlay_font = pygame.font.Font(None, 18)
+            self.overlay_bg = pygame.Surface((240, 120))
+            self.overlay_bg.set_alpha(180)
+            self.overlay_bg.fill(BLACK)
+            self.score_text = CachedText(self.font, YELLOW)
+            self.lives_text = CachedText(self.font, GREEN)
+            self.title_text = CachedText(self.font, RED)
+            self.title_glow_text = CachedText(self.font, ORANGE)
+            self.final_score_text = CachedText(self.font, YELLOW)
+            self.restart_text = CachedText(self.small_font, WHITE)
         
-        self.reset_game()
+        if snapshot is None:
+            self.reset_game()
+        else:
+            # Placeholder entities for restore() to fill in
+            players = SNAPSHOT_HEADER.unpack_from(snapshot)[-1]
+            self.players = [Player(0, 0) for _ in range(players)]
+            self.player = self.players[0]
+            self.stars = StarField(self.fx_rng)
+            self.enemies = EnemyFormation(0, 0, 0, 0, self.fx_rng)
+            self.shields = Shields()
+            self.restore(snapshot)
+        self.startup_times["init"] = time.perf_counter() - init_started
     
     def reset_game(self):
-        self.player = Player(SCREEN_WIDTH // 2 - PLAYER_WIDTH // 2, SCREEN_HEIGHT - PLAYER_HEIGHT - 20)
-        self.bullets = []
-        self.enemy_bullets = []
-        self.enemies = []
-        self.particles = []
+        player_y = SCREEN_HEIGHT - PLAYER_HEIGHT - 20
+        if self.coop:
+            # Co-op ships start a third of the way in from each edge
+            self.players = [Player(SCREEN_WIDTH * i // 3 - PLAYER_WIDTH // 2, player_y) for i in (1, 2)]
+        else:
+            self.players = [Player(SCREEN_WIDTH // 2 - PLAYER_WIDTH // 2, player_y)]
+        self.player = self.players[0]
+        self.bullets.clear()
+        self.enemy_bullets.clear()
+        self.particles.clear()
         self.score = 0
         self.lives = 3
+        # Telemetry for this game
+        self.frames_played = 0
+        self.shots_fired = 0
+        self.enemies_hit = 0
+        self.lives_lost = 0
         self.enemy_direction = 1
         self.game_over = False
         self.won = False
-        self.star_field = [(random.randint(0, SCREEN_WIDTH), random.randint(0, SCREEN_HEIGHT), 
-                           random.randint(1, 3)) for _ in range(100)]
+        self.stars = StarField(self.fx_rng)
         
         # Create enemies
         start_x = (SCREEN_WIDTH - (ENEMY_COLS * ENEMY_SPACING)) // 2
         start_y = 50
-        for row in range(ENEMY_ROWS):
-            for col in range(ENEMY_COLS):
-                x = start_x + col * ENEMY_SPACING
-                y = start_y + row * ENEMY_SPACING
-                self.enemies.append(Enemy(x, y))
+        self.enemies = EnemyFormation(start_x, start_y, ENEMY_ROWS, ENEMY_COLS, self.fx_rng)
+        self.shields = Shields()
         
         # Start background music
-        if self.music_channel:
-            self.music_channel.stop()
-        self.music_channel = self.background_music.play(-1)
+        self.audio.stop_music()
+        self.audio.start_music()
+    
+    def attach_audio(self, report=False):
+        """Switch to the background-loaded audio once it is ready"""
+        loader = self.audio_loader
+        self.audio_loader = None
+        self.audio = loader.audio
+        self.startup_times["audio"] = loader.seconds
+        if loader.error:
+            print(f"Sound disabled: {loader.error}")
+        if not self.game_over:
+            self.audio.start_music()
+        if report:
+            print(self.startup_report())
+    
+    def startup_report(self):
+        times = self.startup_times
+        labels = (("import", "module import"), ("init", "window, fonts and game state"),
+                  ("first_frame", "first frame"), ("audio", "mixer and sounds (background)"))
+        lines = ["Startup:"]
+        lines += [f"  {label:<32}{times[key] * 1000:8.1f} ms" for key, label in labels if key in times]
+        ready = times["import"] + times["init"] + times.get("first_frame", 0.0)
+        lines.append(f"  {'first frame shown after':<32}{ready * 1000:8.1f} ms")
+        return "\n".join(lines)
     
     def handle_events(self):
+        """Translate this frame's pygame events into a FrameInput, or return None on quit"""
+        fire = restart = toggle_music = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                return False
+                return None
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE and not self.game_over:
-                    # Shoot bullet
-                    bullet_x = self.player.x + self.player.width // 2 - BULLET_WIDTH // 2
-                    bullet_y = self.player.y
-                    self.bullets.append(Bullet(bullet_x, bullet_y, True))
-                    # Play shoot sound
-                    self.shoot_sound.play()
-                if event.key == pygame.K_r and self.game_over:
-                    self.reset_game()
+                if event.key == pygame.K_SPACE:
+                    fire = True
+                if event.key == pygame.K_r:
+                    restart = True
                 if event.key == pygame.K_m:
-                    # Toggle music
-                    if self.music_channel and self.music_channel.get_busy():
-                        self.music_channel.stop()
-                    else:
-                        self.music_channel = self.background_music.play(-1)
-        return True
+                    toggle_music = True
+                if event.key == pygame.K_F3:
+                    self.toggle_overlay()
+                if event.key == pygame.K_F4:
+                    self.dump_profile()
+        keys = pygame.key.get_pressed()
+        return FrameInput(keys[pygame.K_LEFT], keys[pygame.K_RIGHT], fire, restart, toggle_music)
     
-    def update(self):
-        if self.game_over:
-            return
+    def toggle_overlay(self):
+        """Show or hide the performance overlay, starting the profiler if it is off"""
+        if not self.profiler.enabled:
+            self.profiler = FrameProfiler()
+        self.show_overlay = not self.show_overlay
+    
+    def dump_profile(self, path=None):
+        if not self.profiler.enabled:
+            return None
+        path = path or time.strftime("profile-%Y%m%d-%H%M%S.csv")
+        self.profiler.dump(path)
+        print(f"Wrote {min(self.profiler.frames, self.profiler.capacity)} profiled frames to {path}")
+        return path
+    
+    def step(self, frame_input, partner_input=NO_INPUT):
+        """Advance the simulation by one frame using the given input
         
-        # Update star field animation
-        self.star_field = [(x, (y + 0.5) % SCREEN_HEIGHT, size) for x, y, size in self.star_field]
+        partner_input drives player two in a co-op game and is ignored otherwise.
+        """
+        if not self.coop:
+            partner_input = NO_INPUT
+        self.recording.append(frame_input, partner_input)
+        for player, player_input in zip(self.players, (frame_input, partner_input)):
+            if player_input.fire and not self.game_over:
+                # Shoot bullet
+                bullet_x = player.x + player.width // 2 - BULLET_WIDTH // 2
+                bullet_y = player.y
+                self.bullets.spawn(bullet_x, bullet_y)
+                self.shots_fired += 1
+                # Play shoot sound
+                self.audio.play("shoot")
+        if (frame_input.restart or partner_input.restart) and self.game_over:
+            self.reset_game()
+        if frame_input.toggle_music:
+            self.audio.toggle_music()
+        # Recording, firing, restarts and the music toggle count as "input" rather than the first update stage
+        lap = self.profiler.lap
+        lap("input")
+        self.update(frame_input, partner_input)
+        self.audio.flush()
+        lap("audio")
+        self.frame += 1
+    
+    def simulate(self, inputs):
+        """Step once per FrameInput in inputs, as fast as possible, and return the final state"""
+        for frame_input in inputs:
+            self.step(frame_input)
+        return self.get_state()
+    
+    def snapshot(self):
+        """Return the full simulation state as compact, immutable bytes for restore()
         
-        keys = pygame.key.get_pressed()
-        self.player.update(keys)
+        Only live entities are stored, as raw array bytes behind small
+        struct headers, so a snapshot is typically a few kilobytes.
+        """
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, rules_signature(), self.frame, self.score,
+                                      self.lives, self.frames_played, self.shots_fired, self.enemies_hit,
+                                      self.lives_lost, self.enemy_direction, self.game_over, self.won,
+                                      len(self.players))
+        return b"".join((header, pack_rng(self.rng), pack_rng(self.fx_rng),
+                         *(player.pack() for player in self.players),
+                         self.bullets.pack(), self.enemy_bullets.pack(), self.enemies.pack(),
+                         self.shields.pack(), self.particles.pack(), self.stars.pack()))
+    
+    def restore(self, snapshot):
+        """Roll the simulation back to a snapshot; the snapshot can be restored again later
         
-        # Update particles
-        for particle in self.particles[:]:
-            particle.update()
-            if not particle.is_alive():
-                self.particles.remove(particle)
+        State is copied into the game's existing arrays, so restoring, say
+        to restart a search from the same position, allocates almost nothing.
+        """
+        (magic, version, rules, frame, score, lives, frames_played, shots_fired, enemies_hit, lives_lost,
+         enemy_direction, game_over, won, players) = SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("not a Space Invaders snapshot (or an unsupported version)")
+        if rules != rules_signature():
+            raise ValueError("snapshot was taken with different game constants")
+        if players != len(self.players):
+            raise ValueError(f"snapshot is of a {players}-player game, not {len(self.players)}-player")
+        self.frame, self.score, self.lives, self.enemy_direction = frame, score, lives, enemy_direction
+        self.frames_played, self.shots_fired = frames_played, shots_fired
+        self.enemies_hit, self.lives_lost = enemies_hit, lives_lost
+        self.game_over = bool(game_over)
+        self.won = bool(won)
+        offset = SNAPSHOT_HEADER.size
+        offset = unpack_rng(self.rng, snapshot, offset)
+        offset = unpack_rng(self.fx_rng, snapshot, offset)
+        for entity in (*self.players, self.bullets, self.enemy_bullets, self.enemies, self.shields,
+                       self.particles, self.stars):
+            offset = entity.unpack(snapshot, offset)
+        self.recording.truncate(self.frame)
+    
+    def fork(self, snapshot=None):
+        """Return an independent headless game at `snapshot`, or at this game's current state
         
-        # Update bullets
-        for bullet in self.bullets[:]:
-            bullet.update()
-            if bullet.is_off_screen():
-                self.bullets.remove(bullet)
+        Snapshots are immutable, so any number of branches can fork from the
+        same one without copying it. A branch is built straight from the
+        snapshot, with arrays sized to its live entities, and its recording
+        shares this game's recorded frames rather than copying them.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        recording = Recording(self.seed, rules=self.recording.rules, players=self.recording.players,
+                              shared=self.recording.share())
+        return Game(headless=True, seed=self.seed, coop=self.coop, snapshot=snapshot, recording=recording)
+    
+    def game_summary(self, player, started, frame_times, finished=True):
+        """Return this game's telemetry as a ScoreStore row
+        
+        `started` is the Unix time the game began and `frame_times` is the
+        FrameTimeHistogram of its drawn frames.
+        """
+        p50, p99 = frame_times.percentiles((50, 99)).tolist() if len(frame_times) else (None, None)
+        return {
+            "player": player,
+            "started": started,
+            "seed": str(self.seed),
+            "coop": self.coop,
+            "finished": finished,
+            "won": self.won,
+            "score": self.score,
+            "frames": self.frames_played,
+            "shots": self.shots_fired,
+            "hits": self.enemies_hit,
+            "lives_lost": self.lives_lost,
+            "frame_p50_ms": p50,
+            "frame_p99_ms": p99,
+        }
+    
+    def save_recording(self, path):
+        self.recording.score = self.score
+        self.recording.save(path)
+    
+    def get_state(self):
+        """Return a plain-data summary of the simulation state"""
+        return {
+            "frame": self.frame,
+            "score": self.score,
+            "lives": self.lives,
+            "game_over": self.game_over,
+            "won": self.won,
+            "player": (self.player.x, self.player.y),
+            "players": [(player.x, player.y) for player in self.players],
+            "enemies": list(zip(*(coords.tolist() for coords in self.enemies.positions()[:2]))),
+            "enemy_direction": self.enemy_direction,
+            "bullets": self.bullets.positions(),
+            "enemy_bullets": self.enemy_bullets.positions(),
+            "particles": len(self.particles),
+            "frames_played": self.frames_played,
+            "shots_fired": self.shots_fired,
+            "enemies_hit": self.enemies_hit,
+            "lives_lost": self.lives_lost,
+            "shield_pixels": int(np.count_nonzero(self.shields.solid)),
+        }
+    
+    def update(self, frame_input=NO_INPUT, partner_input=NO_INPUT):
+        if self.game_over:
+            return
+        self.frames_played += 1
         
-        for bullet in self.enemy_bullets[:]:
-            bullet.update()
-            if bullet.is_off_screen():
-                self.enemy_bullets.remove(bullet)
+        lap = self.profiler.lap
+        self.update_stars()
+        lap("stars")
+        for player, player_input in zip(self.players, (frame_input, partner_input)):
+            player.update(player_input.left, player_input.right)
+        lap("player")
+        self.update_particles()
+        lap("particles")
+        self.update_bullets()
+        lap("bullets")
+        self.update_shields()
+        lap("shields")
+        self.check_collisions()
+        lap("collisions")
+        self.update_enemies()
+        lap("enemies")
         
+        # Check win condition
+        if len(self.enemies) == 0:
+            self.game_over = True
+            self.won = True
+            self.audio.stop_music()
+    
+    def update_stars(self):
+        self.stars.update()
+    
+    def update_particles(self):
+        self.particles.update()
+    
+    def update_bullets(self):
+        self.bullets.update()
+        self.enemy_bullets.update()
+    
+    def update_shields(self):
+        """Erode the shields under this tick's bullet hits and under enemies that have reached them"""
+        shields = self.shields
+        shields.hit(self.bullets)
+        shields.hit(self.enemy_bullets)
+        if self.enemies and self.enemies.bottom() >= shields.y:
+            xs, ys, _ = self.enemies.positions()
+            shields.crush(xs, ys, ENEMY_WIDTH, ENEMY_HEIGHT)
+    
+    def check_collisions(self):
         # Check bullet-enemy collisions
-        for bullet in self.bullets[:]:
-            for enemy in self.enemies[:]:
-                if bullet.rect.colliderect(enemy.rect):
-                    # Create explosion particles
-                    for _ in range(PARTICLE_COUNT):
-                        self.particles.append(Particle(enemy.x + enemy.width // 2, 
-                                                      enemy.y + enemy.height // 2))
-                    self.bullets.remove(bullet)
-                    self.enemies.remove(enemy)
-                    self.score += 10
-                    # Play explosion sound
-                    self.explosion_sound.play()
-                    break
+        bullets = self.bullets
+        if bullets.count and self.enemies:
+            # Only bullets inside the formation's bounding box can hit anything
+            hit_bullets = bullets.overlapping(*self.enemies.bounding_rect())
+            # The oldest bullet wins when several reach the same enemy on one frame
+            candidates = bullets.in_spawn_order(np.flatnonzero(hit_bullets))
+            for i, x, y in zip(candidates.tolist(), bullets.x[candidates].tolist(), bullets.y[candidates].tolist()):
+                hit = self.enemies.find_hit(x, y, BULLET_WIDTH, BULLET_HEIGHT)
+                if not hit:
+                    hit_bullets[i] = False
+                    continue
+                # Killing the enemy right away lets later bullets pass through its cell
+                self.enemies.kill(*hit)
+                # Create explosion particles
+                ex, ey = self.enemies.cell_position(*hit)
+                self.particles.spawn(ex + ENEMY_WIDTH // 2, ey + ENEMY_HEIGHT // 2, PARTICLE_COUNT, self.fx_rng)
+                self.score += 10
+                self.enemies_hit += 1
+                # Play explosion sound
+                self.audio.play("explosion")
+            if len(candidates):
+                bullets.remove(hit_bullets)
         
-        # Check bullet-player collisions
-        for bullet in self.enemy_bullets[:]:
-            if bullet.rect.colliderect(self.player.rect):
+        # Check bullet-player collisions; co-op players share their lives
+        for player in self.players:
+            if self.game_over:
+                break
+            hits = self.enemy_bullets.overlapping(player.x, player.y, player.width, player.height)
+            hit_count = int(np.count_nonzero(hits))
+            if not hit_count:
+                continue
+            self.enemy_bullets.remove(hits)
+            for _ in range(hit_count):
                 # Create explosion particles
-                for _ in range(PARTICLE_COUNT):
-                    self.particles.append(Particle(self.player.x + self.player.width // 2, 
-                                                  self.player.y + self.player.height // 2))
-                self.enemy_bullets.remove(bullet)
+                self.particles.spawn(player.x + player.width // 2, player.y + player.height // 2,
+                                     PARTICLE_COUNT, self.fx_rng)
                 self.lives -= 1
+                self.lives_lost += 1
                 # Play explosion sound
-                self.explosion_sound.play()
+                self.audio.play("explosion")
                 if self.lives <= 0:
                     self.game_over = True
-                    if self.music_channel:
-                        self.music_channel.stop()
-        
+                    self.audio.stop_music()
+    
+    def update_enemies(self):
+        enemies = self.enemies
         # Move enemies
-        move_down = False
-        for enemy in self.enemies:
-            if (enemy.x <= 0 and self.enemy_direction < 0) or \
-               (enemy.x >= SCREEN_WIDTH - ENEMY_WIDTH and self.enemy_direction > 0):
-                move_down = True
-                break
-        
-        if move_down:
+        enemies.previous_origin = (enemies.origin_x, enemies.origin_y)
+        if enemies.at_edge(self.enemy_direction):
             self.enemy_direction *= -1
-            for enemy in self.enemies:
-                enemy.move_down()
-        
-        for enemy in self.enemies:
-            enemy.update(self.enemy_direction)
+            enemies.move(0, ENEMY_DROP)
+        enemies.move(self.enemy_direction * ENEMY_SPEED, 0)
+        enemies.animate()
         
         # Enemy shooting
-        for enemy in self.enemies:
-            if random.random() < ENEMY_SHOOT_CHANCE:
-                bullet_x = enemy.x + enemy.width // 2 - BULLET_WIDTH // 2
-                bullet_y = enemy.y + enemy.height
-                self.enemy_bullets.append(Bullet(bullet_x, bullet_y, False))
+        xs, ys = enemies.choose_shooters(self.rng, ENEMY_SHOOT_CHANCE)
+        if len(xs):
+            self.enemy_bullets.spawn(xs + ENEMY_WIDTH // 2 - BULLET_WIDTH // 2, ys + ENEMY_HEIGHT)
         
         # Check if enemies reached player
-        for enemy in self.enemies:
-            if enemy.y + enemy.height >= self.player.y:
-                self.game_over = True
-                break
-        
-        # Check win condition
-        if len(self.enemies) == 0:
+        if enemies and enemies.bottom() >= self.player.y:
             self.game_over = True
-            self.won = True
-            if self.music_channel:
-                self.music_channel.stop()
     
-    def draw(self):
+    def draw(self, alpha=1.0):
+        """Draw the game `alpha` of the way from the previous tick's state to the current one"""
+        if self.headless:
+            return
+        self.atlas.sync()
+        renderer = self.renderer
+        renderer.begin()
+        # Nothing moves once the game is over
+        lag = 0.0 if self.game_over else 1.0 - alpha
+        
         # Draw star field background
-        self.screen.fill(BLACK)
-        for star_x, star_y, star_size in self.star_field:
-            pygame.draw.circle(self.screen, WHITE, (int(star_x), int(star_y)), star_size)
+        renderer.add("stars", self.stars.draw(self.screen, lag))
+        
+        # Particles (explosions) are pure light, and glow even in game over
+        lights = self.lights
+        lights.add_particles(self.particles, lag)
         
         if not self.game_over:
-            # Draw particles (explosions)
-            for particle in self.particles:
-                particle.draw(self.screen)
+            # Draw shields
+            renderer.add("shields", self.shields.draw(self.screen))
             
             # Draw enemies
-            for enemy in self.enemies:
-                enemy.draw(self.screen)
-            
-            # Draw bullets
-            for bullet in self.enemy_bullets:
-                bullet.draw(self.screen)
-            
-            for bullet in self.bullets:
-                bullet.draw(self.screen)
+            renderer.add("enemies", self.atlas.draw_enemies(self.screen, self.enemies, lag))
             
-            # Draw player
-            self.player.draw(self.screen)
+            # Draw bullets; their glow and trails are light
+            for pool in (self.enemy_bullets, self.bullets):
+                renderer.add("bullets", self.atlas.draw_bullets(self.screen, pool, lag))
+                lights.add_bullets(pool, lag)
             
+            # Draw players
+            for number, player in enumerate(self.players):
+                renderer.add("player", self.atlas.draw_player(self.screen, player, lag, number))
+                lights.add_engine(player, lag)
+        
+        renderer.add("light", lights.composite(self.screen, self.frame - lag))
+        
+        if not self.game_over:
             # Draw UI with better styling
             # Score background
-            score_bg = pygame.Surface((200, 80))
-            score_bg.set_alpha(128)
-            score_bg.fill(BLACK)
-            self.screen.blit(score_bg, (5, 5))
-            
-            score_text = self.font.render(f"Score: {self.score}", True, YELLOW)
-            self.screen.blit(score_text, (10, 10))
-            
-            lives_text = self.font.render(f"Lives: {self.lives}", True, GREEN)
-            self.screen.blit(lives_text, (10, 50))
+            renderer.add("hud", self.screen.blit(self.score_bg, (5, 5)))
+            renderer.add("hud", self.screen.blit(self.score_text.render(f"Score: {self.score}"), (10, 10)))
+            renderer.add("hud", self.screen.blit(self.lives_text.render(f"Lives: {self.lives}"), (10, 50)))
             
             # Draw life indicators
             for i in range(self.lives):
                 life_x = SCREEN_WIDTH - 60 - i * 20
-                pygame.draw.polygon(self.screen, GREEN, [
+                renderer.add("hud", pygame.draw.polygon(self.screen, GREEN, [
                     (life_x, SCREEN_HEIGHT - 20),
                     (life_x + 10, SCREEN_HEIGHT - 30),
                     (life_x + 20, SCREEN_HEIGHT - 20)
-                ])
+                ]))
         else:
-            # Draw particles even in game over
-            for particle in self.particles:
-                particle.draw(self.screen)
-            
             # Game over screen with better styling
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-            overlay.set_alpha(200)
-            overlay.fill(BLACK)
-            self.screen.blit(overlay, (0, 0))
+            renderer.add("hud", self.screen.blit(self.overlay, (0, 0)))
             
             if self.won:
-                game_over_text = self.font.render("YOU WIN!", True, GREEN)
+                game_over_text = self.title_text.render("YOU WIN!", GREEN)
                 # Add glow effect
-                glow_surf = self.font.render("YOU WIN!", True, YELLOW)
-                for offset in [(1, 1), (-1, -1), (1, -1), (-1, 1)]:
-                    glow_rect = game_over_text.get_rect(center=(SCREEN_WIDTH // 2 + offset[0], 
-                                                               SCREEN_HEIGHT // 2 - 50 + offset[1]))
-                    self.screen.blit(glow_surf, glow_rect)
+                glow_surf = self.title_glow_text.render("YOU WIN!", YELLOW)
             else:
-                game_over_text = self.font.render("GAME OVER", True, RED)
+                game_over_text = self.title_text.render("GAME OVER", RED)
                 # Add glow effect
-                glow_surf = self.font.render("GAME OVER", True, ORANGE)
-                for offset in [(1, 1), (-1, -1), (1, -1), (-1, 1)]:
-                    glow_rect = game_over_text.get_rect(center=(SCREEN_WIDTH // 2 + offset[0], 
-                                                               SCREEN_HEIGHT // 2 - 50 + offset[1]))
-                    self.screen.blit(glow_surf, glow_rect)
+                glow_surf = self.title_glow_text.render("GAME OVER", ORANGE)
+            for offset in [(1, 1), (-1, -1), (1, -1), (-1, 1)]:
+                glow_rect = game_over_text.get_rect(center=(SCREEN_WIDTH // 2 + offset[0], 
+                                                           SCREEN_HEIGHT // 2 - 50 + offset[1]))
+                self.screen.blit(glow_surf, glow_rect)
             
             text_rect = game_over_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 50))
             self.screen.blit(game_over_text, text_rect)
             
-            score_text = self.font.render(f"Final Score: {self.score}", True, YELLOW)
+            score_text = self.final_score_text.render(f"Final Score: {self.score}")
             score_rect = score_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
             self.screen.blit(score_text, score_rect)
             
-            restart_text = self.small_font.render("Press R to Restart | M to Toggle Music", True, WHITE)
+            restart_text = self.restart_text.render("Press R to Restart | M to Toggle Music")
             restart_rect = restart_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50))
             self.screen.blit(restart_text, restart_rect)
         
-        pygame.display.flip()
+        if self.show_overlay:
+            renderer.add("overlay", self.draw_overlay())
+        renderer.present()
     
-    def run(self):
-        running = True
-        while running:
-            running = self.handle_events()
-            self.update()
-            self.draw()
-            self.clock.tick(FPS)
+    def draw_overlay(self):
+        """Draw FPS, a frame-time graph and entity counts; return the rect drawn"""
+        times = self.profiler.frame_times()[-200:] * 1000.0
+        _, counts = self.profiler.samples()
+        panel = pygame.Rect(SCREEN_WIDTH - 245, 5, 240, 120)
+        self.screen.blit(self.overlay_bg, panel)
         
+        frame_ms = times[-1] if len(times) else 0.0
+        p99 = np.percentile(times, 99) if len(times) else 0.0
+        lines = [f"FPS {self.clock.get_fps():.1f}   {frame_ms:.2f} ms   p99 {p99:.2f} ms"]
+        if len(counts):
+            enemies, bullets, enemy_bullets, particles = counts[-1]
+            lines.append(f"Enemies {enemies}   Particles {particles}")
+            lines.append(f"Bullets {bullets}   Enemy bullets {enemy_bullets}")
+        for i, line in enumerate(lines):
+            self.screen.blit(self.overlay_font.render(line, True, WHITE), (panel.x + 5, panel.y + 4 + i * 14))
+        
+        # Frame-time graph with a line at the frame budget
+        graph = pygame.Rect(panel.x + 5, panel.y + 45, panel.width - 10, panel.height - 50)
+        budget_y = graph.bottom - int(graph.height * (1000.0 / (self.fps or TICK_RATE)) / PROFILER_GRAPH_MS)
+        pygame.draw.line(self.screen, DARK_RED, (graph.left, budget_y), (graph.right, budget_y))
+        if len(times) > 1:
+            xs = graph.right - (len(times) - 1 - np.arange(len(times))) * graph.width / 200
+            ys = graph.bottom - np.minimum(times / PROFILER_GRAPH_MS, 1.0) * graph.height
+            pygame.draw.lines(self.screen, GREEN, False, np.column_stack((xs, ys)).tolist())
+        return panel
+    
+    def run(self, record_path=None, replay=None, profile_path=None, fps=None, capture_path=None,
+            capture_raw=False, startup_report=False, scores=None, player=None):
+        """Play interactively, or watch a Recording when replay is given
+        
+        The simulation advances in fixed ticks of 1 / TICK_RATE seconds,
+        however fast frames are drawn. Each frame runs as many ticks as the
+        elapsed time covers (at most MAX_CATCH_UP_TICKS) and then draws the
+        state interpolated by the leftover fraction of a tick. Every drawn
+        frame is streamed to capture_path if given, losslessly compressed
+        unless capture_raw is set. With startup_report, the startup phase
+        timings are printed once the sounds have loaded. Each game that ends
+        is queued to the ScoreStore `scores` under `player`, as is the game
+        in progress when the window closes.
+        """
+        if fps is not None:
+            self.fps = fps
+        first_frame_started = time.perf_counter()
+        capture = None
+        if capture_path:
+            capture = FrameCapture(capture_path, self.screen, self.fps or TICK_RATE, compress=not capture_raw)
+        tick_seconds = 1.0 / TICK_RATE
+        accumulator = 0.0
+        last_time = time.perf_counter()
+        # Drawn frame times and start time of the current game, for its telemetry
+        frame_times = FrameTimeHistogram()
+        started = time.time()
+        game_recorded = False
+        # Key presses are latched until a tick consumes them, so none are lost
+        # on frames that run no ticks or repeated on frames that run several
+        fire = restart = toggle_music = False
+        while True:
+            profiler = self.profiler
+            profiler.begin_frame()
+            frame_input = self.handle_events()
+            if frame_input is None:
+                break
+            fire |= frame_input.fire
+            restart |= frame_input.restart
+            toggle_music |= frame_input.toggle_music
+            profiler.lap("events")
+            
+            now = time.perf_counter()
+            frame_times.add(now - last_time)
+            accumulator = min(accumulator + now - last_time, MAX_CATCH_UP_TICKS * tick_seconds)
+            last_time = now
+            while accumulator >= tick_seconds:
+                if replay:
+                    if self.frame >= len(replay):
+                        break
+                    tick_input = replay.frame_input(self.frame)
+                    partner_input = replay.partner_input(self.frame)
+                else:
+                    tick_input = FrameInput(frame_input.left, frame_input.right, fire, restart, toggle_music)
+                    partner_input = NO_INPUT
+                    fire = restart = toggle_music = False
+                self.step(tick_input, partner_input)
+                accumulator -= tick_seconds
+            if replay and self.frame >= len(replay):
+                break
+            if self.game_over != game_recorded:
+                # The game just ended, or a restart began the next one
+                if self.game_over and scores:
+                    scores.record(self.game_summary(player, started, frame_times))
+                game_recorded = self.game_over
+                frame_times.clear()
+                started = time.time()
+            
+            self.draw(accumulator / tick_seconds)
+            profiler.lap("draw")
+            if "first_frame" not in self.startup_times:
+                self.startup_times["first_frame"] = time.perf_counter() - first_frame_started
+            if self.audio_loader and self.audio_loader.audio is not None:
+                self.attach_audio(startup_report)
+            if capture:
+                capture.capture()
+            profiler.lap("capture")
+            self.clock.tick(self.fps)
+            profiler.lap("tick")
+            profiler.end_frame(self)
+        
+        if capture:
+            capture.close()
+            print(f"Captured {capture.frames} frames to {capture_path} "
+                  f"({capture.stall_seconds * 1000:.0f} ms waiting for the writer)")
+        if record_path:
+            self.save_recording(record_path)
+        if profile_path:
+            self.dump_profile(profile_path)
+        if scores:
+            if not game_recorded and self.frames_played:
+                scores.record(self.game_summary(player, started, frame_times, finished=False))
+            scores.close()
+            if scores.error:
+                print(f"Scores not saved: {scores.error}")
+        self.audio.close()
         pygame.quit()
         sys.exit()
 
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+def default_player():
+    """The login name, which scores are saved under unless --player is given"""
+    try:
+        return getpass.getuser()
+    except (OSError, KeyError):
+        # No login name in the environment or the password database
+        return "player"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Space Invaders")
+    parser.add_argument("--seed", type=int, help="seed for all game randomness")
+    parser.add_argument("--record", metavar="PATH", help="save this session's inputs to PATH on exit")
+    parser.add_argument("--replay", metavar="PATH", help="watch a recorded session")
+    parser.add_argument("--profile", metavar="PATH", help="profile every frame and write the samples to PATH on exit")
+    parser.add_argument("--capture", metavar="PATH", help="stream every drawn frame to PATH (see capture.py)")
+    parser.add_argument("--capture-raw", action="store_true", help="write captured frames uncompressed")
+    parser.add_argument("--startup-report", action="store_true", help="print how long each startup phase took")
+    parser.add_argument("--fps", type=int, default=FPS,
+                        help="cap on drawn frames per second, 0 for uncapped (default: %(default)s)")
+    parser.add_argument("--player", default=default_player(),
+                        help="name to save scores under (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    if args.seed is not None and not 0 <= args.seed < SEED_LIMIT:
+        parser.error("--seed must be between 0 and 2**128 - 1")
+    try:
+        replay = Recording.load(args.replay) if args.replay else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if replay and replay.rules != rules_signature():
+        parser.error(f"{args.replay} was recorded with different game constants")
+    game = Game(seed=replay.seed if replay else args.seed, profile=bool(args.profile),
+                coop=bool(replay and replay.players == 2))
+    # Watching a replay is not playing, so it sets no scores
+    scores = ScoreStore() if SCORE_DB_PATH and not replay else None
+    game.run(record_path=args.record, replay=replay, profile_path=args.profile, fps=args.fps,
+             capture_path=args.capture, capture_raw=args.capture_raw, startup_report=args.startup_report,
+             scores=scores, player=args.player)
+
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    main()
 
@@ -0,0 +1,77 @@
+"""Unit tests for the audio manager's coalescing, voice limits and music, on SDL's dummy audio driver
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import time
+
+import numpy as np
+import pygame
+import pytest
+
+import space_invaders as si
+
+@pytest.fixture
+def audio(monkeypatch):
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    pygame.mixer.init(frequency=si.SAMPLE_RATE, size=-16, channels=2, buffer=512)
+    # Long silent sounds keep their voices busy for the whole test
+    silence = pygame.sndarray.make_sound(np.zeros((10 * si.SAMPLE_RATE, 2), dtype=np.int16))
+    music = si.MusicStream(lambda start, frames: np.zeros((frames, 2), dtype=np.int16))
+    manager = si.AudioManager({"shoot": silence, "explosion": silence}, music)
+    yield manager
+    manager.close()
+    pygame.mixer.quit()
+
+def busy(manager, category):
+    return sum(voice.get_busy() for voice in manager.voices[category])
+
+def test_requests_in_one_tick_play_one_voice(audio):
+    for _ in range(5):
+        audio.play("explosion")
+    audio.flush()
+    assert busy(audio, "explosion") == 1
+    assert busy(audio, "shoot") == 0
+
+def test_each_tick_plays_its_categories_again(audio):
+    for _ in range(3):
+        audio.play("shoot")
+        audio.play("explosion")
+        audio.flush()
+    assert busy(audio, "shoot") == 3
+    assert busy(audio, "explosion") == 3
+
+def test_rapid_fire_steals_its_own_oldest_voice(audio):
+    limit = si.SOUND_VOICE_LIMITS["shoot"]
+    for _ in range(limit):
+        audio.play("shoot")
+        audio.flush()
+    # With every shoot voice busy, the next shot cuts off the one that started first
+    replacement = pygame.sndarray.make_sound(np.zeros((si.SAMPLE_RATE, 2), dtype=np.int16))
+    audio.sounds["shoot"] = replacement
+    audio.play("shoot")
+    audio.flush()
+    assert busy(audio, "shoot") == limit
+    assert [voice.get_sound() is replacement for voice in audio.voices["shoot"]] == [True] + [False] * (limit - 1)
+    # Other categories keep their own voices
+    audio.play("explosion")
+    audio.flush()
+    assert busy(audio, "explosion") == 1
+
+def test_voice_limits_never_reach_the_music_channel(audio):
+    for _ in range(3 * sum(si.SOUND_VOICE_LIMITS.values())):
+        audio.play("shoot")
+        audio.play("explosion")
+        audio.flush()
+    assert not audio.music_channel.get_busy()
+
+def test_music_starts_stops_and_toggles(audio):
+    while audio.music.chunks.empty():
+        time.sleep(0.01)  # Let the stream render its first chunk
+    audio.start_music()
+    assert audio.music_channel.get_busy()
+    audio.toggle_music()
+    assert not audio.music_playing and not audio.music_channel.get_busy()
+    audio.toggle_music()
+    assert audio.music_playing
@@ -0,0 +1,30 @@
+"""Unit tests for the preallocated bullet pools
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import numpy as np
+
+import space_invaders as si
+
+def test_bullets_swap_remove_but_keep_spawn_order():
+    pool = si.BulletPool(si.BULLET_SPEED, True, capacity=4)
+    pool.spawn(np.arange(10) * 10, 300)  # Grows past the initial capacity
+    dead = np.zeros(10, dtype=bool)
+    dead[[0, 3, 4, 8]] = True
+    pool.remove(dead)
+    assert len(pool) == 6
+    # Slots are scrambled, but spawn order is what callers see
+    assert [x for x, _ in pool.positions()] == [10, 20, 50, 60, 70, 90]
+    order = pool.in_spawn_order(np.arange(len(pool)))
+    assert pool.serial[order].tolist() == [1, 2, 5, 6, 7, 9]
+
+def test_bullets_round_trip_through_pack():
+    pool = si.BulletPool(si.BULLET_SPEED, True)
+    pool.spawn(np.arange(5), np.arange(5) + 100)
+    pool.remove(np.array([False, True, False, False, True]))
+    restored = si.BulletPool(si.BULLET_SPEED, True, capacity=0)
+    restored.unpack(pool.pack(), 0)
+    assert restored.positions() == pool.positions()
+    assert restored.next_serial == pool.next_serial
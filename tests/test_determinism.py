@@ -0,0 +1,138 @@
+"""Determinism checks for the headless simulation and its serialized forms
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import numpy as np
+import pygame
+import pytest
+
+import space_invaders as si
+
+SEED = 20240601
+FRAMES = 900
+
+def scripted_inputs(frames, seed=0, bits=si.PARTNER_INPUTS):
+    """A reproducible run of random move and fire inputs"""
+    rng = np.random.default_rng(seed)
+    return [si.PACKED_INPUTS[value] for value in (rng.integers(32, size=frames) & bits).tolist()]
+
+def play(game, inputs, partner_inputs=None):
+    for i, frame_input in enumerate(inputs):
+        game.step(frame_input, partner_inputs[i] if partner_inputs else si.NO_INPUT)
+    return game
+
+def test_same_seed_and_inputs_give_same_state():
+    inputs = scripted_inputs(FRAMES)
+    first = play(si.Game(headless=True, seed=SEED), inputs)
+    second = play(si.Game(headless=True, seed=SEED), inputs)
+    assert first.snapshot() == second.snapshot()
+
+def test_windowed_game_steps_like_a_headless_one(monkeypatch):
+    monkeypatch.setenv("SDL_VIDEODRIVER", "dummy")
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    inputs = scripted_inputs(FRAMES)
+    windowed = si.Game(seed=SEED)
+    try:
+        # Drawing, sound and the window must not feed back into the simulation
+        windowed.audio_loader.thread.join()
+        windowed.attach_audio()
+        for frame, frame_input in enumerate(inputs):
+            windowed.step(frame_input)
+            windowed.draw(alpha=(frame % 4) / 4)
+        headless = play(si.Game(headless=True, seed=SEED), inputs)
+        assert windowed.snapshot() == headless.snapshot()
+    finally:
+        windowed.audio.close()
+        pygame.quit()
+
+@pytest.mark.parametrize("coop", [False, True])
+def test_restore_then_replay_reaches_the_same_state(coop):
+    inputs = scripted_inputs(FRAMES)
+    partner_inputs = scripted_inputs(FRAMES, seed=1) if coop else None
+    game = si.Game(headless=True, seed=SEED, coop=coop)
+    play(game, inputs[:FRAMES // 2], partner_inputs and partner_inputs[:FRAMES // 2])
+    middle = game.snapshot()
+    play(game, inputs[FRAMES // 2:], partner_inputs and partner_inputs[FRAMES // 2:])
+    end = game.snapshot()
+
+    game.restore(middle)
+    assert game.snapshot() == middle
+    assert len(game.recording) == FRAMES // 2
+    play(game, inputs[FRAMES // 2:], partner_inputs and partner_inputs[FRAMES // 2:])
+    assert game.snapshot() == end
+
+def test_forks_match_the_game_they_fork_from():
+    inputs = scripted_inputs(FRAMES)
+    game = play(si.Game(headless=True, seed=SEED), inputs[:FRAMES // 2])
+    middle = game.snapshot()
+    branches = [game.fork(middle) for _ in range(3)]
+    play(game, inputs[FRAMES // 2:])
+    for branch in branches:
+        assert branch.snapshot() == middle
+        play(branch, inputs[FRAMES // 2:])
+        assert branch.snapshot() == game.snapshot()
+        assert branch.recording.to_bytes() == game.recording.to_bytes()
+
+def test_fork_of_a_fork_rolled_back_into_shared_frames():
+    inputs = scripted_inputs(FRAMES)
+    reference = si.Game(headless=True, seed=SEED)
+    snapshots = []
+    for frame_input in inputs:
+        snapshots.append(reference.snapshot())
+        reference.step(frame_input)
+
+    game = play(si.Game(headless=True, seed=SEED), inputs[:600])
+    branch = game.fork(snapshots[400]).fork(snapshots[500])
+    branch.restore(snapshots[100])
+    play(branch, inputs[100:])
+    assert branch.snapshot() == reference.snapshot()
+    assert branch.recording.data() == reference.recording.data()
+
+def test_snapshot_rejects_another_player_count():
+    snapshot = si.Game(headless=True, seed=SEED, coop=True).snapshot()
+    with pytest.raises(ValueError):
+        si.Game(headless=True, seed=SEED).restore(snapshot)
+
+def test_recording_round_trips_through_bytes():
+    seed = 2**100 + 12345  # Wider than 64 bits, like SeedSequence entropy
+    game = play(si.Game(headless=True, seed=seed), scripted_inputs(FRAMES))
+    game.recording.score = game.score
+    loaded = si.Recording.from_bytes(game.recording.to_bytes())
+    assert loaded.seed == seed
+    assert loaded.rules == si.rules_signature()
+    assert loaded.score == game.score
+    assert loaded.data() == game.recording.data()
+
+    replayed = si.Game(headless=True, seed=loaded.seed)
+    play(replayed, [loaded.frame_input(frame) for frame in range(len(loaded))])
+    assert replayed.snapshot() == game.snapshot()
+
+@pytest.mark.parametrize("seed", ["-1", str(si.SEED_LIMIT)])
+def test_main_rejects_seeds_a_recording_cannot_hold(seed, capsys):
+    with pytest.raises(SystemExit):
+        si.main(["--seed", seed])
+    assert "--seed" in capsys.readouterr().err
+
+@pytest.mark.parametrize("damage", [lambda data: data[:3], lambda data: data[:-5],
+                                    lambda data: data[:40] + b"xxxx" + data[44:]])
+def test_damaged_recordings_raise_value_error(damage):
+    game = play(si.Game(headless=True, seed=SEED), scripted_inputs(FRAMES))
+    with pytest.raises(ValueError):
+        si.Recording.from_bytes(damage(game.recording.to_bytes()))
+
+def test_coop_inputs_pack_both_players_into_one_byte():
+    recording = si.Recording(SEED, players=2)
+    pairs = [(own, partner) for own in range(32) for partner in range(32)]
+    for own, partner in pairs:
+        recording.append(si.PACKED_INPUTS[own], si.PACKED_INPUTS[partner])
+    for frame, (own, partner) in enumerate(pairs):
+        # Either player's restart restarts the shared game; only player one toggles music
+        expected_own = own | (partner & si.INPUT_RESTART)
+        assert recording.frame_input(frame).to_bits() == expected_own
+        assert recording.partner_input(frame).to_bits() == partner & si.PARTNER_INPUTS
+
+    loaded = si.Recording.from_bytes(recording.to_bytes())
+    assert loaded.players == 2
+    assert loaded.data() == recording.data()
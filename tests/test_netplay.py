@@ -0,0 +1,85 @@
+"""Runs two netplay bots against each other over loopback
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import os
+import re
+import socket
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import netplay
+import space_invaders as si
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRAMES = 240
+
+def test_confirmed_recording_scores_the_confirmed_frames():
+    rng = np.random.default_rng(0)
+    game = si.Game(headless=True, seed=3, coop=True)
+    session = netplay.RollbackSession(game, 0, connection=None)
+    scores = [game.score]
+    # The partner's inputs arrive late, so the game runs past the confirmed frames on predictions
+    for frame in range(900):
+        session.local_inputs.append(int(rng.integers(32)) & netplay.NETWORK_INPUTS)
+        if frame >= 6:
+            session.remote_inputs.append(si.INPUT_FIRE)
+        session.simulate()
+        scores.append(game.score)
+        recording = session.confirmed_recording()
+        assert len(recording) == session.confirmed < game.frame
+        assert recording.score == scores[len(recording)]
+    assert scores[-1] > 0
+
+    replayed = si.Game(headless=True, seed=3, coop=True)
+    for frame in range(len(recording)):
+        replayed.step(recording.frame_input(frame), recording.partner_input(frame))
+    assert replayed.score == recording.score
+
+@pytest.mark.parametrize("seed", ["-1", str(si.SEED_LIMIT)])
+def test_main_rejects_seeds_welcome_cannot_hold(seed, capsys):
+    with pytest.raises(SystemExit):
+        netplay.main(["--host", "--seed", seed])
+    assert "--seed" in capsys.readouterr().err
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_bots_over_loopback_end_in_the_same_state(tmp_path):
+    port = str(free_udp_port())
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    common = ["--port", port, "--frames", str(FRAMES), "--latency", "30"]
+    host = subprocess.Popen([sys.executable, "netplay.py", "--host", "--bot", "random", "--seed", "7",
+                             "--record", str(tmp_path / "host.sirec"), *common],
+                            cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        joined = subprocess.run([sys.executable, "netplay.py", "--join", "127.0.0.1", "--bot", "sweep",
+                                 "--record", str(tmp_path / "join.sirec"), *common],
+                                cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                timeout=60)
+        hosted = host.communicate(timeout=60)[0]
+    finally:
+        host.kill()
+    assert host.returncode == 0, hosted
+    assert joined.returncode == 0, joined.stdout
+
+    pattern = re.compile(r"State checksum at frame (\d+): ([0-9a-f]{8})")
+    checksums = [pattern.search(output) for output in (hosted, joined.stdout)]
+    assert all(checksums), (hosted, joined.stdout)
+    assert checksums[0].groups() == checksums[1].groups() == (str(FRAMES), checksums[0].group(2))
+
+    # Both recordings replay to the score they were saved with
+    for name in ("host.sirec", "join.sirec"):
+        recording = si.Recording.load(tmp_path / name)
+        game = si.Game(headless=True, seed=recording.seed, coop=True)
+        for frame in range(len(recording)):
+            game.step(recording.frame_input(frame), recording.partner_input(frame))
+        assert len(recording) == FRAMES
+        assert game.score == recording.score
@@ -0,0 +1,42 @@
+"""Unit tests for the structure-of-arrays particle system
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import numpy as np
+
+import space_invaders as si
+
+def test_particles_compact_by_shifting_when_the_oldest_die():
+    particles = si.ParticleSystem()
+    rng = np.random.default_rng(0)
+    particles.spawn(100, 100, 10, rng)
+    for _ in range(5):
+        particles.update()
+    particles.spawn(200, 200, 20, rng)
+    newest = particles.vx[10:30].copy()
+    for _ in range(si.PARTICLE_LIFETIME - 5):
+        particles.update()
+    # The first burst has expired; the second moved to the front in order
+    assert len(particles) == 20
+    np.testing.assert_array_equal(particles.vx[:20], newest)
+    np.testing.assert_array_equal(particles.lifetime[:20], 5)
+
+def test_particles_compact_scattered_deaths_in_order():
+    particles = si.ParticleSystem()
+    particles.spawn(0, 0, 8, np.random.default_rng(0))
+    particles.x[:8] = np.arange(8)
+    particles.vx[:8] = 0
+    particles.lifetime[:8] = [1, 5, 1, 5, 5, 1, 5, 1]
+    particles.update()
+    assert len(particles) == 4
+    np.testing.assert_array_equal(particles.x[:4], [1, 3, 4, 6])
+
+def test_particles_stop_at_capacity():
+    particles = si.ParticleSystem(capacity=100)
+    rng = np.random.default_rng(0)
+    for _ in range(7):
+        particles.spawn(0, 0, 30, rng)
+    assert len(particles) == 100
+    assert particles.slots == 100
@@ -0,0 +1,112 @@
+"""Unit tests for the SQLite high-score store and its batched writer
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import sqlite3
+import time
+
+import numpy as np
+
+import scores
+import space_invaders as si
+
+def game_row(player="ann", score=100, started=0.0, finished=True, shots=10, hits=4):
+    return dict(player=player, started=started, seed="1", coop=0, finished=int(finished), won=0, score=score,
+                frames=600, shots=shots, hits=hits, lives_lost=3, frame_p50_ms=1.0, frame_p99_ms=2.0)
+
+def traced(store):
+    """Record every SQL statement the store's writer runs"""
+    statements = []
+    connect = store.connect
+    def connect_traced():
+        db = connect()
+        db.set_trace_callback(statements.append)
+        return db
+    store.connect = connect_traced
+    return statements
+
+def test_rows_queued_together_commit_in_one_transaction(tmp_path):
+    store = si.ScoreStore(str(tmp_path / "scores.db"))
+    statements = traced(store)
+    for i in range(5):
+        store.record(game_row(score=i))
+    store.close()
+    assert store.error is None
+    assert sum(sql.startswith("BEGIN") for sql in statements) == 1
+    assert len(store.top_scores()) == 5
+
+def test_rows_further_apart_than_the_batch_window_commit_separately(tmp_path, monkeypatch):
+    monkeypatch.setattr(si, "SCORE_BATCH_SECONDS", 0.05)
+    store = si.ScoreStore(str(tmp_path / "scores.db"))
+    statements = traced(store)
+    store.record(game_row(score=1))
+    time.sleep(0.3)
+    store.record(game_row(score=2))
+    store.close()
+    assert sum(sql.startswith("BEGIN") for sql in statements) == 2
+
+def test_top_scores_rank_finished_games_only(tmp_path):
+    store = si.ScoreStore(str(tmp_path / "scores.db"))
+    store.record(game_row(score=50, started=1.0))
+    store.record(game_row(score=900, started=2.0, finished=False))
+    store.record(game_row(score=300, started=3.0))
+    store.record(game_row(score=50, started=0.5))
+    store.close()
+    top = store.top_scores()
+    assert [(row["score"], row["started"]) for row in top] == [(300, 3.0), (50, 0.5), (50, 1.0)]
+    assert [row["score"] for row in store.top_scores(limit=1)] == [300]
+
+def test_history_lists_a_players_games_newest_first(tmp_path):
+    store = si.ScoreStore(str(tmp_path / "scores.db"))
+    store.record(game_row(player="ann", started=1.0, shots=8, hits=2))
+    store.record(game_row(player="bob", started=2.0))
+    store.record(game_row(player="ann", started=3.0, finished=False, shots=0, hits=0))
+    store.close()
+    history = store.history("ann")
+    assert [row["started"] for row in history] == [3.0, 1.0]
+    # The hit ratio is worked out in SQL, and is NULL rather than a division by zero
+    assert [row["hit_ratio"] for row in history] == [None, 0.25]
+
+def test_an_unwritable_database_keeps_the_error(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    store = si.ScoreStore(str(blocker / "scores.db"))
+    store.record(game_row())
+    store.close()
+    assert store.error is not None
+
+def test_queries_leave_the_database_as_they_found_it(tmp_path):
+    path = tmp_path / "scores.db"
+    db = sqlite3.connect(path)
+    db.executescript(si.ScoreStore.SCHEMA)
+    with db:
+        db.execute(si.ScoreStore.INSERT, game_row())
+    db.close()
+    store = si.ScoreStore(str(path))
+    assert len(store.top_scores()) == 1
+    db = sqlite3.connect(path)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    db.close()
+
+def test_viewing_a_missing_database_creates_nothing(tmp_path, capsys):
+    path = tmp_path / "new" / "scores.db"
+    assert si.ScoreStore(str(path)).top_scores() == []
+    assert scores.main(["--db", str(path)]) == 0
+    assert capsys.readouterr().out == "No games yet\n"
+    assert not (tmp_path / "new").exists()
+
+def test_frame_time_histogram_percentiles_are_within_a_bin():
+    frame_ms = np.random.default_rng(0).gamma(4.0, 2.0, size=5000)
+    histogram = si.FrameTimeHistogram()
+    for ms in frame_ms.tolist():
+        histogram.add(ms / 1000.0)
+    assert len(histogram) == len(frame_ms)
+    expected = np.percentile(frame_ms, (50, 99))
+    assert np.abs(histogram.percentiles((50, 99)) - expected).max() <= si.FRAME_HISTOGRAM_BIN_MS
+
+    histogram.clear()
+    histogram.add(10.0)
+    assert len(histogram) == 1
+    assert histogram.percentiles((50,))[0] > si.FRAME_HISTOGRAM_MAX_MS - si.FRAME_HISTOGRAM_BIN_MS
@@ -0,0 +1,85 @@
+"""Unit tests for the destructible shields and their bitmask erosion
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import numpy as np
+
+import space_invaders as si
+
+def fire(shields, pool, x, y, count=1):
+    """Spawn `count` bullets at (x, y), move them one tick and let the shields take their hits"""
+    for _ in range(count):
+        pool.spawn(x, y)
+    pool.update()
+    shields.hit(pool)
+
+def test_player_bullet_erodes_the_lowest_solid_row_it_swept():
+    shields = si.Shields()
+    pool = si.BulletPool(si.BULLET_SPEED, True)
+    # Up the left leg, which is solid from top to bottom
+    fire(shields, pool, shields.xs[0] + 2, shields.y + shields.height + 2)
+    assert len(pool) == 0
+    bottom = shields.height - 1
+    assert not shields.solid[0, bottom - si.SHIELD_CRATER_RADIUS:, 4].any()
+    assert shields.solid[0, bottom - si.SHIELD_CRATER_RADIUS - 1, 4]
+    assert (shields.solid[1:] == si.shield_shape(shields.width, shields.height)).all()
+
+def test_enemy_bullet_erodes_the_highest_solid_row_it_swept():
+    shields = si.Shields()
+    pool = si.BulletPool(-si.ENEMY_BULLET_SPEED, False)
+    centre = shields.width // 2
+    fire(shields, pool, shields.xs[2] + centre - si.BULLET_WIDTH // 2, shields.y - si.BULLET_HEIGHT)
+    assert len(pool) == 0
+    assert not shields.solid[2, :si.SHIELD_CRATER_RADIUS + 1, centre].any()
+    assert shields.solid[2, si.SHIELD_CRATER_RADIUS + 1, centre]
+
+def test_earlier_bullets_erode_before_later_ones_strike():
+    one, two = si.Shields(), si.Shields()
+    x, y = one.xs[0] + 2, one.y + one.height + 2
+    fire(one, si.BulletPool(si.BULLET_SPEED, True), x, y)
+    pool = si.BulletPool(si.BULLET_SPEED, True)
+    fire(two, pool, x, y, count=2)
+    # The first crater leaves the edge of its top row solid, so the second bullet strikes there
+    r = si.SHIELD_CRATER_RADIUS
+    second_row = one.height - 1 - r
+    assert len(pool) == 0
+    assert np.count_nonzero(two.solid) < np.count_nonzero(one.solid)
+    assert one.solid[0, second_row - r, 4] and not two.solid[0, second_row - r, 4]
+
+def test_bullets_between_shields_pass_through():
+    shields = si.Shields()
+    pool = si.BulletPool(si.BULLET_SPEED, True)
+    for _ in range(20):
+        fire(shields, pool, shields.xs[0] - 20, shields.y + shields.height + 2)
+    assert len(pool) == 20
+    assert (shields.solid == si.shield_shape(shields.width, shields.height)).all()
+
+def test_repeated_fire_tunnels_through():
+    shields = si.Shields()
+    pool = si.BulletPool(si.BULLET_SPEED, True)
+    x = shields.xs[3] + 2
+    for _ in range(200):
+        fire(shields, pool, x, shields.y + shields.height + 2)
+    # Once the column is cleared, bullets fly on above the shield
+    assert min(y for _, y in pool.positions()) < shields.y
+    assert not shields.solid[3, :, 2:2 + si.BULLET_WIDTH].any()
+
+def test_crush_clears_the_pixels_under_each_rect():
+    shields = si.Shields()
+    intact = shields.solid.copy()
+    shields.crush(np.array([shields.xs[1] - 10]), np.array([shields.y - 5]), si.ENEMY_WIDTH, si.ENEMY_HEIGHT)
+    crushed_cols = si.ENEMY_WIDTH - 10
+    crushed_rows = si.ENEMY_HEIGHT - 5
+    assert not shields.solid[1, :crushed_rows, :crushed_cols].any()
+    assert (shields.solid[1, crushed_rows:] == intact[1, crushed_rows:]).all()
+    assert (shields.solid[1, :, crushed_cols:] == intact[1, :, crushed_cols:]).all()
+    assert (shields.solid[[0, 2, 3]] == intact[[0, 2, 3]]).all()
+
+def test_eroded_shields_round_trip_through_pack():
+    shields = si.Shields()
+    fire(shields, si.BulletPool(si.BULLET_SPEED, True), shields.xs[0] + 30, shields.y + shields.height + 2)
+    restored = si.Shields()
+    assert restored.unpack(shields.pack(), 0) == len(shields.pack())
+    assert (restored.solid == shields.solid).all()
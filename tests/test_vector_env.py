@@ -0,0 +1,84 @@
+"""Checks that the batched games in vector_env play exactly like Game
+
+Run from the repository root:
+
+    python -m pytest -q
+"""
+import numpy as np
+import pytest
+
+import space_invaders as si
+import vector_env as ve
+
+SEED = 20240601
+NUM_ENVS = 6
+TICKS = 600
+
+def game_state(game):
+    return (game.player.x, game.score, game.lives, game.game_over, game.won,
+            game.enemies.origin_x, game.enemies.origin_y, game.enemy_direction, game.enemies.alive.tolist(),
+            game.bullets.positions(), game.enemy_bullets.positions(), game.shields.solid.tolist())
+
+def batched_state(games, i):
+    def positions(pool):
+        slots = np.flatnonzero(pool.live[i])
+        slots = slots[np.argsort(pool.serial[i, slots])]
+        return list(zip(pool.x[i, slots].tolist(), pool.y[i, slots].tolist()))
+    return (int(games.player_x[i]), int(games.score[i]), int(games.lives[i]), bool(games.game_over[i]),
+            bool(games.won[i]), int(games.origin_x[i]), int(games.origin_y[i]), int(games.direction[i]),
+            games.alive[i].tolist(), positions(games.bullets), positions(games.enemy_bullets),
+            games.solid[i].tolist())
+
+# Rules changed per case to reach lost lives, crushed shields and cleared waves within the test
+@pytest.mark.parametrize("rules", [{}, {"ENEMY_SHOOT_CHANCE": 0.01}, {"ENEMY_DROP": 60, "ENEMY_SPEED": 4},
+                                   {"ENEMY_ROWS": 2, "ENEMY_COLS": 3}])
+def test_batched_games_match_game(rules, monkeypatch):
+    for name, value in rules.items():
+        monkeypatch.setattr(si, name, value)
+    rng = np.random.default_rng(0)
+    games = ve.BatchedGames([SEED + i for i in range(NUM_ENVS)])
+    references = [si.Game(headless=True, seed=SEED + i) for i in range(NUM_ENVS)]
+    for tick in range(TICKS):
+        actions = rng.integers(len(ve.ACTIONS), size=NUM_ENVS)
+        active = ~games.game_over
+        for game, action in zip(references, actions.tolist()):
+            game.step(si.PACKED_INPUTS[ve.ACTIONS[action]])
+        bits = np.array(ve.ACTIONS)[actions]
+        games.tick(bits & si.INPUT_LEFT != 0, bits & si.INPUT_RIGHT != 0, bits & si.INPUT_FIRE != 0, active)
+        for i, game in enumerate(references):
+            assert batched_state(games, i) == game_state(game), f"game {i} differs at tick {tick}"
+        # Start finished games over, as VectorEnv does
+        done = games.game_over.copy()
+        games.reset(done)
+        for i in np.flatnonzero(done).tolist():
+            references[i].reset_game()
+
+@pytest.mark.parametrize("observation", ["features", "pixels"])
+def test_vector_env_rewards_and_resets_match_game(observation, monkeypatch):
+    monkeypatch.setattr(si, "ENEMY_SHOOT_CHANCE", 0.01)
+    env = ve.VectorEnv(NUM_ENVS, observation=observation, frame_skip=3, max_steps=150, seed=SEED)
+    obs, info = env.reset(seed=SEED)
+    assert obs.shape == (NUM_ENVS,) + env.single_observation_shape
+    references = [si.Game(headless=True, seed=SEED + i) for i in range(NUM_ENVS)]
+    steps = np.zeros(NUM_ENVS, dtype=int)
+    finished = 0
+    for _ in range(TICKS // 3):
+        actions = env.sample_actions()
+        obs, rewards, terminated, truncated, info = env.step(actions)
+        assert obs.shape == (NUM_ENVS,) + env.single_observation_shape
+        for i, (game, action) in enumerate(zip(references, actions.tolist())):
+            score = game.score
+            for _ in range(3):
+                game.step(si.PACKED_INPUTS[ve.ACTIONS[action]])
+                if game.game_over:
+                    break
+            steps[i] += 1
+            assert rewards[i] == game.score - score
+            assert terminated[i] == game.game_over
+            assert truncated[i] == (not game.game_over and steps[i] >= 150)
+            assert (info["score"][i], info["lives"][i], info["won"][i]) == (game.score, game.lives, game.won)
+            if terminated[i] or truncated[i]:
+                game.reset_game()
+                steps[i] = 0
+                finished += 1
+    assert finished
@@ -0,0 +1,568 @@
+"""Gym-style vectorized environment over batched Space Invaders games
+
+VectorEnv steps N single-player games in lockstep from an array of
+discrete actions and returns batched NumPy observations, rewards and done
+flags:
+
+    from vector_env import VectorEnv
+
+    env = VectorEnv(num_envs=16, observation="features")
+    obs, info = env.reset(seed=0)
+    for _ in range(1000):
+        actions = env.sample_actions()
+        obs, rewards, terminated, truncated, info = env.step(actions)
+
+The games are not Game objects. BatchedGames keeps the gameplay state of
+all of them in arrays with a leading environment axis and advances every
+game with one pass of array operations per tick, so a tick costs about the
+same for 8 games as for 256. It plays by Game.update's rules: given the
+same seed and inputs, a game here reaches the same score, lives, positions,
+bullets and shields as Game.step would, which tests/test_vector_env.py
+checks. Particles, stars and animation phases never affect play and are
+not simulated.
+"""
+import numpy as np
+
+import space_invaders as si
+
+# Discrete actions as recording input bits
+ACTIONS = (0, si.INPUT_LEFT, si.INPUT_RIGHT, si.INPUT_FIRE,
+           si.INPUT_LEFT | si.INPUT_FIRE, si.INPUT_RIGHT | si.INPUT_FIRE)
+ACTION_MEANINGS = ("noop", "left", "right", "fire", "left_fire", "right_fire")
+
+PIXEL_SCALE = 8  # Screen pixels per observation cell in pixel observations
+NEAREST_BULLETS = 8  # Enemy bullets included in feature observations
+DEFAULT_MAX_STEPS = 18000  # Five minutes of play at 60 ticks per second
+BATCH_BULLET_CAPACITY = 64  # Initial bullet slots per game in each batched pool
+
+def rasterize(grids, index, xs, ys, widths, heights, scale):
+    """Set every cell of grids[index] that the matching (xs, ys, widths, heights) box overlaps
+
+    Boxes for all the stacked grids are filled together. No box spans more
+    than a few cells, so cells are set one offset within the boxes at a time.
+    """
+    count, rows, cols = grids.shape
+    x0 = np.clip(xs // scale, 0, cols)
+    y0 = np.clip(ys // scale, 0, rows)
+    x1 = np.clip((xs + widths - 1) // scale + 1, 0, cols)
+    y1 = np.clip((ys + heights - 1) // scale + 1, 0, rows)
+    grids[:] = 0
+    for dy in range(int((y1 - y0).max(initial=0))):
+        for dx in range(int((x1 - x0).max(initial=0))):
+            inside = (y0 + dy < y1) & (x0 + dx < x1)
+            grids[index[inside], y0[inside] + dy, x0[inside] + dx] = 255
+
+def rounds(env):
+    """Yield index arrays that take the entries of a sorted `env` array one per environment at a time
+
+    Round r holds each environment's r-th entry. Rules that Game applies
+    bullet by bullet, oldest first, run as one array pass per round.
+    """
+    if not len(env):
+        return
+    rank = np.arange(len(env)) - np.searchsorted(env, env)
+    for r in range(int(rank.max()) + 1):
+        yield np.flatnonzero(rank == r)
+
+class BatchedBullets:
+    """One kind of bullet for every game, as (num_envs, capacity) arrays
+
+    Unlike BulletPool, slots are not compacted: `live` flags the slots in
+    use and spawns fill the lowest free ones. Spawn serials order bullets
+    within a game just as they do in BulletPool.
+    """
+    def __init__(self, num_envs, speed, capacity=BATCH_BULLET_CAPACITY):
+        self.num_envs = num_envs
+        self.speed = speed
+        self.next_serial = np.zeros(num_envs, dtype=np.int64)
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        old = getattr(self, "x", None)
+        arrays = {
+            "x": np.zeros((self.num_envs, capacity), dtype=np.int64),
+            "y": np.zeros((self.num_envs, capacity), dtype=np.int64),
+            "serial": np.zeros((self.num_envs, capacity), dtype=np.int64),
+            "live": np.zeros((self.num_envs, capacity), dtype=bool),
+        }
+        for name, arr in arrays.items():
+            if old is not None:
+                arr[:, :self.capacity] = getattr(self, name)
+            setattr(self, name, arr)
+        self.capacity = capacity
+
+    def counts(self):
+        return np.count_nonzero(self.live, axis=1)
+
+    def clear(self, envs):
+        self.live[envs] = False
+
+    def spawn(self, env, xs, ys):
+        """Add bullets to the games in `env`, which is sorted so each game's bullets are in spawn order"""
+        if not len(env):
+            return
+        need = np.bincount(env, minlength=self.num_envs)
+        shortfall = int((need - (self.capacity - self.counts())).max())
+        if shortfall > 0:
+            self.allocate(max(2 * self.capacity, self.capacity + shortfall))
+        free = ~self.live
+        # nonzero walks each game's free slots in order, so they pair up with its bullets in order
+        target_env, target_slot = np.nonzero(free & (np.cumsum(free, axis=1) <= need[:, np.newaxis]))
+        rank = np.arange(len(env)) - np.searchsorted(env, env)
+        self.x[target_env, target_slot] = xs
+        self.y[target_env, target_slot] = ys
+        self.serial[target_env, target_slot] = self.next_serial[env] + rank
+        self.live[target_env, target_slot] = True
+        self.next_serial += need
+
+    def update(self, active):
+        """Move the bullets of the active games and cull those that left the screen"""
+        moving = self.live & active[:, np.newaxis]
+        np.subtract(self.y, self.speed, out=self.y, where=moving)
+        self.live &= ~(moving & ((self.y < 0) | (self.y > si.SCREEN_HEIGHT)))
+
+    def overlapping(self, xs, ys, width, height):
+        """Return a bool mask of the live bullets overlapping each game's rect at (xs, ys)"""
+        x = xs[:, np.newaxis]
+        y = ys[:, np.newaxis]
+        return (self.live & (self.x < x + width) & (x < self.x + si.BULLET_WIDTH) &
+                (self.y < y + height) & (y < self.y + si.BULLET_HEIGHT))
+
+    def in_spawn_order(self, mask):
+        """Return the (env, slot) pairs flagged in `mask`, by game and oldest bullet first"""
+        env, slot = np.nonzero(mask)
+        order = np.lexsort((self.serial[env, slot], env))
+        return env[order], slot[order]
+
+class BatchedGames:
+    """The gameplay state of N single-player games, stepped together
+
+    Every field of Game that affects play is an array here with one entry
+    (or row) per game. Each tick applies Game.update's stages to all the
+    games at once. The stages Game resolves bullet by bullet, where an
+    earlier bullet's hit changes what a later one meets, run in rounds of
+    one bullet per game, after first dropping bullets that cannot hit
+    anything. Each game keeps its own gameplay rng, seeded like Game's, so
+    enemy fire matches too.
+
+    The constants are read when the batch is built, so a batch.py-style
+    sweep that sets them beforehand applies here as well.
+    """
+    def __init__(self, seeds):
+        n = self.num_envs = len(seeds)
+        self.rngs = [np.random.default_rng(np.random.SeedSequence(seed).spawn(2)[0]) for seed in seeds]
+        self.rows, self.cols = si.ENEMY_ROWS, si.ENEMY_COLS
+        self.spacing = si.ENEMY_SPACING
+        self.enemy_width, self.enemy_height = si.ENEMY_WIDTH, si.ENEMY_HEIGHT
+        self.player_width, self.player_height = si.PLAYER_WIDTH, si.PLAYER_HEIGHT
+        self.player_y = si.SCREEN_HEIGHT - si.PLAYER_HEIGHT - 20  # As Game.reset_game places the ship
+        self.shoot_chance = si.ENEMY_SHOOT_CHANCE
+        layout = si.Shields()
+        self.shield_xs = layout.xs
+        self.shield_y = layout.y
+        self.shield_width, self.shield_height = layout.width, layout.height
+        self.intact_shields = layout.solid
+        self.crater = layout.crater
+
+        self.player_x = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lives = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.won = np.zeros(n, dtype=bool)
+        self.alive = np.zeros((n, self.rows, self.cols), dtype=bool)
+        self.enemy_count = np.zeros(n, dtype=np.int64)
+        self.origin_x = np.zeros(n, dtype=np.int64)
+        self.origin_y = np.zeros(n, dtype=np.int64)
+        self.direction = np.zeros(n, dtype=np.int64)
+        self.solid = np.zeros((n,) + self.intact_shields.shape, dtype=bool)
+        self.bullets = BatchedBullets(n, si.BULLET_SPEED)
+        self.enemy_bullets = BatchedBullets(n, -si.ENEMY_BULLET_SPEED)
+        self.reset(np.ones(n, dtype=bool))
+
+    def reset(self, envs):
+        """Start new games in the environments flagged in `envs`, as Game.reset_game does
+
+        Like reset_game this leaves the gameplay rngs running rather than
+        reseeding them.
+        """
+        self.player_x[envs] = si.SCREEN_WIDTH // 2 - self.player_width // 2
+        self.score[envs] = 0
+        self.lives[envs] = 3
+        self.game_over[envs] = False
+        self.won[envs] = False
+        self.alive[envs] = True
+        self.enemy_count[envs] = self.rows * self.cols
+        self.origin_x[envs] = (si.SCREEN_WIDTH - self.cols * self.spacing) // 2
+        self.origin_y[envs] = 50
+        self.direction[envs] = 1
+        self.solid[envs] = self.intact_shields
+        self.bullets.clear(envs)
+        self.enemy_bullets.clear(envs)
+
+    def tick(self, left, right, fire, active):
+        """Advance the games flagged in `active` by one tick with per-game bool inputs"""
+        # Game.step fires before updating
+        shooters = np.flatnonzero(fire & active)
+        self.bullets.spawn(shooters, self.player_x[shooters] + self.player_width // 2 - si.BULLET_WIDTH // 2,
+                           self.player_y)
+
+        speed = si.PLAYER_SPEED
+        moving = left & active & (self.player_x > 0)
+        self.player_x[moving] -= speed
+        moving = right & active & (self.player_x < si.SCREEN_WIDTH - self.player_width)
+        self.player_x[moving] += speed
+
+        self.bullets.update(active)
+        self.enemy_bullets.update(active)
+        self.hit_shields(self.bullets, active)
+        self.hit_shields(self.enemy_bullets, active)
+        self.crush_shields(active)
+        self.hit_enemies(active)
+        self.hit_players(active)
+        self.update_enemies(active)
+
+        cleared = active & (self.enemy_count == 0)
+        self.game_over |= cleared
+        self.won |= cleared
+
+    def occupied_span(self, axis):
+        """Return the first and last row (axis=2) or column (axis=1) of each game holding a living enemy"""
+        occupied = self.alive.any(axis=axis)
+        size = occupied.shape[1]
+        return occupied.argmax(axis=1), size - 1 - occupied[:, ::-1].argmax(axis=1)
+
+    def bottom(self):
+        """Return the y of each game's lowest living enemy's bottom edge; meaningless without enemies"""
+        _, last = self.occupied_span(2)
+        return self.origin_y + last * self.spacing + self.enemy_height
+
+    def shield_hits(self, env, x, tops, bottoms, upwards):
+        """Find where bullets that swept (x, tops)-(x, bottoms) strike the shields of their games
+
+        Returns (shield, x, row) per bullet as arrays, shield -1 for a miss,
+        choosing the row and crater centre as Shields.hit does.
+        """
+        count = len(env)
+        hit_shield = np.full(count, -1)
+        hit_x = np.zeros(count, dtype=np.int64)
+        hit_row = np.zeros(count, dtype=np.int64)
+        height = self.shield_height
+        y0 = np.maximum(tops - self.shield_y, 0)
+        y1 = np.minimum(bottoms - self.shield_y, height)
+        in_rows = (np.arange(height) >= y0[:, np.newaxis]) & (np.arange(height) < y1[:, np.newaxis])
+        columns = np.arange(si.BULLET_WIDTH)
+        for shield, sx in enumerate(self.shield_xs):
+            x0 = np.maximum(x - sx, 0)
+            x1 = np.minimum(x + si.BULLET_WIDTH - sx, self.shield_width)
+            # Shields are tried in order; the first with solid pixels in the swept rect takes the hit
+            bullets = np.flatnonzero((x0 < x1) & (y0 < y1) & (hit_shield < 0))
+            if not len(bullets):
+                continue
+            x0, x1 = x0[bullets], x1[bullets]
+            cols = x0[:, np.newaxis] + columns
+            inside = cols < x1[:, np.newaxis]
+            pixels = self.solid[env[bullets, np.newaxis], shield, :, np.minimum(cols, self.shield_width - 1)]
+            solid_rows = (pixels & inside[:, :, np.newaxis]).any(axis=1) & in_rows[bullets]
+            struck = solid_rows.any(axis=1)
+            if not struck.any():
+                continue
+            solid_rows = solid_rows[struck]
+            # Player bullets travel up and strike the lowest solid row first; enemy bullets the highest
+            if upwards:
+                rows = height - 1 - solid_rows[:, ::-1].argmax(axis=1)
+            else:
+                rows = solid_rows.argmax(axis=1)
+            bullets = bullets[struck]
+            hit_shield[bullets] = shield
+            hit_x[bullets] = ((x0 + x1) // 2)[struck]
+            hit_row[bullets] = rows
+        return hit_shield, hit_x, hit_row
+
+    def erode(self, env, shield, x, y):
+        """Clear a crater centred on pixel (x, y) of one game's shield, as Shields.erode does"""
+        r = self.crater.shape[0] // 2
+        x0, y0 = max(x - r, 0), max(y - r, 0)
+        x1, y1 = min(x + r + 1, self.shield_width), min(y + r + 1, self.shield_height)
+        crater = self.crater[y0 - y + r:y1 - y + r, x0 - x + r:x1 - x + r]
+        self.solid[env, shield, y0:y1, x0:x1] &= ~crater
+
+    def hit_shields(self, pool, active):
+        """Erode the shields wherever bullets from `pool` struck them this tick, and remove those bullets"""
+        if not self.shield_xs:
+            return
+        # The rows each bullet swept through this tick, from its previous position to its current one
+        tops = np.minimum(pool.y, pool.y + pool.speed)
+        bottoms = np.maximum(pool.y, pool.y + pool.speed) + si.BULLET_HEIGHT
+        near = (pool.live & active[:, np.newaxis] &
+                (tops < self.shield_y + self.shield_height) & (bottoms > self.shield_y))
+        if not near.any():
+            return
+        env, slot = pool.in_spawn_order(near)
+        x, tops, bottoms = pool.x[env, slot], tops[env, slot], bottoms[env, slot]
+        upwards = pool.speed > 0
+        # Erosion only removes pixels, so a bullet that misses now misses after earlier bullets erode too
+        could_hit = self.shield_hits(env, x, tops, bottoms, upwards)[0] >= 0
+        env, slot, x, tops, bottoms = env[could_hit], slot[could_hit], x[could_hit], tops[could_hit], bottoms[could_hit]
+        for batch in rounds(env):
+            shield, hit_x, hit_row = self.shield_hits(env[batch], x[batch], tops[batch], bottoms[batch], upwards)
+            struck = shield >= 0
+            for args in zip(env[batch][struck].tolist(), shield[struck].tolist(),
+                            hit_x[struck].tolist(), hit_row[struck].tolist()):
+                self.erode(*args)
+            pool.live[env[batch][struck], slot[batch][struck]] = False
+
+    def crush_shields(self, active):
+        """Clear every shield pixel under enemies that have reached the shields, as Shields.crush does"""
+        crushing = active & (self.enemy_count > 0)
+        crushing[crushing] = self.bottom()[crushing] >= self.shield_y
+        for env in np.flatnonzero(crushing).tolist():
+            rows, cols = np.nonzero(self.alive[env])
+            xs = self.origin_x[env] + cols * self.spacing
+            ys = self.origin_y[env] + rows * self.spacing
+            y0s = np.maximum(ys - self.shield_y, 0).tolist()
+            y1s = np.minimum(ys + self.enemy_height - self.shield_y, self.shield_height).tolist()
+            for shield, sx in enumerate(self.shield_xs):
+                x0s = np.maximum(xs - sx, 0).tolist()
+                x1s = np.minimum(xs + self.enemy_width - sx, self.shield_width).tolist()
+                for x0, y0, x1, y1 in zip(x0s, y0s, x1s, y1s):
+                    if x0 < x1 and y0 < y1:
+                        self.solid[env, shield, y0:y1, x0:x1] = False
+
+    def cell_span(self, start, length, size, count):
+        """Return the first and last cells whose enemies can overlap [start, start + length), per bullet"""
+        first = np.maximum(0, (start - size) // self.spacing + 1)
+        last = np.minimum(count - 1, -(-(start + length) // self.spacing) - 1)
+        return first, last
+
+    def find_hits(self, env, x, y):
+        """Return (hit, row, col) for bullets at (x, y) in games `env`
+
+        Each bullet's hit is the first living enemy in row-major order that
+        it overlaps, as EnemyFormation.find_hit picks it.
+        """
+        spacing = self.spacing
+        origin_x, origin_y = self.origin_x[env], self.origin_y[env]
+        first_col, last_col = self.cell_span(x - origin_x, si.BULLET_WIDTH, self.enemy_width, self.cols)
+        first_row, last_row = self.cell_span(y - origin_y, si.BULLET_HEIGHT, self.enemy_height, self.rows)
+        hit = np.zeros(len(env), dtype=bool)
+        hit_row = np.zeros(len(env), dtype=np.int64)
+        hit_col = np.zeros(len(env), dtype=np.int64)
+        for dy in range(int((last_row - first_row).max(initial=-1)) + 1):
+            row = first_row + dy
+            ey = origin_y + row * spacing
+            row_ok = (row <= last_row) & (y < ey + self.enemy_height) & (ey < y + si.BULLET_HEIGHT)
+            row = np.clip(row, 0, self.rows - 1)
+            for dx in range(int((last_col - first_col).max(initial=-1)) + 1):
+                col = first_col + dx
+                ex = origin_x + col * spacing
+                found = (~hit & row_ok & (col <= last_col) &
+                         (x < ex + self.enemy_width) & (ex < x + si.BULLET_WIDTH))
+                col = np.clip(col, 0, self.cols - 1)
+                found &= self.alive[env, row, col]
+                hit |= found
+                hit_row[found] = row[found]
+                hit_col[found] = col[found]
+        return hit, hit_row, hit_col
+
+    def hit_enemies(self, active):
+        """Kill the enemies player bullets reached this tick, oldest bullet first, and score them"""
+        pool = self.bullets
+        playing = active & (self.enemy_count > 0)
+        # Only bullets inside the formation's bounding box can hit anything
+        width = (self.cols - 1) * self.spacing + self.enemy_width
+        height = (self.rows - 1) * self.spacing + self.enemy_height
+        candidates = pool.overlapping(self.origin_x, self.origin_y, width, height) & playing[:, np.newaxis]
+        if not candidates.any():
+            return
+        env, slot = pool.in_spawn_order(candidates)
+        x, y = pool.x[env, slot], pool.y[env, slot]
+        # Kills only remove enemies, so a bullet that overlaps none now cannot hit one later this tick
+        could_hit = self.find_hits(env, x, y)[0]
+        env, slot, x, y = env[could_hit], slot[could_hit], x[could_hit], y[could_hit]
+        for batch in rounds(env):
+            hit, row, col = self.find_hits(env[batch], x[batch], y[batch])
+            hit_env = env[batch][hit]
+            # One bullet per game per round, so no game is killed from twice here
+            self.alive[hit_env, row[hit], col[hit]] = False
+            self.enemy_count[hit_env] -= 1
+            self.score[hit_env] += 10
+            pool.live[hit_env, slot[batch][hit]] = False
+
+    def hit_players(self, active):
+        """Remove enemy bullets that reached the player and take a life for each"""
+        hits = self.enemy_bullets.overlapping(self.player_x, np.full(self.num_envs, self.player_y),
+                                              self.player_width, self.player_height)
+        hits &= (active & ~self.game_over)[:, np.newaxis]
+        counts = np.count_nonzero(hits, axis=1)
+        self.enemy_bullets.live &= ~hits
+        self.lives -= counts
+        self.game_over |= (counts > 0) & (self.lives <= 0)
+
+    def update_enemies(self, active):
+        """Move, drop and fire the formations, and end the games whose enemies reached the player"""
+        populated = self.enemy_count > 0
+        first, last = self.occupied_span(1)
+        left_edge = self.origin_x + first * self.spacing <= 0
+        right_edge = self.origin_x + last * self.spacing >= si.SCREEN_WIDTH - self.enemy_width
+        at_edge = active & populated & np.where(self.direction < 0, left_edge, right_edge)
+        self.direction[at_edge] *= -1
+        self.origin_y[at_edge] += si.ENEMY_DROP
+        self.origin_x[active] += self.direction[active] * si.ENEMY_SPEED
+
+        # Each game rolls once per living enemy, row-major, from its own rng
+        rolling = np.flatnonzero(active)
+        env, rows, cols = np.nonzero(self.alive & active[:, np.newaxis, np.newaxis])
+        if len(rolling):
+            rolls = np.concatenate([self.rngs[i].random(n) for i, n in
+                                    zip(rolling.tolist(), self.enemy_count[rolling].tolist())])
+            fire = rolls < self.shoot_chance
+            env, rows, cols = env[fire], rows[fire], cols[fire]
+            self.enemy_bullets.spawn(
+                env, self.origin_x[env] + cols * self.spacing + self.enemy_width // 2 - si.BULLET_WIDTH // 2,
+                self.origin_y[env] + rows * self.spacing + self.enemy_height)
+
+        self.game_over |= active & populated & (self.bottom() >= self.player_y)
+
+class VectorEnv:
+    """N games stepped together with batched observations
+
+    `observation` is "features" for a float32 vector per game (player,
+    formation, alive mask and the nearest enemy bullets) or "pixels" for a
+    uint8 (4, H, W) occupancy image per game, one channel each for the
+    player, enemies, enemy bullets and player bullets, at 1/PIXEL_SCALE of
+    the screen resolution. Rewards are score deltas. `frame_skip` repeats
+    each action for that many ticks and sums the rewards.
+    """
+    def __init__(self, num_envs, observation="features", frame_skip=1, max_steps=DEFAULT_MAX_STEPS, seed=None):
+        if observation not in ("features", "pixels"):
+            raise ValueError(f"unknown observation type {observation!r}; use 'features' or 'pixels'")
+        self.num_envs = num_envs
+        self.observation = observation
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.num_actions = len(ACTIONS)
+        bits = np.array(ACTIONS)
+        self.action_left = bits & si.INPUT_LEFT != 0
+        self.action_right = bits & si.INPUT_RIGHT != 0
+        self.action_fire = bits & si.INPUT_FIRE != 0
+        self.action_rng = np.random.default_rng(seed)
+        self.games = BatchedGames([None if seed is None else seed + i for i in range(num_envs)])
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+
+        if observation == "features":
+            self.single_observation_shape = (8 + si.ENEMY_ROWS * si.ENEMY_COLS + 3 * NEAREST_BULLETS,)
+            self.obs = np.zeros((num_envs,) + self.single_observation_shape, dtype=np.float32)
+        else:
+            self.single_observation_shape = (4, -(-si.SCREEN_HEIGHT // PIXEL_SCALE), -(-si.SCREEN_WIDTH // PIXEL_SCALE))
+            self.obs = np.zeros((num_envs,) + self.single_observation_shape, dtype=np.uint8)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.terminated = np.zeros(num_envs, dtype=bool)
+        self.truncated = np.zeros(num_envs, dtype=bool)
+
+    def reset(self, seed=None):
+        """Start a new game in every environment and return (observations, info)"""
+        if seed is not None:
+            self.games = BatchedGames([seed + i for i in range(self.num_envs)])
+            self.action_rng = np.random.default_rng(seed)
+        else:
+            self.games.reset(np.ones(self.num_envs, dtype=bool))
+        self.steps[:] = 0
+        self.observe()
+        return self.obs.copy(), self.info()
+
+    def sample_actions(self):
+        return self.action_rng.integers(self.num_actions, size=self.num_envs)
+
+    def step(self, actions):
+        """Apply one action per environment
+
+        Returns (observations, rewards, terminated, truncated, info). Games
+        that finish are reset straight away, so their observation is the
+        first of the next game; info holds the finished game's final score,
+        lives and result for environments that are done.
+        """
+        games = self.games
+        actions = np.asarray(actions)
+        left, right, fire = self.action_left[actions], self.action_right[actions], self.action_fire[actions]
+        score = games.score.copy()
+        for _ in range(self.frame_skip):
+            active = ~games.game_over
+            if not active.any():
+                break
+            games.tick(left, right, fire, active)
+        self.rewards[:] = games.score - score
+        self.steps += 1
+        self.terminated[:] = games.game_over
+        self.truncated[:] = ~games.game_over & (self.steps >= self.max_steps)
+        # Report the finished games' results before resetting them
+        info = self.info()
+        done = self.terminated | self.truncated
+        if done.any():
+            games.reset(done)
+            self.steps[done] = 0
+        self.observe()
+        return self.obs.copy(), self.rewards.copy(), self.terminated.copy(), self.truncated.copy(), info
+
+    def info(self):
+        return {
+            "score": self.games.score.copy(),
+            "lives": self.games.lives.copy(),
+            "won": self.games.won.copy(),
+        }
+
+    def observe(self):
+        if self.observation == "features":
+            self.observe_features()
+        else:
+            self.observe_pixels()
+
+    def observe_features(self):
+        """Fill every game's observation with positions scaled to roughly [-1, 1] and the alive mask"""
+        games = self.games
+        obs = self.obs
+        obs[:, 0] = games.player_x / si.SCREEN_WIDTH
+        obs[:, 1] = games.lives / 3
+        obs[:, 2] = games.origin_x / si.SCREEN_WIDTH
+        obs[:, 3] = games.origin_y / si.SCREEN_HEIGHT
+        obs[:, 4] = games.direction
+        obs[:, 5] = games.enemy_count / (games.rows * games.cols)
+        obs[:, 6] = games.bullets.counts() / 100
+        obs[:, 7] = games.enemy_bullets.counts() / 100
+        cells = games.rows * games.cols
+        obs[:, 8:8 + cells] = games.alive.reshape(self.num_envs, cells)
+
+        # Enemy bullets nearest each player, relative to its centre
+        bullets = obs[:, 8 + cells:].reshape(self.num_envs, NEAREST_BULLETS, 3)
+        bullets[:] = 0
+        pool = games.enemy_bullets
+        env, slot = np.nonzero(pool.live)
+        if not len(env):
+            return
+        dx = (pool.x[env, slot] - (games.player_x + games.player_width // 2)[env]) / si.SCREEN_WIDTH
+        dy = (pool.y[env, slot] - games.player_y) / si.SCREEN_HEIGHT
+        # Nearest first within each game, with equal distances in spawn order
+        order = np.lexsort((pool.serial[env, slot], dx * dx + dy * dy, env))
+        rank = np.arange(len(order)) - np.searchsorted(env[order], env[order])
+        nearest = order[rank < NEAREST_BULLETS]
+        env, rank = env[nearest], rank[rank < NEAREST_BULLETS]
+        bullets[env, rank, 0] = dx[nearest]
+        bullets[env, rank, 1] = dy[nearest]
+        bullets[env, rank, 2] = 1
+
+    def observe_pixels(self):
+        """Rasterize every game's player, enemies and bullets in one pass"""
+        games = self.games
+        n = self.num_envs
+        enemy_env, rows, cols = np.nonzero(games.alive)
+        boxes = [(np.arange(n), games.player_x, np.full(n, games.player_y), games.player_width, games.player_height),
+                 (enemy_env, games.origin_x[enemy_env] + cols * games.spacing,
+                  games.origin_y[enemy_env] + rows * games.spacing, games.enemy_width, games.enemy_height)]
+        for pool in (games.enemy_bullets, games.bullets):
+            env, slot = np.nonzero(pool.live)
+            boxes.append((env, pool.x[env, slot], pool.y[env, slot], si.BULLET_WIDTH, si.BULLET_HEIGHT))
+        counts = [len(env) for env, *_ in boxes]
+        rasterize(self.obs.reshape(-1, *self.single_observation_shape[1:]),
+                  np.concatenate([4 * env + channel for channel, (env, *_) in enumerate(boxes)]),
+                  np.concatenate([xs for _, xs, _, _, _ in boxes]), np.concatenate([ys for _, _, ys, _, _ in boxes]),
+                  np.repeat([width for *_, width, _ in boxes], counts),
+                  np.repeat([height for *_, height in boxes], counts), PIXEL_SCALE)